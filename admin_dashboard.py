@@ -4,16 +4,19 @@ No JavaScript frameworks - just HTML/CSS with server-side rendering
 """
 
 import os
+import asyncio
+import csv
+import io
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 import hashlib
+import hmac
 import secrets
-from urllib.parse import parse_qs
+import tempfile
+import time
 
 from aiohttp import web
-from aiohttp_session import setup, get_session
-from aiohttp_session.cookie_storage import EncryptedCookieStorage
 import aiohttp_jinja2
 import jinja2
 
@@ -23,45 +26,30 @@ logger = logging.getLogger(__name__)
 
 # Admin configuration
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")  # Change in production!
+_ADMIN_PASSWORD_HASH = hashlib.sha256(ADMIN_PASSWORD.encode()).digest()
 SESSION_SECRET_KEY = os.getenv("SESSION_KEY", secrets.token_bytes(32))
+if isinstance(SESSION_SECRET_KEY, str):
+    SESSION_SECRET_KEY = SESSION_SECRET_KEY.encode()
 
-class AdminDashboard:
-    """Simple admin dashboard for subscription management"""
-    
-    def __init__(self, db_client: SupabaseClient, bot=None):
-        self.db = db_client
-        self.bot = bot
-        self.app = web.Application()
-        self.setup_app()
-        
-    def setup_app(self):
-        """Configure the web application"""
-        # Setup sessions
-        setup(self.app, EncryptedCookieStorage(SESSION_SECRET_KEY))
-        
-        # Setup Jinja2 templates
-        aiohttp_jinja2.setup(
-            self.app,
-            loader=jinja2.DictLoader(self.get_templates())
-        )
-        
-        # Add routes
-        self.app.router.add_get('/', self.index_handler)
-        self.app.router.add_get('/login', self.login_page)
-        self.app.router.add_post('/login', self.login_handler)
-        self.app.router.add_get('/logout', self.logout_handler)
-        self.app.router.add_get('/dashboard', self.dashboard_handler)
-        self.app.router.add_get('/users', self.users_handler)
-        self.app.router.add_post('/user/{telegram_id}/whitelist', self.whitelist_user)
-        self.app.router.add_post('/user/{telegram_id}/remove', self.remove_user)
-        self.app.router.add_post('/user/{telegram_id}/extend', self.extend_subscription)
-        self.app.router.add_get('/stats', self.stats_handler)
-        self.app.router.add_get('/export', self.export_csv_handler)
-        
-    def get_templates(self):
-        """Return template dictionary for Jinja2"""
-        return {
-            'base.html': '''<!DOCTYPE html>
+# Signed auth cookie: "<expires_at>.<hmac>" - verified without any decryption
+AUTH_COOKIE_NAME = 'admin_auth'
+AUTH_COOKIE_MAX_AGE = 12 * 60 * 60
+
+# Compiled template bytecode survives restarts here
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "jinja_cache"))
+
+# How long dashboard query results are reused between refreshes (seconds)
+DASHBOARD_CACHE_TTL = 15
+
+# Routes reachable without logging in
+PUBLIC_PATHS = frozenset({'/', '/login', '/logout'})
+
+# Rows fetched and written per chunk when streaming the CSV export
+CSV_CHUNK_SIZE = 1000
+CSV_HEADER = b"telegram_id,username,status,payment_method,next_payment_date,created_at\r\n"
+
+# Jinja2 template sources, defined once at import
+_BASE_HTML = '''<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -186,9 +174,9 @@ class AdminDashboard:
         {% block content %}{% endblock %}
     </div>
 </body>
-</html>''',
-            
-            'login.html': '''{% extends "base.html" %}
+</html>'''
+
+_LOGIN_HTML = '''{% extends "base.html" %}
 {% block title %}Login - Admin Dashboard{% endblock %}
 {% block content %}
 <div class="login-form">
@@ -206,9 +194,9 @@ class AdminDashboard:
         </form>
     </div>
 </div>
-{% endblock %}''',
-            
-            'dashboard.html': '''{% extends "base.html" %}
+{% endblock %}'''
+
+_DASHBOARD_HTML = '''{% extends "base.html" %}
 {% block title %}Dashboard - Admin{% endblock %}
 {% block content %}
 <div class="header">
@@ -255,7 +243,7 @@ class AdminDashboard:
         <tbody>
             {% for activity in recent_activities %}
             <tr>
-                <td>{{ activity.timestamp.strftime('%Y-%m-%d %H:%M') }}</td>
+                <td>{{ activity.timestamp }}</td>
                 <td>{{ activity.telegram_id }}</td>
                 <td>{{ activity.action }}</td>
                 <td>{{ activity.details or '-' }}</td>
@@ -285,7 +273,7 @@ class AdminDashboard:
             <tr>
                 <td>{{ user.telegram_id }}</td>
                 <td>{{ user.username or 'N/A' }}</td>
-                <td>{{ user.days_until_expiry() }} days</td>
+                <td>{{ user.days_left }} days</td>
                 <td>
                     <form method="post" action="/user/{{ user.telegram_id }}/extend" style="display: inline;">
                         <button class="btn btn-success">Extend 30 Days</button>
@@ -300,9 +288,9 @@ class AdminDashboard:
         </tbody>
     </table>
 </div>
-{% endblock %}''',
-            
-            'users.html': '''{% extends "base.html" %}
+{% endblock %}'''
+
+_USERS_HTML = '''{% extends "base.html" %}
 {% block title %}Users - Admin{% endblock %}
 {% block content %}
 <div class="header">
@@ -366,63 +354,153 @@ class AdminDashboard:
     </table>
 </div>
 {% endblock %}'''
-        }
+
+_TEMPLATES = {
+    'base.html': _BASE_HTML,
+    'login.html': _LOGIN_HTML,
+    'dashboard.html': _DASHBOARD_HTML,
+    'users.html': _USERS_HTML
+}
+
+def _redirect(location: str) -> web.Response:
+    """See-other redirect returned as a plain response rather than raised"""
+    return web.Response(status=303, headers={'Location': location})
+
+class AdminDashboard:
+    """Simple admin dashboard for subscription management"""
+    
+    def __init__(self, db_client: SupabaseClient, bot=None):
+        self.db = db_client
+        self.bot = bot
+        self._cache = {}
+        self.app = web.Application(middlewares=[self.auth_middleware])
+        self.setup_app()
+        
+    def setup_app(self):
+        """Configure the web application"""
+        # Setup Jinja2 templates and compile them once up front
+        try:
+            os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(JINJA_CACHE_DIR)
+        except OSError as e:
+            logger.warning(f"Jinja bytecode cache disabled: {e}")
+            bytecode_cache = None
+            
+        env = aiohttp_jinja2.setup(
+            self.app,
+            loader=jinja2.DictLoader(_TEMPLATES),
+            autoescape=jinja2.select_autoescape(['html']),
+            auto_reload=False,
+            cache_size=-1,
+            optimized=True,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            bytecode_cache=bytecode_cache
+        )
+        self._compiled = {name: env.get_template(name) for name in _TEMPLATES}
+        
+        # Add routes
+        self.app.router.add_get('/', self.index_handler)
+        self.app.router.add_get('/login', self.login_page)
+        self.app.router.add_post('/login', self.login_handler)
+        self.app.router.add_get('/logout', self.logout_handler)
+        self.app.router.add_get('/dashboard', self.dashboard_handler)
+        self.app.router.add_get('/users', self.users_handler)
+        self.app.router.add_post('/user/{telegram_id}/whitelist', self.whitelist_user)
+        self.app.router.add_post('/user/{telegram_id}/remove', self.remove_user)
+        self.app.router.add_post('/user/{telegram_id}/extend', self.extend_subscription)
+        self.app.router.add_get('/stats', self.stats_handler)
+        self.app.router.add_get('/export', self.export_csv_handler)
         
-    async def check_auth(self, request):
+    def _render(self, name, context):
+        """Render a precompiled template into an HTML response"""
+        return web.Response(
+            text=self._compiled[name].render(context),
+            content_type='text/html'
+        )
+        
+    async def _cached(self, key, ttl, func, *args, **kwargs):
+        """Return a recent result for key, or await func and cache it"""
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry and entry[0] > now:
+            return entry[1]
+        result = await func(*args, **kwargs)
+        self._cache[key] = (now + ttl, result)
+        return result
+        
+    @staticmethod
+    def _sign(expires_at: str) -> str:
+        """Sign an auth cookie expiry timestamp"""
+        return hmac.new(SESSION_SECRET_KEY, expires_at.encode(), hashlib.sha256).hexdigest()
+        
+    def check_auth(self, request):
         """Check if user is authenticated"""
-        session = await get_session(request)
-        return session.get('authenticated', False)
+        expires_at, _, signature = request.cookies.get(AUTH_COOKIE_NAME, '').partition('.')
+        if not expires_at.isdigit() or int(expires_at) < time.time():
+            return False
+        return hmac.compare_digest(signature, self._sign(expires_at))
+        
+    @web.middleware
+    async def auth_middleware(self, request, handler):
+        """Redirect unauthenticated requests for protected routes to login"""
+        if request.path in PUBLIC_PATHS:
+            return await handler(request)
+        if not self.check_auth(request):
+            return _redirect('/login')
+        request['authenticated'] = True
+        return await handler(request)
         
     async def index_handler(self, request):
         """Redirect to dashboard or login"""
-        if await self.check_auth(request):
-            raise web.HTTPFound('/dashboard')
-        raise web.HTTPFound('/login')
+        if self.check_auth(request):
+            return _redirect('/dashboard')
+        return _redirect('/login')
         
     async def login_page(self, request):
         """Show login page"""
-        return aiohttp_jinja2.render_template(
-            'login.html', request, {}
-        )
+        return self._render('login.html', {})
         
     async def login_handler(self, request):
         """Handle login form submission"""
         data = await request.post()
         password = data.get('password', '')
         
-        if password == ADMIN_PASSWORD:
-            session = await get_session(request)
-            session['authenticated'] = True
-            raise web.HTTPFound('/dashboard')
+        if hmac.compare_digest(hashlib.sha256(password.encode()).digest(), _ADMIN_PASSWORD_HASH):
+            expires_at = str(int(time.time()) + AUTH_COOKIE_MAX_AGE)
+            response = _redirect('/dashboard')
+            response.set_cookie(
+                AUTH_COOKIE_NAME,
+                f"{expires_at}.{self._sign(expires_at)}",
+                max_age=AUTH_COOKIE_MAX_AGE,
+                httponly=True,
+                secure=True,
+                samesite='Lax'
+            )
+            return response
         
-        return aiohttp_jinja2.render_template(
-            'login.html', request, {'error': 'Invalid password'}
-        )
+        return self._render('login.html', {'error': 'Invalid password'})
         
     async def logout_handler(self, request):
         """Logout user"""
-        session = await get_session(request)
-        session.clear()
-        raise web.HTTPFound('/login')
+        response = _redirect('/login')
+        response.del_cookie(AUTH_COOKIE_NAME)
+        return response
         
     async def dashboard_handler(self, request):
         """Show main dashboard"""
-        if not await self.check_auth(request):
-            raise web.HTTPFound('/login')
-            
         try:
-            # Get statistics
-            stats = self.db.get_subscription_stats()
-            
-            # Get recent activities
-            recent_activities = self.db.get_recent_activities(limit=10)
-            
-            # Get expiring subscriptions
-            expiring_users = self.db.get_expiring_subscriptions(days=7)
+            # Statistics, recent activity and expiring subscriptions are
+            # independent, so fetch them concurrently off the event loop.
+            # Stats are cached by the client, which clears them on every write
+            stats, recent_activities, expiring_users = await asyncio.gather(
+                self.db.get_subscription_stats(),
+                self._cached('recent_activities', DASHBOARD_CACHE_TTL, self.db.get_recent_activities, limit=10),
+                self._cached('expiring_users', DASHBOARD_CACHE_TTL, self.db.get_expiring_subscriptions, days=7)
+            )
             
-            return aiohttp_jinja2.render_template(
-                'dashboard.html', 
-                request, 
+            return self._render(
+                'dashboard.html',
                 {
                     'stats': stats,
                     'recent_activities': recent_activities,
@@ -435,14 +513,10 @@ class AdminDashboard:
             
     async def users_handler(self, request):
         """Show all users"""
-        if not await self.check_auth(request):
-            raise web.HTTPFound('/login')
-            
         try:
-            users = self.db.get_all_users()
-            return aiohttp_jinja2.render_template(
+            users = await self.db.get_all_users()
+            return self._render(
                 'users.html',
-                request,
                 {'users': users}
             )
         except Exception as e:
@@ -451,23 +525,18 @@ class AdminDashboard:
             
     async def whitelist_user(self, request):
         """Whitelist a user"""
-        if not await self.check_auth(request):
-            raise web.HTTPFound('/login')
-            
         telegram_id = int(request.match_info['telegram_id'])
         
         try:
-            self.db.whitelist_user(telegram_id)
-            raise web.HTTPFound('/users')
+            await self.db.whitelist_user(telegram_id)
+            self._cache.clear()
+            return _redirect('/users')
         except Exception as e:
             logger.error(f"Whitelist error: {e}")
             return web.Response(text="Error whitelisting user", status=500)
             
     async def remove_user(self, request):
         """Remove a user"""
-        if not await self.check_auth(request):
-            raise web.HTTPFound('/login')
-            
         telegram_id = int(request.match_info['telegram_id'])
         
         try:
@@ -482,80 +551,69 @@ class AdminDashboard:
                     pass
                     
             # Update database
-            self.db.cancel_subscription(telegram_id)
-            raise web.HTTPFound('/users')
+            await self.db.cancel_subscription(telegram_id)
+            self._cache.clear()
+            return _redirect('/users')
         except Exception as e:
             logger.error(f"Remove user error: {e}")
             return web.Response(text="Error removing user", status=500)
             
     async def extend_subscription(self, request):
         """Extend a user's subscription"""
-        if not await self.check_auth(request):
-            raise web.HTTPFound('/login')
-            
         telegram_id = int(request.match_info['telegram_id'])
         
         try:
-            user = self.db.get_user(telegram_id)
+            # Single UPDATE ... RETURNING on the database side
+            user = await self.db.extend_subscription_days(telegram_id, 30)
             if user:
-                # Extend by 30 days
-                if user.next_payment_date:
-                    new_date = user.next_payment_date + timedelta(days=30)
-                else:
-                    new_date = datetime.utcnow().date() + timedelta(days=30)
-                    
-                self.db.update_user(
-                    telegram_id=telegram_id,
-                    next_payment_date=new_date,
-                    subscription_status='active'
-                )
+                self._cache.clear()
                 
-            raise web.HTTPFound('/users')
+            return _redirect('/users')
         except Exception as e:
             logger.error(f"Extend subscription error: {e}")
             return web.Response(text="Error extending subscription", status=500)
             
     async def stats_handler(self, request):
         """Show detailed statistics"""
-        if not await self.check_auth(request):
-            raise web.HTTPFound('/login')
-            
         # For now, redirect to dashboard
         # Could be expanded with more detailed stats
-        raise web.HTTPFound('/dashboard')
+        return _redirect('/dashboard')
         
     async def export_csv_handler(self, request):
         """Export users as CSV"""
-        if not await self.check_auth(request):
-            raise web.HTTPFound('/login')
+        response = web.StreamResponse(
+            headers={
+                'Content-Type': 'text/csv; charset=utf-8',
+                'Content-Disposition': f'attachment; filename="users_{datetime.now().strftime("%Y%m%d")}.csv"'
+            }
+        )
+        await response.prepare(request)
             
         try:
-            users = self.db.get_all_users()
+            await response.write(CSV_HEADER)
             
-            # Create CSV
-            csv_lines = ["telegram_id,username,status,payment_method,next_payment_date,created_at"]
-            for user in users:
-                csv_lines.append(
-                    f"{user.telegram_id},"
-                    f"{user.username or ''},"
-                    f"{user.subscription_status},"
-                    f"{user.payment_method or ''},"
-                    f"{user.next_payment_date or ''},"
-                    f"{user.created_at}"
-                )
-                
-            csv_content = '\n'.join(csv_lines)
-            
-            return web.Response(
-                text=csv_content,
-                headers={
-                    'Content-Type': 'text/csv',
-                    'Content-Disposition': f'attachment; filename="users_{datetime.now().strftime("%Y%m%d")}.csv"'
-                }
-            )
+            # Stream rows page by page instead of buffering the whole table;
+            # each page is escaped into one reused buffer and encoded once
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+            # Plain tuples in CSV_HEADER column order, no User objects
+            pending = 0
+            async for row in self.db.iter_all_users_raw(chunk_size=CSV_CHUNK_SIZE):
+                writer.writerow(row)
+                pending += 1
+                if pending == CSV_CHUNK_SIZE:
+                    await response.write(buffer.getvalue().encode('utf-8'))
+                    buffer.seek(0)
+                    buffer.truncate()
+                    pending = 0
+            if pending:
+                await response.write(buffer.getvalue().encode('utf-8'))
         except Exception as e:
+            # Headers are already sent, so the best we can do is log and truncate
             logger.error(f"Export error: {e}")
-            return web.Response(text="Error exporting data", status=500)
+            
+        await response.write_eof()
+        return response
             
 def create_admin_app(db_client: SupabaseClient, bot=None):
     """Create the admin dashboard app"""
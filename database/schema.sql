@@ -84,6 +84,8 @@ COMMENT ON COLUMN activity_log.details IS 'Additional context about the action i
 -- 3. INDEXES FOR PERFORMANCE
 -- ============================================
 -- Following Supabase best practices: index columns used in RLS policies and frequent queries
+-- On a live database, create new indexes with CREATE INDEX CONCURRENTLY (outside a
+-- transaction) and compare EXPLAIN ANALYZE output for the affected queries before/after
 
 -- Index for quick user lookups by telegram_id (already unique, but explicit for documentation)
 CREATE INDEX idx_users_telegram_id ON users USING btree (telegram_id);
@@ -96,14 +98,18 @@ CREATE INDEX idx_users_next_payment_date ON users USING btree (next_payment_date
     WHERE next_payment_date IS NOT NULL;
 
 -- Composite index for status + date queries (e.g., active subscriptions expiring soon)
+-- Partial on active rows, so expiring/expired scans are O(active users), not O(all users)
+-- INCLUDE (telegram_id) makes the expiry scans index-only
 CREATE INDEX idx_users_status_payment_date ON users USING btree (subscription_status, next_payment_date) 
+    INCLUDE (telegram_id)
     WHERE subscription_status = 'active';
 
--- Index for activity log queries by telegram_id
-CREATE INDEX idx_activity_log_telegram_id ON activity_log USING btree (telegram_id);
+-- Index for per-user activity history, newest first (also serves plain telegram_id lookups)
+-- ORDER BY timestamp DESC LIMIT n becomes an index scan that stops after n rows
+CREATE INDEX idx_activity_log_telegram_id_timestamp ON activity_log USING btree (telegram_id, timestamp DESC);
 
--- Index for activity log queries by action type
-CREATE INDEX idx_activity_log_action ON activity_log USING btree (action);
+-- Index for activity log queries by action type within a time window (e.g., payment stats)
+CREATE INDEX idx_activity_log_action_timestamp ON activity_log USING btree (action, timestamp DESC);
 
 -- Index for time-based activity queries
 CREATE INDEX idx_activity_log_timestamp ON activity_log USING btree (timestamp DESC);
@@ -259,6 +265,12 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql IMMUTABLE;
 
+-- Computed column: days until next payment (PostgREST exposes it as users.days_left)
+CREATE OR REPLACE FUNCTION days_left(users)
+RETURNS INTEGER AS $$
+    SELECT $1.next_payment_date - CURRENT_DATE;
+$$ LANGUAGE sql STABLE;
+
 -- Function to extend subscription by one month
 CREATE OR REPLACE FUNCTION extend_subscription(
     p_telegram_id BIGINT,
@@ -288,6 +300,18 @@ BEGIN
         RETURN;
     END IF;
     
+    -- Retried webhook: this transaction was already applied, skip the rewrite and log
+    IF p_transaction_id IS NOT NULL AND p_transaction_id IN (
+        v_user_record.airwallex_payment_id,
+        v_user_record.stars_transaction_id
+    ) THEN
+        RETURN QUERY SELECT 
+            TRUE, 
+            v_user_record.next_payment_date, 
+            'Payment already processed'::TEXT;
+        RETURN;
+    END IF;
+    
     -- Calculate new expiry date
     IF v_user_record.next_payment_date IS NULL OR v_user_record.next_payment_date < CURRENT_DATE THEN
         -- If no date or expired, start from today
@@ -331,6 +355,116 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+-- Function to fetch a user, creating it on first touch, in one atomic round-trip.
+-- The username is only rewritten when a new non-null value differs (no needless row rewrites).
+CREATE OR REPLACE FUNCTION get_or_create_user(
+    p_telegram_id BIGINT,
+    p_username TEXT DEFAULT NULL
+)
+RETURNS SETOF users AS $$
+BEGIN
+    RETURN QUERY
+    INSERT INTO users (telegram_id, username)
+    VALUES (p_telegram_id, p_username)
+    ON CONFLICT (telegram_id) DO UPDATE SET username = EXCLUDED.username
+        WHERE EXCLUDED.username IS NOT NULL
+            AND users.username IS DISTINCT FROM EXCLUDED.username
+    RETURNING *;
+    
+    -- Existing row left untouched by the guard above
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT * FROM users WHERE telegram_id = p_telegram_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Function to extend a subscription by N days in a single statement (admin dashboard)
+CREATE OR REPLACE FUNCTION extend_subscription_days(
+    p_telegram_id BIGINT,
+    p_days INTEGER DEFAULT 30
+)
+RETURNS SETOF users AS $$
+    UPDATE users SET
+        subscription_status = 'active',
+        next_payment_date = COALESCE(next_payment_date, CURRENT_DATE) + p_days
+    WHERE telegram_id = p_telegram_id
+    RETURNING *;
+$$ LANGUAGE sql SECURITY DEFINER;
+
+-- Function to whitelist many users in one statement (migrations, bulk admin)
+-- payload: [{"telegram_id": 123, "username": "name"}, ...]
+CREATE OR REPLACE FUNCTION bulk_whitelist(payload JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    INSERT INTO users (telegram_id, username, subscription_status, payment_method, next_payment_date)
+    SELECT DISTINCT ON (r.telegram_id)
+        r.telegram_id, r.username, 'whitelisted', 'whitelisted', NULL
+    FROM jsonb_to_recordset(payload) AS r(telegram_id BIGINT, username TEXT)
+    ON CONFLICT (telegram_id) DO UPDATE SET
+        username = COALESCE(EXCLUDED.username, users.username),
+        subscription_status = 'whitelisted',
+        payment_method = 'whitelisted',
+        next_payment_date = NULL;
+    
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Function to count users per subscription status (dashboard statistics)
+CREATE OR REPLACE FUNCTION get_status_counts()
+RETURNS TABLE (
+    status TEXT,
+    cnt BIGINT
+) AS $$
+    SELECT subscription_status, COUNT(*)
+    FROM users
+    GROUP BY subscription_status;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Function to count successful payments per method since a point in time
+CREATE OR REPLACE FUNCTION get_payment_stats(since TIMESTAMPTZ)
+RETURNS TABLE (
+    total BIGINT,
+    card BIGINT,
+    stars BIGINT
+) AS $$
+    SELECT
+        COUNT(*),
+        COUNT(*) FILTER (WHERE details->>'payment_method' = 'card'),
+        COUNT(*) FILTER (WHERE details->>'payment_method' = 'stars')
+    FROM activity_log
+    WHERE action = 'payment_successful'
+        AND timestamp >= since;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+-- Function to fetch overdue and soon-expiring subscriptions in one index scan (daily job)
+-- bucket is 'expired' (next_payment_date before today) or 'expiring' (within days_ahead)
+CREATE OR REPLACE FUNCTION get_subscriptions_by_expiry(days_ahead INTEGER DEFAULT 3)
+RETURNS TABLE (
+    bucket TEXT,
+    telegram_id BIGINT,
+    username TEXT,
+    subscription_status TEXT,
+    payment_method TEXT,
+    next_payment_date DATE,
+    days_left INTEGER
+) AS $$
+    SELECT
+        CASE WHEN u.next_payment_date < CURRENT_DATE THEN 'expired' ELSE 'expiring' END,
+        u.telegram_id,
+        u.username,
+        u.subscription_status,
+        u.payment_method,
+        u.next_payment_date,
+        u.next_payment_date - CURRENT_DATE
+    FROM users u
+    WHERE u.subscription_status = 'active'
+        AND u.next_payment_date <= CURRENT_DATE + days_ahead;
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+
 -- Function to expire subscriptions (for scheduled jobs)
 CREATE OR REPLACE FUNCTION expire_overdue_subscriptions()
 RETURNS TABLE (
@@ -385,6 +519,10 @@ ALTER TABLE users ADD CONSTRAINT check_active_has_payment_method
         OR payment_method IS NOT NULL
     );
 
+-- A payment transaction can only ever be applied once (webhook retries are no-ops)
+ALTER TABLE users ADD CONSTRAINT airwallex_payment_id_unique UNIQUE (airwallex_payment_id);
+ALTER TABLE users ADD CONSTRAINT stars_transaction_id_unique UNIQUE (stars_transaction_id);
+
 -- ============================================
 -- Migration completed successfully!
 -- 
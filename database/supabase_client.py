@@ -4,19 +4,49 @@ Handles all database operations for user subscriptions and activity logging
 """
 
 import os
+import asyncio
 from datetime import datetime, date, timedelta
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
 import logging
 
-from supabase import create_client, Client
-from supabase.lib.client_options import ClientOptions
+import httpx
+from cachetools import TTLCache
+from supabase import AsyncClient, AsyncClientOptions
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared HTTP/2 connection pool settings
+HTTP_TIMEOUT = 10
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 50
+
+# Seconds aggregate statistics are served from memory
+STATS_CACHE_TTL = 30
+
+# Per-user read cache (invalidated on every write through this client)
+USER_CACHE_SIZE = 10_000
+USER_CACHE_TTL = 30
+
+# Max telegram_ids per IN-clause (keeps PostgREST URLs well under the limit)
+USER_BULK_CHUNK_SIZE = 500
+
+# Background activity log writer
+ACTIVITY_QUEUE_SIZE = 10_000
+ACTIVITY_BATCH_SIZE = 500
+ACTIVITY_FLUSH_INTERVAL = 0.25  # seconds to let a batch fill up
+ACTIVITY_MAX_RETRIES = 3
+
 # ============================================
 # ENUMS FOR TYPE SAFETY
 # ============================================
@@ -47,11 +77,45 @@ class ActivityAction(Enum):
     USER_CREATED = "user_created"
     USER_UPDATED = "user_updated"
 
+# Plain string values for hot-path comparisons
+_STATUS_ACTIVE = SubscriptionStatus.ACTIVE.value
+_STATUS_WHITELISTED = SubscriptionStatus.WHITELISTED.value
+
+# Explicit column lists; only what User / callers actually read
+USER_COLUMNS = (
+    'telegram_id,username,subscription_status,payment_method,next_payment_date,'
+    'airwallex_payment_id,stars_transaction_id,created_at'
+)
+# Served by the covering idx_users_status_payment_date index
+EXPIRY_COLUMNS = 'telegram_id,subscription_status,next_payment_date'
+ACTIVITY_COLUMNS = 'telegram_id,action,details,timestamp'
+
+# Columns update_user is allowed to write
+_VALID_UPDATE_FIELDS = frozenset((
+    'username', 'subscription_status', 'payment_method',
+    'next_payment_date', 'airwallex_payment_id', 'stars_transaction_id'
+))
+
+
+@lru_cache(maxsize=32)
+def _iso_date(day: date) -> str:
+    """ISO string for a date, formatted once per distinct day"""
+    return day.isoformat()
+
+
+def _today_iso() -> str:
+    """Today's date as an ISO string"""
+    return _iso_date(date.today())
+
 # ============================================
 # DATA CLASSES
 # ============================================
 
-@dataclass
+# slots=True drops the per-instance __dict__. Rows are still built with
+# User(**row): on CPython 3.11 keyword construction measured faster than a
+# positional map(row.get, fields) adapter, and frozen=True roughly triples
+# __init__ cost, so neither is used on this hot path.
+@dataclass(slots=True)
 class User:
     """User data model"""
     telegram_id: int
@@ -64,23 +128,82 @@ class User:
     id: Optional[str] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
+    days_left: Optional[int] = None  # Computed in SQL when selected
+
+    def __post_init__(self):
+        # PostgREST returns DATE columns as ISO strings
+        if isinstance(self.next_payment_date, str):
+            self.next_payment_date = date.fromisoformat(self.next_payment_date[:10])
 
-    def is_active(self) -> bool:
-        """Check if subscription is currently active"""
-        if self.subscription_status == SubscriptionStatus.WHITELISTED.value:
+    def is_active(self, today: Optional[date] = None) -> bool:
+        """Check if subscription is currently active (pass today when checking many users)"""
+        status = self.subscription_status
+        if status == _STATUS_WHITELISTED:
             return True
-        if self.subscription_status == SubscriptionStatus.ACTIVE.value:
-            if self.next_payment_date:
-                return self.next_payment_date >= date.today()
+        if status == _STATUS_ACTIVE and self.next_payment_date:
+            return self.next_payment_date >= (today or date.today())
         return False
 
-    def days_until_expiry(self) -> Optional[int]:
-        """Calculate days until subscription expires"""
-        if self.next_payment_date and self.subscription_status == SubscriptionStatus.ACTIVE.value:
-            delta = self.next_payment_date - date.today()
+    def days_until_expiry(self, today: Optional[date] = None) -> Optional[int]:
+        """Calculate days until subscription expires (pass today when checking many users)"""
+        if self.next_payment_date and self.subscription_status == _STATUS_ACTIVE:
+            delta = self.next_payment_date - (today or date.today())
             return delta.days
         return None
 
+# ============================================
+# SHARED HTTP CONNECTION POOL
+# ============================================
+
+# One keep-alive HTTP/2 pool per project/key, reused by every SupabaseClient so
+# new instances don't pay a fresh TLS handshake. Keyed by (url, key) because
+# postgrest rewrites the client's base_url and auth headers when it adopts it.
+_http_clients: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+
+
+class _OrjsonResponse(httpx.Response):
+    """httpx response whose .json() uses orjson (postgrest parses every body via .json())"""
+    
+    def json(self, **kwargs: Any) -> Any:
+        if kwargs:
+            return super().json(**kwargs)
+        return orjson.loads(self.content)
+
+
+class _OrjsonAsyncClient(httpx.AsyncClient):
+    """httpx client that hands back _OrjsonResponse objects"""
+    
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        response = await super().send(request, **kwargs)
+        response.__class__ = _OrjsonResponse
+        return response
+
+
+def _get_http_client(url: str, key: str) -> httpx.AsyncClient:
+    """Get (or create) the shared httpx client for a Supabase project"""
+    client = _http_clients.get((url, key))
+    if client is None or client.is_closed:
+        # orjson roughly halves JSON parse time on large list responses
+        client_class = _OrjsonAsyncClient if HAS_ORJSON else httpx.AsyncClient
+        client = client_class(
+            http2=True,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            follow_redirects=True
+        )
+        _http_clients[(url, key)] = client
+    return client
+
+
+async def close_http_clients():
+    """Close the shared HTTP connection pools (call once on process shutdown)"""
+    while _http_clients:
+        _, client = _http_clients.popitem()
+        await client.aclose()
+
 # ============================================
 # SUPABASE CLIENT CLASS
 # ============================================
@@ -96,7 +219,13 @@ class SupabaseClient:
         )
     """
     
-    def __init__(self, url: str, key: str, is_service_role: bool = True):
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        is_service_role: bool = True,
+        read_url: Optional[str] = None
+    ):
         """
         Initialize Supabase client
         
@@ -104,25 +233,71 @@ class SupabaseClient:
             url: Supabase project URL
             key: Supabase API key (use service role key for bot operations)
             is_service_role: Whether using service role key (bypasses RLS)
+            read_url: Optional read-replica API URL for reports and scans
         """
         self.url = url
         self.key = key
         self.is_service_role = is_service_role
+        self.read_url = read_url
         
-        # Create client with proper configuration
-        options = ClientOptions(
-            postgrest_client_timeout=10,
-            storage_client_timeout=10,
+        # Create client with proper configuration. Requests go over the
+        # process-wide HTTP/2 pool and never block the event loop.
+        options = AsyncClientOptions(
+            postgrest_client_timeout=HTTP_TIMEOUT,
+            storage_client_timeout=HTTP_TIMEOUT,
+            httpx_client=_get_http_client(url, key),
         )
         
-        self.client: Client = create_client(url, key, options)
-        logger.info(f"Supabase client initialized for {url}")
+        self.client: AsyncClient = AsyncClient(url, key, options)
+        
+        # Reads that tolerate replication lag go to the replica when configured
+        self.reader: Optional[AsyncClient] = None
+        if read_url:
+            self.reader = AsyncClient(read_url, key, AsyncClientOptions(
+                postgrest_client_timeout=HTTP_TIMEOUT,
+                storage_client_timeout=HTTP_TIMEOUT,
+                httpx_client=_get_http_client(read_url, key),
+            ))
+        
+        # Aggregate statistics don't need real-time freshness, but every write
+        # that can change a subscription status clears them once it lands
+        self._stats_cache: TTLCache = TTLCache(maxsize=8, ttl=STATS_CACHE_TTL)
+        # Hot users are re-read on nearly every update the bot handles
+        self._user_cache: TTLCache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        # Bumped on every invalidation, so fetches that overlapped a write
+        # don't put the stale rows they read back into the cache
+        self._user_cache_gen = 0
+        # get_user calls made in the same loop tick share one IN query
+        self._pending_user_loads: Dict[int, asyncio.Future] = {}
+        self._user_flush_task: Optional[asyncio.Task] = None
+        # Activity records are queued and inserted in batches by a
+        # background task, started lazily once an event loop is running
+        self._log_queue: Optional[asyncio.Queue] = None
+        self._log_writer: Optional[asyncio.Task] = None
+        logger.info(f"Supabase client initialized for {url}" + (f" (reads: {read_url})" if read_url else ""))
+    
+    @property
+    def _reader(self) -> AsyncClient:
+        """Client for lag-tolerant reads: the replica if configured, else the primary"""
+        return self.reader or self.client
+    
+    async def close(self):
+        """Flush queued activity records and stop the background writer"""
+        if self._log_writer is None or self._log_writer.done():
+            return
+        
+        await self._log_queue.put(None)
+        try:
+            await asyncio.wait_for(self._log_writer, timeout=10)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out flushing {self._log_queue.qsize()} activity records")
+        self._log_writer = None
     
     # ============================================
     # USER OPERATIONS
     # ============================================
     
-    def get_user(self, telegram_id: int) -> Optional[User]:
+    async def get_user(self, telegram_id: int) -> Optional[User]:
         """
         Get user by Telegram ID
         
@@ -132,22 +307,97 @@ class SupabaseClient:
         Returns:
             User object if found, None otherwise
         """
+        user = self._user_cache.get(telegram_id)
+        if user is not None:
+            return user
+        
         try:
-            response = self.client.table('users') \
-                .select('*') \
-                .eq('telegram_id', telegram_id) \
-                .single() \
-                .execute()
-            
-            if response.data:
-                return User(**response.data)
-            return None
-            
+            # Shielded so one cancelled caller doesn't cancel the shared lookup
+            return await asyncio.shield(self._load_user(telegram_id))
         except Exception as e:
             logger.error(f"Error getting user {telegram_id}: {e}")
             return None
     
-    def create_user(
+    async def get_users_bulk(self, telegram_ids: List[int]) -> Dict[int, User]:
+        """
+        Get many users in as few round-trips as possible
+        
+        Args:
+            telegram_ids: Telegram user IDs to look up
+            
+        Returns:
+            Dict mapping telegram_id to User for every user that exists
+        """
+        users = {}
+        missing = []
+        for telegram_id in dict.fromkeys(telegram_ids):
+            user = self._user_cache.get(telegram_id)
+            if user is not None:
+                users[telegram_id] = user
+            else:
+                missing.append(telegram_id)
+        
+        try:
+            if missing:
+                users.update(await self._fetch_users(missing))
+        except Exception as e:
+            logger.error(f"Error getting {len(missing)} users in bulk: {e}")
+        return users
+    
+    async def _fetch_users(self, telegram_ids: List[int]) -> Dict[int, User]:
+        """Fetch users with chunked IN queries and populate the user cache"""
+        generation = self._user_cache_gen
+        users = {}
+        for i in range(0, len(telegram_ids), USER_BULK_CHUNK_SIZE):
+            response = await self.client.table('users') \
+                .select(USER_COLUMNS) \
+                .in_('telegram_id', telegram_ids[i:i + USER_BULK_CHUNK_SIZE]) \
+                .execute()
+            
+            for data in response.data or []:
+                user = User(**data)
+                users[user.telegram_id] = user
+        
+        if self._user_cache_gen == generation:
+            self._user_cache.update(users)
+        return users
+    
+    def _invalidate_user(self, telegram_id: Optional[int] = None):
+        """Drop a cached user (every cached user when no ID is given)"""
+        self._user_cache_gen += 1
+        if telegram_id is None:
+            self._user_cache.clear()
+        else:
+            self._user_cache.pop(telegram_id, None)
+    
+    def _load_user(self, telegram_id: int) -> asyncio.Future:
+        """Queue a user lookup to be resolved by the next batched fetch"""
+        future = self._pending_user_loads.get(telegram_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending_user_loads[telegram_id] = future
+            if self._user_flush_task is None:
+                # Runs after every coroutine already scheduled for this tick
+                self._user_flush_task = asyncio.create_task(self._flush_user_loads())
+        return future
+    
+    async def _flush_user_loads(self):
+        """Resolve all queued user lookups with one bulk fetch"""
+        pending, self._pending_user_loads = self._pending_user_loads, {}
+        self._user_flush_task = None
+        try:
+            users = await self._fetch_users(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for telegram_id, future in pending.items():
+            if not future.done():
+                future.set_result(users.get(telegram_id))
+    
+    async def create_user(
         self,
         telegram_id: int,
         username: Optional[str] = None,
@@ -164,6 +414,7 @@ class SupabaseClient:
         Returns:
             Created User object if successful, None otherwise
         """
+        self._invalidate_user(telegram_id)
         try:
             data = {
                 'telegram_id': telegram_id,
@@ -171,9 +422,11 @@ class SupabaseClient:
                 'subscription_status': subscription_status
             }
             
-            response = self.client.table('users') \
+            response = await self.client.table('users') \
                 .insert(data) \
                 .execute()
+            self._invalidate_user(telegram_id)
+            self._stats_cache.clear()
             
             if response.data and len(response.data) > 0:
                 logger.info(f"Created user {telegram_id}")
@@ -184,7 +437,7 @@ class SupabaseClient:
             logger.error(f"Error creating user {telegram_id}: {e}")
             return None
     
-    def update_user(
+    async def update_user(
         self,
         telegram_id: int,
         **kwargs
@@ -197,24 +450,25 @@ class SupabaseClient:
             **kwargs: Fields to update (username, subscription_status, payment_method, etc.)
             
         Returns:
-            Updated User object if successful, None otherwise
+            Updated User object if successful, None otherwise. When there is
+            nothing to update, the cached user (if any) is returned without
+            a round-trip.
         """
         try:
             # Filter out None values and invalid fields
-            valid_fields = {
-                'username', 'subscription_status', 'payment_method',
-                'next_payment_date', 'airwallex_payment_id', 'stars_transaction_id'
-            }
-            data = {k: v for k, v in kwargs.items() if k in valid_fields and v is not None}
+            data = {k: v for k, v in kwargs.items() if v is not None and k in _VALID_UPDATE_FIELDS}
             
             if not data:
                 logger.warning(f"No valid fields to update for user {telegram_id}")
-                return self.get_user(telegram_id)
+                return self._user_cache.get(telegram_id)
             
-            response = self.client.table('users') \
+            self._invalidate_user(telegram_id)
+            response = await self.client.table('users') \
                 .update(data) \
                 .eq('telegram_id', telegram_id) \
                 .execute()
+            self._invalidate_user(telegram_id)
+            self._stats_cache.clear()
             
             if response.data and len(response.data) > 0:
                 logger.info(f"Updated user {telegram_id}: {data}")
@@ -225,7 +479,7 @@ class SupabaseClient:
             logger.error(f"Error updating user {telegram_id}: {e}")
             return None
     
-    def get_or_create_user(
+    async def get_or_create_user(
         self,
         telegram_id: int,
         username: Optional[str] = None
@@ -240,20 +494,53 @@ class SupabaseClient:
         Returns:
             User object if successful, None otherwise
         """
-        user = self.get_user(telegram_id)
+        user = self._user_cache.get(telegram_id)
+        if user is not None and (not username or username == user.username):
+            return user
+        
+        try:
+            # Atomic upsert; only rewrites the row when the username changed
+            response = await self.client.rpc(
+                'get_or_create_user',
+                {
+                    'p_telegram_id': telegram_id,
+                    'p_username': username
+                }
+            ).execute()
+            
+            if response.data and len(response.data) > 0:
+                user = User(**response.data[0])
+                self._invalidate_user(telegram_id)
+                self._user_cache[telegram_id] = user
+                return user
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error getting or creating user {telegram_id}: {e}")
+            # Fallback to the table queries if the RPC is not deployed
+            return await self._manual_get_or_create_user(telegram_id, username)
+    
+    async def _manual_get_or_create_user(
+        self,
+        telegram_id: int,
+        username: Optional[str] = None
+    ) -> Optional[User]:
+        """
+        Get or create a user with separate table queries (fallback if RPC fails)
+        """
+        user = await self.get_user(telegram_id)
         if user:
             # Update username if changed
             if username and username != user.username:
-                return self.update_user(telegram_id, username=username)
+                return await self.update_user(telegram_id, username=username)
             return user
-        else:
-            return self.create_user(telegram_id, username)
+        return await self.create_user(telegram_id, username)
     
     # ============================================
     # SUBSCRIPTION OPERATIONS
     # ============================================
     
-    def activate_subscription(
+    async def activate_subscription(
         self,
         telegram_id: int,
         payment_method: str,
@@ -272,9 +559,10 @@ class SupabaseClient:
         Returns:
             Tuple of (success, new_expiry_date, message)
         """
+        self._invalidate_user(telegram_id)
         try:
             # Use the database function for atomic operation
-            response = self.client.rpc(
+            response = await self.client.rpc(
                 'extend_subscription',
                 {
                     'p_telegram_id': telegram_id,
@@ -282,13 +570,15 @@ class SupabaseClient:
                     'p_transaction_id': transaction_id
                 }
             ).execute()
+            self._invalidate_user(telegram_id)
+            self._stats_cache.clear()
             
             if response.data and len(response.data) > 0:
                 result = response.data[0]
-                # Convert string date to date object if needed
+                # Parse the date part only; no need to build a datetime
                 expiry_date = None
                 if result.get('new_expiry_date'):
-                    expiry_date = datetime.fromisoformat(result['new_expiry_date']).date()
+                    expiry_date = date.fromisoformat(result['new_expiry_date'][:10])
                 
                 return (
                     result.get('success', False),
@@ -301,11 +591,66 @@ class SupabaseClient:
         except Exception as e:
             logger.error(f"Error activating subscription for {telegram_id}: {e}")
             # Fallback to manual update if RPC fails
-            return self._manual_activate_subscription(
+            return await self._manual_activate_subscription(
                 telegram_id, payment_method, transaction_id, extend_from_today
             )
     
-    def _manual_activate_subscription(
+    async def extend_subscription_days(self, telegram_id: int, days: int = 30) -> Optional[User]:
+        """
+        Extend a subscription by a number of days in one round-trip
+        
+        Extends from the current expiry date (or today if there is none)
+        and marks the subscription active.
+        
+        Args:
+            telegram_id: Telegram user ID
+            days: Number of days to add
+            
+        Returns:
+            Updated User object if the user exists, None otherwise
+        """
+        self._invalidate_user(telegram_id)
+        try:
+            response = await self.client.rpc(
+                'extend_subscription_days',
+                {
+                    'p_telegram_id': telegram_id,
+                    'p_days': days
+                }
+            ).execute()
+            self._invalidate_user(telegram_id)
+            self._stats_cache.clear()
+            
+            if response.data and len(response.data) > 0:
+                logger.info(f"Extended subscription for {telegram_id} by {days} days")
+                return User(**response.data[0])
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error extending subscription for {telegram_id}: {e}")
+            # Fallback to read-then-update if the RPC is not deployed
+            return await self._manual_extend_subscription_days(telegram_id, days)
+    
+    async def _manual_extend_subscription_days(self, telegram_id: int, days: int = 30) -> Optional[User]:
+        """
+        Extend a subscription with separate table queries (fallback if RPC fails)
+        """
+        user = await self.get_user(telegram_id)
+        if not user:
+            return None
+        
+        if user.next_payment_date:
+            new_expiry = user.next_payment_date + timedelta(days=days)
+        else:
+            new_expiry = date.today() + timedelta(days=days)
+        
+        return await self.update_user(
+            telegram_id,
+            subscription_status=SubscriptionStatus.ACTIVE.value,
+            next_payment_date=_iso_date(new_expiry)
+        )
+    
+    async def _manual_activate_subscription(
         self,
         telegram_id: int,
         payment_method: str,
@@ -316,24 +661,31 @@ class SupabaseClient:
         Manually activate subscription (fallback if RPC fails)
         """
         try:
-            user = self.get_user(telegram_id)
+            user = await self.get_user(telegram_id)
             if not user:
                 # Create user if doesn't exist
-                user = self.create_user(telegram_id)
+                user = await self.create_user(telegram_id)
                 if not user:
                     return False, None, "Failed to create user"
             
+            # Retried webhook: this transaction was already applied
+            if transaction_id and transaction_id in (user.airwallex_payment_id, user.stars_transaction_id):
+                logger.info(f"Payment {transaction_id} already processed for {telegram_id}")
+                return True, user.next_payment_date, "Payment already processed"
+            
             # Calculate new expiry date
-            if extend_from_today or not user.next_payment_date or user.next_payment_date < date.today():
-                new_expiry = date.today() + timedelta(days=30)
+            today = date.today()
+            if extend_from_today or not user.next_payment_date or user.next_payment_date < today:
+                new_expiry = today + timedelta(days=30)
             else:
                 new_expiry = user.next_payment_date + timedelta(days=30)
+            new_expiry_iso = _iso_date(new_expiry)
             
             # Prepare update data
             update_data = {
                 'subscription_status': SubscriptionStatus.ACTIVE.value,
                 'payment_method': payment_method,
-                'next_payment_date': new_expiry.isoformat()
+                'next_payment_date': new_expiry_iso
             }
             
             if payment_method == PaymentMethod.CARD.value and transaction_id:
@@ -342,17 +694,17 @@ class SupabaseClient:
                 update_data['stars_transaction_id'] = transaction_id
             
             # Update user
-            updated_user = self.update_user(telegram_id, **update_data)
+            updated_user = await self.update_user(telegram_id, **update_data)
             
             if updated_user:
                 # Log the activity
-                self.log_activity(
+                await self.log_activity(
                     telegram_id,
                     ActivityAction.PAYMENT_SUCCESSFUL.value,
                     {
                         'payment_method': payment_method,
                         'transaction_id': transaction_id,
-                        'new_expiry_date': new_expiry.isoformat()
+                        'new_expiry_date': new_expiry_iso
                     }
                 )
                 return True, new_expiry, "Subscription activated successfully"
@@ -363,7 +715,7 @@ class SupabaseClient:
             logger.error(f"Error in manual subscription activation: {e}")
             return False, None, str(e)
     
-    def cancel_subscription(self, telegram_id: int) -> bool:
+    async def cancel_subscription(self, telegram_id: int) -> bool:
         """
         Cancel user subscription (set to expire at end of period)
         
@@ -373,14 +725,15 @@ class SupabaseClient:
         Returns:
             True if successful, False otherwise
         """
+        self._invalidate_user(telegram_id)
         try:
-            user = self.update_user(
+            user = await self.update_user(
                 telegram_id,
                 subscription_status=SubscriptionStatus.EXPIRED.value
             )
             
             if user:
-                self.log_activity(
+                await self.log_activity(
                     telegram_id,
                     ActivityAction.SUBSCRIPTION_CANCELLED.value,
                     {'cancelled_at': datetime.now().isoformat()}
@@ -392,7 +745,7 @@ class SupabaseClient:
             logger.error(f"Error cancelling subscription for {telegram_id}: {e}")
             return False
     
-    def whitelist_user(self, telegram_id: int, username: Optional[str] = None) -> bool:
+    async def whitelist_user(self, telegram_id: int, username: Optional[str] = None) -> bool:
         """
         Add user to whitelist (permanent free access)
         
@@ -404,13 +757,14 @@ class SupabaseClient:
             True if successful, False otherwise
         """
         try:
-            # First ensure user exists
-            user = self.get_or_create_user(telegram_id, username)
+            # First ensure user exists (a cache hit skips the round-trip;
+            # update_user below evicts the entry)
+            user = await self.get_or_create_user(telegram_id, username)
             if not user:
                 return False
             
             # Update to whitelisted status
-            updated_user = self.update_user(
+            updated_user = await self.update_user(
                 telegram_id,
                 subscription_status=SubscriptionStatus.WHITELISTED.value,
                 payment_method=PaymentMethod.WHITELISTED.value,
@@ -423,17 +777,20 @@ class SupabaseClient:
             logger.error(f"Error whitelisting user {telegram_id}: {e}")
             return False
     
-    def bulk_whitelist_users(
+    async def bulk_whitelist_users(
         self,
         users_data: List[Dict[str, Any]],
-        batch_size: int = 100
+        batch_size: int = 50_000
     ) -> Tuple[int, int, List[int]]:
         """
         Bulk whitelist multiple users efficiently
         
+        Each batch is upserted server-side by the bulk_whitelist RPC in a
+        single statement; batches only exist to cap request size (~5 MB).
+        
         Args:
             users_data: List of user dictionaries with telegram_id and optional username
-            batch_size: Number of users to process in each batch
+            batch_size: Max users sent per RPC call
             
         Returns:
             Tuple of (success_count, failed_count, failed_user_ids)
@@ -446,33 +803,32 @@ class SupabaseClient:
             for i in range(0, len(users_data), batch_size):
                 batch = users_data[i:i + batch_size]
                 
-                # Prepare batch data for upsert
-                batch_records = []
+                payload = []
                 for user_data in batch:
-                    batch_records.append({
+                    self._invalidate_user(user_data['telegram_id'])
+                    payload.append({
                         'telegram_id': user_data['telegram_id'],
-                        'username': user_data.get('username'),
-                        'subscription_status': SubscriptionStatus.WHITELISTED.value,
-                        'payment_method': PaymentMethod.WHITELISTED.value,
-                        'next_payment_date': None
+                        'username': user_data.get('username')
                     })
                 
                 try:
-                    # Upsert batch (insert or update)
-                    response = self.client.table('users') \
-                        .upsert(batch_records) \
-                        .execute()
+                    response = await self.client.rpc(
+                        'bulk_whitelist',
+                        {'payload': payload}
+                    ).execute()
+                    for record in payload:
+                        self._invalidate_user(record['telegram_id'])
+                    self._stats_cache.clear()
                     
-                    if response.data:
-                        success_count += len(response.data)
-                    else:
-                        failed_count += len(batch)
-                        failed_ids.extend([u['telegram_id'] for u in batch])
+                    success_count += response.data or 0
                         
                 except Exception as batch_error:
-                    logger.error(f"Batch upsert failed: {batch_error}")
-                    failed_count += len(batch)
-                    failed_ids.extend([u['telegram_id'] for u in batch])
+                    logger.error(f"Bulk whitelist batch failed: {batch_error}")
+                    # Fallback to plain table upserts if the RPC is not deployed
+                    upserted, failed = await self._manual_bulk_whitelist(payload)
+                    success_count += upserted
+                    failed_count += len(failed)
+                    failed_ids.extend(failed)
             
             logger.info(f"Bulk whitelist completed: {success_count} success, {failed_count} failed")
             return success_count, failed_count, failed_ids
@@ -481,7 +837,52 @@ class SupabaseClient:
             logger.error(f"Bulk whitelist operation failed: {e}")
             return success_count, failed_count, failed_ids
     
-    def get_whitelisted_users(self, limit: Optional[int] = None) -> List[User]:
+    async def _manual_bulk_whitelist(
+        self,
+        payload: List[Dict[str, Any]],
+        chunk_size: int = 100
+    ) -> Tuple[int, List[int]]:
+        """
+        Whitelist users with table upserts (fallback if RPC fails)
+        
+        Returns:
+            Tuple of (upserted count, failed telegram_ids)
+        """
+        upserted = 0
+        failed_ids = []
+        
+        for i in range(0, len(payload), chunk_size):
+            chunk = payload[i:i + chunk_size]
+            records = [
+                {
+                    **record,
+                    'subscription_status': SubscriptionStatus.WHITELISTED.value,
+                    'payment_method': PaymentMethod.WHITELISTED.value,
+                    'next_payment_date': None
+                }
+                for record in chunk
+            ]
+            
+            try:
+                response = await self.client.table('users') \
+                    .upsert(records) \
+                    .execute()
+                for record in chunk:
+                    self._invalidate_user(record['telegram_id'])
+                self._stats_cache.clear()
+                
+                if response.data:
+                    upserted += len(response.data)
+                else:
+                    failed_ids.extend(record['telegram_id'] for record in chunk)
+                    
+            except Exception as e:
+                logger.error(f"Batch upsert failed: {e}")
+                failed_ids.extend(record['telegram_id'] for record in chunk)
+        
+        return upserted, failed_ids
+    
+    async def get_whitelisted_users(self, limit: Optional[int] = None) -> List[User]:
         """
         Get all whitelisted users
         
@@ -492,14 +893,14 @@ class SupabaseClient:
             List of whitelisted User objects
         """
         try:
-            query = self.client.table('users') \
-                .select('*') \
+            query = self._reader.table('users') \
+                .select(USER_COLUMNS) \
                 .eq('subscription_status', SubscriptionStatus.WHITELISTED.value)
             
             if limit:
                 query = query.limit(limit)
             
-            response = query.execute()
+            response = await query.execute()
             
             return [User(**data) for data in response.data] if response.data else []
             
@@ -507,7 +908,7 @@ class SupabaseClient:
             logger.error(f"Error getting whitelisted users: {e}")
             return []
     
-    def remove_from_whitelist(self, telegram_id: int) -> bool:
+    async def remove_from_whitelist(self, telegram_id: int) -> bool:
         """
         Remove user from whitelist
         
@@ -517,8 +918,9 @@ class SupabaseClient:
         Returns:
             True if successful, False otherwise
         """
+        self._invalidate_user(telegram_id)
         try:
-            updated_user = self.update_user(
+            updated_user = await self.update_user(
                 telegram_id,
                 subscription_status=SubscriptionStatus.EXPIRED.value,
                 payment_method=None,
@@ -526,7 +928,7 @@ class SupabaseClient:
             )
             
             if updated_user:
-                self.log_activity(
+                await self.log_activity(
                     telegram_id,
                     ActivityAction.USER_REMOVED_FROM_GROUP.value,
                     {'removed_from_whitelist': True}
@@ -542,11 +944,11 @@ class SupabaseClient:
     # QUERY OPERATIONS
     # ============================================
     
-    def get_active_users(self) -> List[User]:
+    async def get_active_users(self) -> List[User]:
         """Get all users with active subscriptions"""
         try:
-            response = self.client.table('users') \
-                .select('*') \
+            response = await self._reader.table('users') \
+                .select(USER_COLUMNS) \
                 .in_('subscription_status', [
                     SubscriptionStatus.ACTIVE.value,
                     SubscriptionStatus.WHITELISTED.value
@@ -559,7 +961,78 @@ class SupabaseClient:
             logger.error(f"Error getting active users: {e}")
             return []
     
-    def get_expiring_subscriptions(self, days: int = 3) -> List[User]:
+    async def _iter_user_rows(self, columns: str, chunk_size: int) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Page through the users table, yielding raw row dicts
+        
+        Pages are keyed on the unique telegram_id rather than an offset, so
+        rows can't be skipped or repeated between pages, and each page is an
+        index range scan however deep into the table it is.
+        """
+        if 'telegram_id' not in columns.split(','):
+            columns += ',telegram_id'
+        last_id = None
+        while True:
+            # Builders mutate in place, so each page gets a fresh one
+            query = self.client.table('users') \
+                .select(columns) \
+                .order('telegram_id') \
+                .limit(chunk_size)
+            if last_id is not None:
+                query = query.gt('telegram_id', last_id)
+            response = await query.execute()
+            
+            rows = response.data or []
+            for data in rows:
+                yield data
+            
+            if len(rows) < chunk_size:
+                return
+            last_id = rows[-1]['telegram_id']
+    
+    async def iter_all_users(self, chunk_size: int = 1000) -> AsyncIterator[User]:
+        """
+        Iterate over all users page by page
+        
+        Args:
+            chunk_size: Number of rows to fetch per request
+            
+        Yields:
+            User objects ordered by telegram_id
+        """
+        async for data in self._iter_user_rows(USER_COLUMNS, chunk_size):
+            yield User(**data)
+    
+    async def iter_all_users_raw(
+        self,
+        fields: Tuple[str, ...] = (
+            'telegram_id', 'username', 'subscription_status',
+            'payment_method', 'next_payment_date', 'created_at'
+        ),
+        chunk_size: int = 1000
+    ) -> AsyncIterator[Tuple[Any, ...]]:
+        """
+        Iterate over all users as plain tuples, without building User objects
+        
+        Args:
+            fields: Columns to select, in tuple order
+            chunk_size: Number of rows to fetch per request
+            
+        Yields:
+            One tuple of column values per user, ordered by telegram_id
+        """
+        async for data in self._iter_user_rows(','.join(fields), chunk_size):
+            yield tuple(data[field] for field in fields)
+    
+    async def get_all_users(self) -> List[User]:
+        """Get all users"""
+        try:
+            return [user async for user in self.iter_all_users()]
+        except Exception as e:
+            logger.error(f"Error getting all users: {e}")
+            return []
+    
+    async def get_expiring_subscriptions(self, days: int = 3) -> List[User]:
         """
         Get users with subscriptions expiring within specified days
         
@@ -570,11 +1043,12 @@ class SupabaseClient:
             List of User objects with expiring subscriptions
         """
         try:
-            expiry_date = (date.today() + timedelta(days=days)).isoformat()
-            today = date.today().isoformat()
+            current = date.today()
+            expiry_date = _iso_date(current + timedelta(days=days))
+            today = _iso_date(current)
             
-            response = self.client.table('users') \
-                .select('*') \
+            response = await self._reader.table('users') \
+                .select(f'{USER_COLUMNS},days_left') \
                 .eq('subscription_status', SubscriptionStatus.ACTIVE.value) \
                 .gte('next_payment_date', today) \
                 .lte('next_payment_date', expiry_date) \
@@ -586,13 +1060,14 @@ class SupabaseClient:
             logger.error(f"Error getting expiring subscriptions: {e}")
             return []
     
-    def get_expired_subscriptions(self) -> List[User]:
+    async def get_expired_subscriptions(self) -> List[User]:
         """Get all users with expired subscriptions that need to be processed"""
+        # Primary, not the replica: a lagging read could remove a user who just renewed
         try:
-            today = date.today().isoformat()
+            today = _today_iso()
             
-            response = self.client.table('users') \
-                .select('*') \
+            response = await self.client.table('users') \
+                .select(EXPIRY_COLUMNS) \
                 .eq('subscription_status', SubscriptionStatus.ACTIVE.value) \
                 .lt('next_payment_date', today) \
                 .execute()
@@ -603,7 +1078,42 @@ class SupabaseClient:
             logger.error(f"Error getting expired subscriptions: {e}")
             return []
     
-    def expire_overdue_subscriptions(self) -> Tuple[int, List[int]]:
+    async def get_subscriptions_by_expiry(self, days: int = 3) -> Tuple[List[User], List[User]]:
+        """
+        Get expired and soon-expiring subscriptions in one round-trip
+        
+        Both sets come from a single scan of the active-subscription index.
+        Reads the primary for the same reason as get_expired_subscriptions.
+        
+        Args:
+            days: Number of days to check ahead for expiring subscriptions
+            
+        Returns:
+            Tuple of (expired users, users expiring within days)
+        """
+        try:
+            response = await self.client.rpc(
+                'get_subscriptions_by_expiry',
+                {'days_ahead': days}
+            ).execute()
+            
+            expired: List[User] = []
+            expiring: List[User] = []
+            for row in response.data or []:
+                bucket = row.pop('bucket')
+                (expired if bucket == 'expired' else expiring).append(User(**row))
+            return expired, expiring
+            
+        except Exception as e:
+            logger.error(f"Error getting subscriptions by expiry: {e}")
+            # Fallback to the two separate queries, issued concurrently
+            expired, expiring = await asyncio.gather(
+                self.get_expired_subscriptions(),
+                self.get_expiring_subscriptions(days)
+            )
+            return expired, expiring
+    
+    async def expire_overdue_subscriptions(self) -> Tuple[int, List[int]]:
         """
         Expire all overdue subscriptions
         
@@ -611,7 +1121,10 @@ class SupabaseClient:
             Tuple of (count of expired subscriptions, list of affected telegram_ids)
         """
         try:
-            response = self.client.rpc('expire_overdue_subscriptions').execute()
+            response = await self.client.rpc('expire_overdue_subscriptions').execute()
+            # Bulk status change; drop every cached user rather than guess
+            self._invalidate_user()
+            self._stats_cache.clear()
             
             if response.data and len(response.data) > 0:
                 result = response.data[0]
@@ -624,21 +1137,22 @@ class SupabaseClient:
         except Exception as e:
             logger.error(f"Error expiring overdue subscriptions: {e}")
             # Fallback to manual expiration
-            return self._manual_expire_subscriptions()
+            return await self._manual_expire_subscriptions()
     
-    def _manual_expire_subscriptions(self) -> Tuple[int, List[int]]:
-        """Manually expire subscriptions (fallback)"""
+    async def _manual_expire_subscriptions(self) -> Tuple[int, List[int]]:
+        """Manually expire subscriptions (fallback) with a single bulk UPDATE"""
         try:
-            expired_users = self.get_expired_subscriptions()
-            expired_ids = []
-            
-            for user in expired_users:
-                if self.update_user(
-                    user.telegram_id,
-                    subscription_status=SubscriptionStatus.EXPIRED.value
-                ):
-                    expired_ids.append(user.telegram_id)
+            response = await self.client.table('users') \
+                .update({'subscription_status': SubscriptionStatus.EXPIRED.value}) \
+                .eq('subscription_status', SubscriptionStatus.ACTIVE.value) \
+                .lt('next_payment_date', _today_iso()) \
+                .execute()
             
+            self._invalidate_user()
+            self._stats_cache.clear()
+            expired_ids = [row['telegram_id'] for row in response.data or []]
+            if expired_ids:
+                logger.info(f"Expired {len(expired_ids)} overdue subscriptions")
             return len(expired_ids), expired_ids
             
         except Exception as e:
@@ -649,7 +1163,7 @@ class SupabaseClient:
     # ACTIVITY LOGGING
     # ============================================
     
-    def log_activity(
+    async def log_activity(
         self,
         telegram_id: int,
         action: str,
@@ -658,32 +1172,71 @@ class SupabaseClient:
         """
         Log user activity
         
+        The record is queued and written by a background task in batches,
+        so callers never wait on the insert.
+        
         Args:
             telegram_id: Telegram user ID
             action: Action type (use ActivityAction enum values)
             details: Additional details about the action
             
         Returns:
-            True if successful, False otherwise
+            True if queued, False if the queue is full and the record was dropped
         """
+        data = {
+            'telegram_id': telegram_id,
+            'action': action,
+            'details': details or {}
+        }
+        
+        if self._log_writer is None or self._log_writer.done():
+            if self._log_queue is None:
+                self._log_queue = asyncio.Queue(maxsize=ACTIVITY_QUEUE_SIZE)
+            self._log_writer = asyncio.create_task(self._activity_writer())
+        
         try:
-            data = {
-                'telegram_id': telegram_id,
-                'action': action,
-                'details': details or {}
-            }
-            
-            response = self.client.table('activity_log') \
-                .insert(data) \
-                .execute()
-            
-            return response.data is not None
-            
-        except Exception as e:
-            logger.error(f"Error logging activity for {telegram_id}: {e}")
+            self._log_queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Activity log queue full, dropping {action} for {telegram_id}")
             return False
     
-    def get_user_activity(
+    async def _activity_writer(self):
+        """Drain the activity queue, inserting up to ACTIVITY_BATCH_SIZE rows per call"""
+        queue = self._log_queue
+        while True:
+            batch = [await queue.get()]
+            if queue.qsize() < ACTIVITY_BATCH_SIZE:
+                # Let concurrent writers fill the batch before sending it
+                await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+            while len(batch) < ACTIVITY_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            # None is the shutdown sentinel queued by close()
+            rows = [row for row in batch if row is not None]
+            if rows:
+                await self._insert_activity_batch(rows)
+            if len(rows) < len(batch):
+                return
+    
+    async def _insert_activity_batch(self, rows: List[Dict[str, Any]]):
+        """Insert activity rows, retrying with exponential backoff"""
+        delay = ACTIVITY_FLUSH_INTERVAL
+        for attempt in range(1, ACTIVITY_MAX_RETRIES + 1):
+            try:
+                await self.client.table('activity_log') \
+                    .insert(rows) \
+                    .execute()
+                return
+            except Exception as e:
+                logger.error(f"Error logging {len(rows)} activities (attempt {attempt}): {e}")
+                if attempt < ACTIVITY_MAX_RETRIES:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+        
+        logger.error(f"Dropped {len(rows)} activity records after {ACTIVITY_MAX_RETRIES} attempts")
+    
+    async def get_user_activity(
         self,
         telegram_id: int,
         limit: int = 50,
@@ -701,14 +1254,14 @@ class SupabaseClient:
             List of activity records
         """
         try:
-            query = self.client.table('activity_log') \
-                .select('*') \
+            query = self._reader.table('activity_log') \
+                .select(ACTIVITY_COLUMNS) \
                 .eq('telegram_id', telegram_id)
             
             if action_filter:
                 query = query.eq('action', action_filter)
             
-            response = query \
+            response = await query \
                 .order('timestamp', desc=True) \
                 .limit(limit) \
                 .execute()
@@ -719,37 +1272,61 @@ class SupabaseClient:
             logger.error(f"Error getting activity for {telegram_id}: {e}")
             return []
     
+    async def get_recent_activities(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Get the most recent activity log entries across all users
+        
+        Args:
+            limit: Maximum number of records to return
+            
+        Returns:
+            List of activity records with timestamps pre-formatted as 'YYYY-MM-DD HH:MM'
+        """
+        try:
+            response = await self._reader.table('activity_log') \
+                .select(ACTIVITY_COLUMNS) \
+                .order('timestamp', desc=True) \
+                .limit(limit) \
+                .execute()
+            
+            activities = response.data if response.data else []
+            for activity in activities:
+                activity['timestamp'] = datetime.fromisoformat(activity['timestamp']).strftime('%Y-%m-%d %H:%M')
+            return activities
+            
+        except Exception as e:
+            logger.error(f"Error getting recent activities: {e}")
+            return []
+    
     # ============================================
     # STATISTICS AND REPORTING
     # ============================================
     
-    def get_subscription_stats(self) -> Dict[str, int]:
-        """Get subscription statistics"""
+    async def get_subscription_stats(self) -> Dict[str, int]:
+        """Get subscription statistics (aggregated server-side, cached briefly and cleared on writes)"""
+        stats = self._stats_cache.get('subscription')
+        if stats is not None:
+            return stats
+        
         try:
-            # Get counts for each status
-            active = len(self.get_active_users())
-            
-            response = self.client.table('users') \
-                .select('subscription_status', count='exact') \
-                .execute()
+            try:
+                response = await self._reader.rpc('get_status_counts').execute()
+                counts = {row['status']: row['cnt'] for row in response.data or []}
+            except Exception as e:
+                logger.error(f"Error getting status counts: {e}")
+                # Fallback to one count query per status if the RPC is not deployed
+                counts = await self._manual_status_counts()
             
             stats = {
-                'total_users': response.count if response.count else 0,
-                'active_subscriptions': active,
-                'expired_subscriptions': 0,
-                'whitelisted_users': 0
+                'total_users': sum(counts.values()),
+                'active_subscriptions': (
+                    counts.get(SubscriptionStatus.ACTIVE.value, 0)
+                    + counts.get(SubscriptionStatus.WHITELISTED.value, 0)
+                ),
+                'expired_subscriptions': counts.get(SubscriptionStatus.EXPIRED.value, 0),
+                'whitelisted_users': counts.get(SubscriptionStatus.WHITELISTED.value, 0)
             }
-            
-            # Count by status
-            all_users = self.client.table('users').select('subscription_status').execute()
-            if all_users.data:
-                for user in all_users.data:
-                    status = user['subscription_status']
-                    if status == SubscriptionStatus.EXPIRED.value:
-                        stats['expired_subscriptions'] += 1
-                    elif status == SubscriptionStatus.WHITELISTED.value:
-                        stats['whitelisted_users'] += 1
-            
+            self._stats_cache['subscription'] = stats
             return stats
             
         except Exception as e:
@@ -761,7 +1338,23 @@ class SupabaseClient:
                 'whitelisted_users': 0
             }
     
-    def get_payment_stats(self, days: int = 30) -> Dict[str, Any]:
+    async def _manual_status_counts(self) -> Dict[str, int]:
+        """Count users per subscription status with table queries (fallback if RPC fails)"""
+        statuses = [status.value for status in SubscriptionStatus]
+        responses = await asyncio.gather(*(
+            self._reader.table('users')
+                .select('telegram_id', count='exact')
+                .eq('subscription_status', status)
+                .limit(1)
+                .execute()
+            for status in statuses
+        ))
+        return {
+            status: response.count or 0
+            for status, response in zip(statuses, responses)
+        }
+    
+    async def get_payment_stats(self, days: int = 30) -> Dict[str, Any]:
         """
         Get payment statistics for the last N days
         
@@ -774,35 +1367,22 @@ class SupabaseClient:
         try:
             since_date = (datetime.now() - timedelta(days=days)).isoformat()
             
-            response = self.client.table('activity_log') \
-                .select('*') \
-                .eq('action', ActivityAction.PAYMENT_SUCCESSFUL.value) \
-                .gte('timestamp', since_date) \
-                .execute()
-            
-            if not response.data:
-                return {
-                    'total_payments': 0,
-                    'card_payments': 0,
-                    'stars_payments': 0,
-                    'period_days': days
-                }
-            
-            card_count = 0
-            stars_count = 0
-            
-            for record in response.data:
-                details = record.get('details', {})
-                payment_method = details.get('payment_method')
-                if payment_method == PaymentMethod.CARD.value:
-                    card_count += 1
-                elif payment_method == PaymentMethod.STARS.value:
-                    stars_count += 1
+            try:
+                # Counted server-side; one row back regardless of payment volume
+                response = await self._reader.rpc(
+                    'get_payment_stats',
+                    {'since': since_date}
+                ).execute()
+                row = response.data[0] if response.data else {}
+            except Exception as e:
+                logger.error(f"Error calling get_payment_stats: {e}")
+                # Fallback to count queries if the RPC is not deployed
+                row = await self._manual_payment_counts(since_date)
             
             return {
-                'total_payments': len(response.data),
-                'card_payments': card_count,
-                'stars_payments': stars_count,
+                'total_payments': row.get('total', 0),
+                'card_payments': row.get('card', 0),
+                'stars_payments': row.get('stars', 0),
                 'period_days': days
             }
             
@@ -814,22 +1394,51 @@ class SupabaseClient:
                 'stars_payments': 0,
                 'period_days': days
             }
+    
+    async def _manual_payment_counts(self, since_date: str) -> Dict[str, int]:
+        """Count payments since a date with table queries (fallback if RPC fails)"""
+        def payments():
+            return self._reader.table('activity_log') \
+                .select('id', count='exact') \
+                .eq('action', ActivityAction.PAYMENT_SUCCESSFUL.value) \
+                .gte('timestamp', since_date)
+        
+        total, card, stars = await asyncio.gather(
+            payments().limit(1).execute(),
+            payments().eq('details->>payment_method', PaymentMethod.CARD.value).limit(1).execute(),
+            payments().eq('details->>payment_method', PaymentMethod.STARS.value).limit(1).execute()
+        )
+        return {
+            'total': total.count or 0,
+            'card': card.count or 0,
+            'stars': stars.count or 0
+        }
 
 
 # ============================================
 # CONVENIENCE FUNCTIONS
 # ============================================
 
+@lru_cache(maxsize=1)
 def create_client_from_env() -> SupabaseClient:
     """
-    Create Supabase client using environment variables
+    Get the process-wide Supabase client configured from environment variables
+    
+    The instance is created on first call and shared by every caller, so all
+    handlers reuse one connection pool, user cache and activity writer. This
+    is safe because the client only awaits the underlying AsyncClient and
+    holds no per-request state. Call create_client_from_env.cache_clear() to
+    drop it (e.g. in tests).
     
     Required environment variables:
         SUPABASE_URL: Your Supabase project URL
         SUPABASE_SERVICE_KEY: Your Supabase service role key (for bot operations)
     
+    Optional environment variables:
+        SUPABASE_READ_REPLICA_URL: Read-replica API URL for reporting queries
+    
     Returns:
-        Configured SupabaseClient instance
+        Shared SupabaseClient instance
     """
     url = os.getenv('SUPABASE_URL')
     key = os.getenv('SUPABASE_SERVICE_KEY')
@@ -839,7 +1448,12 @@ def create_client_from_env() -> SupabaseClient:
             "Missing required environment variables: SUPABASE_URL and SUPABASE_SERVICE_KEY"
         )
     
-    return SupabaseClient(url, key, is_service_role=True)
+    return SupabaseClient(
+        url,
+        key,
+        is_service_role=True,
+        read_url=os.getenv('SUPABASE_READ_REPLICA_URL')
+    )
 
 
 # ============================================
@@ -849,46 +1463,52 @@ def create_client_from_env() -> SupabaseClient:
 if __name__ == "__main__":
     # Example usage (requires environment variables to be set)
     
-    # Initialize client
-    # Option 1: Direct initialization
-    client = SupabaseClient(
-        url="https://dijdhqrxqwbctywejydj.supabase.co",
-        key="your-service-role-key-here"  # Replace with actual key
-    )
+    async def main():
+        # Initialize client
+        # Option 1: Direct initialization
+        client = SupabaseClient(
+            url="https://dijdhqrxqwbctywejydj.supabase.co",
+            key="your-service-role-key-here"  # Replace with actual key
+        )
     
-    # Option 2: From environment variables
-    # client = create_client_from_env()
+        # Option 2: From environment variables
+        # client = create_client_from_env()
     
-    # Example: Create or get a user
-    telegram_id = 123456789
-    user = client.get_or_create_user(telegram_id, username="testuser")
-    if user:
-        print(f"User: {user.telegram_id}, Status: {user.subscription_status}")
+        # Example: Create or get a user
+        telegram_id = 123456789
+        user = await client.get_or_create_user(telegram_id, username="testuser")
+        if user:
+            print(f"User: {user.telegram_id}, Status: {user.subscription_status}")
     
-    # Example: Activate subscription
-    success, expiry_date, message = client.activate_subscription(
-        telegram_id,
-        PaymentMethod.CARD.value,
-        transaction_id="test_transaction_123"
-    )
-    print(f"Activation result: {success}, Expires: {expiry_date}, Message: {message}")
-    
-    # Example: Check subscription status
-    user = client.get_user(telegram_id)
-    if user and user.is_active():
-        print(f"User is active, expires in {user.days_until_expiry()} days")
-    
-    # Example: Get statistics
-    stats = client.get_subscription_stats()
-    print(f"Subscription stats: {stats}")
-    
-    # Example: Get expiring subscriptions
-    expiring = client.get_expiring_subscriptions(days=7)
-    print(f"Users expiring in 7 days: {len(expiring)}")
-    
-    # Example: Log custom activity
-    client.log_activity(
-        telegram_id,
-        ActivityAction.USER_JOINED_GROUP.value,
-        {'group_id': -1001234567890}
-    )
\ No newline at end of file
+        # Example: Activate subscription
+        success, expiry_date, message = await client.activate_subscription(
+            telegram_id,
+            PaymentMethod.CARD.value,
+            transaction_id="test_transaction_123"
+        )
+        print(f"Activation result: {success}, Expires: {expiry_date}, Message: {message}")
+    
+        # Example: Check subscription status
+        user = await client.get_user(telegram_id)
+        if user and user.is_active():
+            print(f"User is active, expires in {user.days_until_expiry()} days")
+    
+        # Example: Get statistics
+        stats = await client.get_subscription_stats()
+        print(f"Subscription stats: {stats}")
+    
+        # Example: Get expiring subscriptions
+        expiring = await client.get_expiring_subscriptions(days=7)
+        print(f"Users expiring in 7 days: {len(expiring)}")
+    
+        # Example: Log custom activity
+        await client.log_activity(
+            telegram_id,
+            ActivityAction.USER_JOINED_GROUP.value,
+            {'group_id': -1001234567890}
+        )
+        
+        # Flush queued activity records before exiting
+        await client.close()
+
+    asyncio.run(main())
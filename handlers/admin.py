@@ -3,33 +3,243 @@ Admin Handlers Module
 Handles administrative functions like user management, statistics, and broadcasts
 """
 
+import asyncio
+import csv
+import io
 import logging
+import os
+import tempfile
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from itertools import islice
+from typing import Awaitable, List, Dict, Any, Optional, Set
 
+import aiofiles
 from aiogram import Router, Bot, F, html
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, FSInputFile
+from aiogram.filters.callback_data import CallbackData
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 
 logger = logging.getLogger(__name__)
 
 # Create router for admin handlers
 router = Router(name="admin")
 
-# Import config and shared data
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import os
-
 # Configuration
 GROUP_ID = int(os.getenv("GROUP_ID", "-1002384609773"))
-ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "306145881"))
-from handlers.commands import user_subscriptions, whitelisted_users
+
+# Shared data (the bot runs from the project root, so the package imports directly)
+from handlers.commands import (
+    user_subscriptions, whitelisted_users, bot_stats, plans_index, expiry_index,
+    count_active_subscriptions, add_to_whitelist, remove_from_whitelist, is_not_modified,
+    IsAdmin, SECONDS_PER_DAY
+)
 from handlers.payments import remove_user_from_group, add_user_to_group
+from services.broadcast_queue import BroadcastQueue
+
+# Maximum number of broadcast messages in flight at once
+BROADCAST_CONCURRENCY = 25
+# Telegram allows roughly 30 messages per second per bot
+BROADCAST_RATE_LIMIT = 30
+
+class RateLimiter:
+    """Async token bucket allowing `rate` acquisitions per `period` seconds"""
+    
+    def __init__(self, rate: int, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.rate,
+                    self._tokens + (now - self._updated) * self.rate / self.period
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return self
+                await asyncio.sleep((1 - self._tokens) * self.period / self.rate)
+    
+    async def __aexit__(self, *exc_info):
+        return False
+
+# Display formats for timestamps in admin messages
+DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M:%S'
+
+# Whitelisted users listed in the remove prompt (Telegram messages cap at 4096 chars)
+WHITELIST_DISPLAY_LIMIT = 50
+
+# Message texts: static ones are sent as-is, templates only fill in the dynamic parts
+_ADMIN_PANEL_TEXT = """
+<b>Admin Panel</b>
+
+Welcome to the admin control panel.
+Choose an action from the menu below:
+"""
+
+_GROUP_ID_CODE = html.code(str(GROUP_ID))
+
+_STATS_TEMPLATE = """
+<b>📊 Bot Statistics</b>
+
+<b>Users:</b>
+• Active Subscriptions: {active}
+• Whitelisted Users: {whitelisted}
+• Total Users: {total}
+
+<b>Revenue:</b>
+• Total Stars Collected: {revenue}
+• Average per User: {average:.1f}
+
+<b>Subscriptions by Plan:</b>
+• Basic (7d): {basic}
+• Standard (30d): {standard}
+• Premium (180d): {premium}
+
+<b>System:</b>
+• Bot Started: {started}
+• Group ID: {group_id}
+
+Last updated: {updated}
+"""
+
+_USER_MANAGEMENT_TEXT = """
+<b>👥 User Management</b>
+
+Send me a user ID to view their details and manage their subscription.
+
+Example: <code>123456789</code>
+
+Or choose an action below:
+"""
+
+_WHITELIST_ADD_TEXT = """
+<b>➕ Add to Whitelist</b>
+
+Send me the user ID to add to whitelist.
+Whitelisted users have lifetime access without payment.
+
+Example: <code>123456789</code>
+
+Send /cancel to cancel.
+"""
+
+_WHITELIST_REMOVE_TEMPLATE = """
+<b>➖ Remove from Whitelist</b>
+
+Current whitelisted users:
+{user_list}
+
+Send the user ID to remove from whitelist.
+
+Send /cancel to cancel.
+"""
+
+_BROADCAST_PROMPT_TEXT = """
+<b>📢 Broadcast Message</b>
+
+Send me the message you want to broadcast to all users with active subscriptions.
+
+You can use HTML formatting:
+• <code>&lt;b&gt;bold&lt;/b&gt;</code>
+• <code>&lt;i&gt;italic&lt;/i&gt;</code>
+• <code>&lt;code&gt;code&lt;/code&gt;</code>
+
+Send /cancel to cancel.
+"""
+
+_BROADCAST_PREVIEW_TEMPLATE = """
+<b>📢 Broadcast Preview</b>
+
+<b>Recipients:</b> {recipients} users
+
+<b>Message:</b>
+{message}
+
+Send this message to all users?
+"""
+
+_BROADCAST_REPORT_TEMPLATE = """
+<b>📢 Broadcast Complete</b>
+
+✅ Successfully sent: {sent}
+❌ Failed: {failed}
+📊 Total: {total}
+🎯 Success rate: {rate:.1f}%
+"""
+
+# Subscription CSV export: columns and rows written per file write
+SUBS_CSV_HEADER = ("user_id", "plan", "expires_at", "amount", "currency", "payment_method", "transaction_id")
+SUBS_CSV_CHUNK_SIZE = 1000
+
+# Seconds between broadcast progress updates
+BROADCAST_PROGRESS_INTERVAL = 2
+# Seconds without progress before a queued broadcast's report is sent anyway
+BROADCAST_STALL_TIMEOUT = 120
+
+# Shared by all broadcasts so concurrent ones don't exceed the limit together
+broadcast_limiter = RateLimiter(BROADCAST_RATE_LIMIT)
+
+# Persistent broadcast queue (will be set from main.py when Redis is configured)
+broadcast_queue: Optional[BroadcastQueue] = None
+
+def set_broadcast_queue(queue: BroadcastQueue):
+    """Set the queue broadcasts are delivered through"""
+    global broadcast_queue
+    broadcast_queue = queue
+    logger.info("Broadcast queue configured in admin handlers")
+
+def iter_broadcast_recipients():
+    """Yield each subscriber and whitelisted user once, without building a union set"""
+    yield from user_subscriptions
+    for user_id in whitelisted_users:
+        if user_id not in user_subscriptions:
+            yield user_id
+
+def count_broadcast_recipients() -> int:
+    """Count distinct broadcast recipients"""
+    return len(user_subscriptions) + sum(
+        1 for user_id in whitelisted_users if user_id not in user_subscriptions
+    )
+
+# Long-running admin jobs (broadcasts, exports) run outside their handlers so
+# the dispatcher is free again as soon as the callback is answered
+_background_tasks: Set[asyncio.Task] = set()
+
+def _job_done(task: asyncio.Task):
+    """Drop a finished job and log its failure, if any"""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Admin job {task.get_name()} failed: {task.exception()}")
+
+def run_in_background(job: Awaitable, name: str) -> asyncio.Task:
+    """Start an admin job as a task, keeping a reference until it finishes"""
+    task = asyncio.create_task(job, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_job_done)
+    return task
+
+async def send_rate_limited(bot: Bot, user_id: int, text: str):
+    """Send a message within the broadcast rate limit, retrying once on flood control"""
+    try:
+        async with broadcast_limiter:
+            await bot.send_message(user_id, text)
+    except TelegramRetryAfter as e:
+        logger.warning(f"Flood control hit, retrying {user_id} in {e.retry_after}s")
+        await asyncio.sleep(e.retry_after)
+        async with broadcast_limiter:
+            await bot.send_message(user_id, text)
 
 # FSM States for admin actions
 class AdminStates(StatesGroup):
@@ -39,21 +249,17 @@ class AdminStates(StatesGroup):
     confirming_broadcast = State()
     managing_user = State()
 
-# Admin check decorator/filter
-def is_admin(user_id: int) -> bool:
-    """Check if user is admin"""
-    return user_id == ADMIN_USER_ID
+# Callback data for per-user management buttons
+class AdminUserCallback(CallbackData, prefix="au"):
+    action: str
+    user_id: int
 
-# Statistics tracking (in production, use database)
-bot_stats = {
-    "total_users": 0,
-    "active_subscriptions": 0,
-    "total_revenue": 0,
-    "messages_sent": 0
-}
+# Router-level filter: only the admin's updates reach these handlers
+router.message.filter(IsAdmin())
+router.callback_query.filter(IsAdmin())
 
-def get_admin_keyboard() -> InlineKeyboardMarkup:
-    """Get admin panel keyboard"""
+def _build_admin_keyboard() -> InlineKeyboardMarkup:
+    """Build admin panel keyboard"""
     builder = InlineKeyboardBuilder()
     builder.button(text="📊 Statistics", callback_data="admin_stats")
     builder.button(text="👥 Manage Users", callback_data="admin_users")
@@ -66,91 +272,87 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(2)
     return builder.as_markup()
 
-@router.callback_query(lambda c: c.data == "admin_stats")
-async def admin_stats_handler(callback: CallbackQuery):
-    """Show bot statistics"""
-    user_id = callback.from_user.id
-    
-    if not is_admin(user_id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
-    await callback.answer()
-    
-    # Calculate statistics
-    active_subs = len([s for s in user_subscriptions.values() 
-                       if s.get("expires_at", datetime.min) > datetime.now()])
-    
-    total_revenue = sum([s.get("amount", 0) for s in user_subscriptions.values()])
-    
-    stats_text = f"""
-<b>📊 Bot Statistics</b>
+def _build_user_management_keyboard() -> InlineKeyboardMarkup:
+    """Build user management sub-menu keyboard"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="View All Subscriptions", callback_data="admin_subs")
+    builder.button(text="View Whitelisted", callback_data="admin_whitelist_view")
+    builder.button(text="Cancel", callback_data="admin_cancel")
+    builder.adjust(1)
+    return builder.as_markup()
 
-<b>Users:</b>
-• Active Subscriptions: {active_subs}
-• Whitelisted Users: {len(whitelisted_users)}
-• Total Users: {len(user_subscriptions) + len(whitelisted_users)}
+def _build_subscriptions_keyboard() -> InlineKeyboardMarkup:
+    """Build subscriptions view keyboard"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Export CSV", callback_data="admin_export")
+    builder.button(text="Back", callback_data="admin_back")
+    builder.adjust(2)
+    return builder.as_markup()
 
-<b>Revenue:</b>
-• Total Stars Collected: {total_revenue}
-• Average per User: {total_revenue / max(len(user_subscriptions), 1):.1f}
+def _build_broadcast_confirm_keyboard() -> InlineKeyboardMarkup:
+    """Build broadcast confirmation keyboard"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✅ Send", callback_data="admin_broadcast_send")
+    builder.button(text="❌ Cancel", callback_data="admin_broadcast_cancel")
+    builder.adjust(2)
+    return builder.as_markup()
 
-<b>Subscriptions by Plan:</b>
-• Basic (7d): {len([s for s in user_subscriptions.values() if "Basic" in s.get("plan", "")])}
-• Standard (30d): {len([s for s in user_subscriptions.values() if "Standard" in s.get("plan", "")])}
-• Premium (180d): {len([s for s in user_subscriptions.values() if "Premium" in s.get("plan", "")])}
+# Static keyboards are immutable, so build them once at import
+_ADMIN_KB = _build_admin_keyboard()
+_USER_MANAGEMENT_KB = _build_user_management_keyboard()
+_SUBSCRIPTIONS_KB = _build_subscriptions_keyboard()
+_BROADCAST_CONFIRM_KB = _build_broadcast_confirm_keyboard()
 
-<b>System:</b>
-• Bot Started: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-• Group ID: {html.code(str(GROUP_ID))}
+def get_admin_keyboard() -> InlineKeyboardMarkup:
+    """Get admin panel keyboard"""
+    return _ADMIN_KB
 
-Last updated: {datetime.now().strftime('%H:%M:%S')}
-"""
+async def _reply(message: Message, text: str, **kwargs):
+    """Edit the message in place, or send a new one if it can't be edited"""
+    if message.text is not None:
+        try:
+            return await message.edit_text(text, **kwargs)
+        except TelegramBadRequest as e:
+            if is_not_modified(e):
+                return None
+    return await message.answer(text, **kwargs)
+
+@router.callback_query(F.data.in_({"admin_stats", "admin_refresh"}))
+async def admin_stats_handler(callback: CallbackQuery):
+    """Show bot statistics (read from the live counters and indexes)"""
+    await callback.answer()
     
-    try:
-        await callback.message.edit_text(stats_text, reply_markup=get_admin_keyboard())
-    except TelegramBadRequest:
-        await callback.message.answer(stats_text, reply_markup=get_admin_keyboard())
+    now = datetime.now()
+    active_subs = count_active_subscriptions()
+    total_revenue = bot_stats["total_revenue"]
+    
+    stats_text = _STATS_TEMPLATE.format(
+        active=active_subs,
+        whitelisted=len(whitelisted_users),
+        total=len(user_subscriptions) + len(whitelisted_users),
+        revenue=total_revenue,
+        average=total_revenue / max(len(user_subscriptions), 1),
+        basic=len(plans_index['Basic']),
+        standard=len(plans_index['Standard']),
+        premium=len(plans_index['Premium']),
+        started=now.strftime(DATETIME_FORMAT),
+        group_id=_GROUP_ID_CODE,
+        updated=now.strftime(TIME_FORMAT)
+    )
+    
+    await _reply(callback.message, stats_text, reply_markup=get_admin_keyboard())
 
-@router.callback_query(lambda c: c.data == "admin_users")
+@router.callback_query(F.data == "admin_users")
 async def admin_users_handler(callback: CallbackQuery, state: FSMContext):
     """Manage users"""
-    user_id = callback.from_user.id
-    
-    if not is_admin(user_id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     await state.set_state(AdminStates.managing_user)
     
-    text = """
-<b>👥 User Management</b>
-
-Send me a user ID to view their details and manage their subscription.
-
-Example: <code>123456789</code>
-
-Or choose an action below:
-"""
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(text="View All Subscriptions", callback_data="admin_subs")
-    builder.button(text="View Whitelisted", callback_data="admin_whitelist_view")
-    builder.button(text="Cancel", callback_data="admin_cancel")
-    builder.adjust(1)
-    
-    try:
-        await callback.message.edit_text(text, reply_markup=builder.as_markup())
-    except TelegramBadRequest:
-        await callback.message.answer(text, reply_markup=builder.as_markup())
+    await _reply(callback.message, _USER_MANAGEMENT_TEXT, reply_markup=_USER_MANAGEMENT_KB)
 
 @router.message(AdminStates.managing_user)
 async def process_user_management(message: Message, state: FSMContext, bot: Bot):
     """Process user ID for management"""
-    if not is_admin(message.from_user.id):
-        return
-    
     try:
         target_user_id = int(message.text.strip())
     except ValueError:
@@ -183,14 +385,14 @@ async def process_user_management(message: Message, state: FSMContext, bot: Bot)
     if is_whitelisted:
         text += "✅ Whitelisted (Lifetime access)\n"
     elif subscription:
-        expires = subscription["expires_at"].strftime('%Y-%m-%d %H:%M')
-        days_left = (subscription["expires_at"] - datetime.now()).days
+        expires = subscription.expires_str
+        days_left = (subscription.expires_ts - int(time.time())) // SECONDS_PER_DAY
         text += f"✅ Active Subscription\n"
-        text += f"Plan: {subscription['plan']}\n"
+        text += f"Plan: {subscription.plan}\n"
         text += f"Expires: {expires}\n"
         text += f"Days left: {days_left}\n"
-        if "transaction_id" in subscription:
-            text += f"Transaction: {html.code(subscription['transaction_id'])}\n"
+        if subscription.transaction_id:
+            text += f"Transaction: {html.code(subscription.transaction_id)}\n"
     else:
         text += "❌ No active subscription\n"
     
@@ -199,58 +401,35 @@ async def process_user_management(message: Message, state: FSMContext, bot: Bot)
     builder = InlineKeyboardBuilder()
     
     if not is_whitelisted:
-        builder.button(text="Add to Whitelist", callback_data=f"admin_wl_add_{target_user_id}")
+        builder.button(text="Add to Whitelist", callback_data=AdminUserCallback(action="wl_add", user_id=target_user_id).pack())
     else:
-        builder.button(text="Remove from Whitelist", callback_data=f"admin_wl_del_{target_user_id}")
+        builder.button(text="Remove from Whitelist", callback_data=AdminUserCallback(action="wl_del", user_id=target_user_id).pack())
     
     if subscription:
-        builder.button(text="Extend Subscription", callback_data=f"admin_extend_{target_user_id}")
-        builder.button(text="Cancel Subscription", callback_data=f"admin_cancel_sub_{target_user_id}")
-        if "transaction_id" in subscription:
-            builder.button(text="Refund Payment", callback_data=f"admin_refund_{target_user_id}")
+        builder.button(text="Extend Subscription", callback_data=AdminUserCallback(action="extend", user_id=target_user_id).pack())
+        builder.button(text="Cancel Subscription", callback_data=AdminUserCallback(action="cancel_sub", user_id=target_user_id).pack())
+        if subscription.transaction_id:
+            builder.button(text="Refund Payment", callback_data=AdminUserCallback(action="refund", user_id=target_user_id).pack())
     
-    builder.button(text="Remove from Group", callback_data=f"admin_remove_{target_user_id}")
-    builder.button(text="Send Invite Link", callback_data=f"admin_invite_{target_user_id}")
+    builder.button(text="Remove from Group", callback_data=AdminUserCallback(action="remove", user_id=target_user_id).pack())
+    builder.button(text="Send Invite Link", callback_data=AdminUserCallback(action="invite", user_id=target_user_id).pack())
     builder.button(text="Back", callback_data="admin_users")
     builder.adjust(1)
     
     await state.clear()
     await message.answer(text, reply_markup=builder.as_markup())
 
-@router.callback_query(lambda c: c.data == "admin_whitelist_add")
+@router.callback_query(F.data == "admin_whitelist_add")
 async def admin_whitelist_add_handler(callback: CallbackQuery, state: FSMContext):
     """Start adding user to whitelist"""
-    user_id = callback.from_user.id
-    
-    if not is_admin(user_id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     await state.set_state(AdminStates.adding_whitelist)
     
-    text = """
-<b>➕ Add to Whitelist</b>
-
-Send me the user ID to add to whitelist.
-Whitelisted users have lifetime access without payment.
-
-Example: <code>123456789</code>
-
-Send /cancel to cancel.
-"""
-    
-    try:
-        await callback.message.edit_text(text)
-    except TelegramBadRequest:
-        await callback.message.answer(text)
+    await _reply(callback.message, _WHITELIST_ADD_TEXT)
 
 @router.message(AdminStates.adding_whitelist)
 async def process_whitelist_add(message: Message, state: FSMContext, bot: Bot):
     """Process adding user to whitelist"""
-    if not is_admin(message.from_user.id):
-        return
-    
     if message.text == "/cancel":
         await state.clear()
         await message.answer("Cancelled.", reply_markup=get_admin_keyboard())
@@ -263,7 +442,8 @@ async def process_whitelist_add(message: Message, state: FSMContext, bot: Bot):
         return
     
     # Add to whitelist
-    whitelisted_users.add(target_user_id)
+    if not await add_to_whitelist(target_user_id):
+        logger.warning(f"Whitelist add for {target_user_id} was not saved to the database")
     
     # Try to add to group
     added = await add_user_to_group(bot, target_user_id)
@@ -279,15 +459,9 @@ async def process_whitelist_add(message: Message, state: FSMContext, bot: Bot):
     
     logger.info(f"Admin {message.from_user.id} added user {target_user_id} to whitelist")
 
-@router.callback_query(lambda c: c.data == "admin_whitelist_remove")
+@router.callback_query(F.data == "admin_whitelist_remove")
 async def admin_whitelist_remove_handler(callback: CallbackQuery, state: FSMContext):
     """Start removing user from whitelist"""
-    user_id = callback.from_user.id
-    
-    if not is_admin(user_id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     
     if not whitelisted_users:
@@ -296,28 +470,17 @@ async def admin_whitelist_remove_handler(callback: CallbackQuery, state: FSMCont
     
     await state.set_state(AdminStates.removing_whitelist)
     
-    text = f"""
-<b>➖ Remove from Whitelist</b>
-
-Current whitelisted users:
-{chr(10).join([f'• {uid}' for uid in whitelisted_users])}
-
-Send the user ID to remove from whitelist.
-
-Send /cancel to cancel.
-"""
+    user_list = "\n".join(
+        f"• {uid}" for uid in islice(whitelisted_users, WHITELIST_DISPLAY_LIMIT)
+    )
+    if len(whitelisted_users) > WHITELIST_DISPLAY_LIMIT:
+        user_list += f"\n... and {len(whitelisted_users) - WHITELIST_DISPLAY_LIMIT} more"
     
-    try:
-        await callback.message.edit_text(text)
-    except TelegramBadRequest:
-        await callback.message.answer(text)
+    await _reply(callback.message, _WHITELIST_REMOVE_TEMPLATE.format(user_list=user_list))
 
 @router.message(AdminStates.removing_whitelist)
 async def process_whitelist_remove(message: Message, state: FSMContext, bot: Bot):
     """Process removing user from whitelist"""
-    if not is_admin(message.from_user.id):
-        return
-    
     if message.text == "/cancel":
         await state.clear()
         await message.answer("Cancelled.", reply_markup=get_admin_keyboard())
@@ -334,7 +497,8 @@ async def process_whitelist_remove(message: Message, state: FSMContext, bot: Bot
         return
     
     # Remove from whitelist
-    whitelisted_users.discard(target_user_id)
+    if not await remove_from_whitelist(target_user_id):
+        logger.warning(f"Whitelist removal for {target_user_id} was not saved to the database")
     
     # Remove from group
     removed = await remove_user_from_group(bot, target_user_id)
@@ -350,25 +514,21 @@ async def process_whitelist_remove(message: Message, state: FSMContext, bot: Bot
     
     logger.info(f"Admin {message.from_user.id} removed user {target_user_id} from whitelist")
 
-@router.callback_query(lambda c: c.data == "admin_subs")
+@router.callback_query(F.data == "admin_subs")
 async def admin_view_subscriptions(callback: CallbackQuery):
-    """View all active subscriptions"""
-    user_id = callback.from_user.id
-    
-    if not is_admin(user_id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
+    """View subscriptions, soonest expiry first"""
     await callback.answer()
     
     if not user_subscriptions:
         text = "<b>📋 No active subscriptions</b>"
     else:
         text = "<b>📋 Active Subscriptions</b>\n\n"
+        now_ts = int(time.time())
         
-        for uid, sub in list(user_subscriptions.items())[:20]:  # Limit to 20 for message length
-            expires = sub["expires_at"].strftime('%Y-%m-%d')
-            days_left = (sub["expires_at"] - datetime.now()).days
+        for expires_ts, uid in islice(expiry_index, 20):  # Limit to 20 for message length
+            sub = user_subscriptions[uid]
+            expires = sub.expires_at.strftime(DATE_FORMAT)
+            days_left = (expires_ts - now_ts) // SECONDS_PER_DAY
             
             if days_left < 0:
                 status = "❌ Expired"
@@ -377,57 +537,79 @@ async def admin_view_subscriptions(callback: CallbackQuery):
             else:
                 status = "✅ Active"
             
-            text += f"• {uid}: {sub['plan']} - {expires} ({days_left}d) {status}\n"
+            text += f"• {uid}: {sub.plan} - {expires} ({days_left}d) {status}\n"
         
         if len(user_subscriptions) > 20:
             text += f"\n... and {len(user_subscriptions) - 20} more"
     
-    builder = InlineKeyboardBuilder()
-    builder.button(text="Export CSV", callback_data="admin_export")
-    builder.button(text="Back", callback_data="admin_back")
-    builder.adjust(2)
-    
-    try:
-        await callback.message.edit_text(text, reply_markup=builder.as_markup())
-    except TelegramBadRequest:
-        await callback.message.answer(text, reply_markup=builder.as_markup())
+    await _reply(callback.message, text, reply_markup=_SUBSCRIPTIONS_KB)
+
+async def _write_subscriptions_csv(path: str) -> int:
+    """Stream subscriptions to a CSV file a chunk at a time; returns the row count"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(SUBS_CSV_HEADER)
+    rows = 0
+    
+    # Snapshot the ids only: the dict can change while we await file writes
+    user_ids = tuple(user_subscriptions)
+    
+    async with aiofiles.open(path, "w", newline="", encoding="utf-8") as f:
+        for start in range(0, len(user_ids), SUBS_CSV_CHUNK_SIZE):
+            for uid in user_ids[start:start + SUBS_CSV_CHUNK_SIZE]:
+                sub = user_subscriptions.get(uid)
+                if sub is None:
+                    continue
+                writer.writerow((
+                    uid,
+                    sub.plan,
+                    sub.expires_at.isoformat(),
+                    sub.amount,
+                    sub.currency,
+                    sub.payment_method or "",
+                    sub.transaction_id or ""
+                ))
+                rows += 1
+            await f.write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            # Header only, when there are no subscriptions
+            await f.write(buffer.getvalue())
+    
+    return rows
+
+@router.callback_query(F.data == "admin_export")
+async def admin_export_handler(callback: CallbackQuery):
+    """Export all subscriptions as a CSV document"""
+    await callback.answer("Preparing export...")
+    run_in_background(_export_subscriptions(callback.message), "admin_export")
+
+async def _export_subscriptions(message: Message):
+    """Write the subscriptions CSV and send it to the admin chat"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, f"subscriptions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        try:
+            rows = await _write_subscriptions_csv(path)
+            await message.answer_document(
+                FSInputFile(path),
+                caption=f"📋 {rows} subscriptions"
+            )
+        except Exception as e:
+            logger.error(f"Subscription export failed: {e}")
+            await message.answer("❌ Export failed.")
 
-@router.callback_query(lambda c: c.data == "admin_broadcast")
+@router.callback_query(F.data == "admin_broadcast")
 async def admin_broadcast_handler(callback: CallbackQuery, state: FSMContext):
     """Start broadcast message composition"""
-    user_id = callback.from_user.id
-    
-    if not is_admin(user_id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     await state.set_state(AdminStates.composing_broadcast)
     
-    text = """
-<b>📢 Broadcast Message</b>
-
-Send me the message you want to broadcast to all users with active subscriptions.
-
-You can use HTML formatting:
-• <code>&lt;b&gt;bold&lt;/b&gt;</code>
-• <code>&lt;i&gt;italic&lt;/i&gt;</code>
-• <code>&lt;code&gt;code&lt;/code&gt;</code>
-
-Send /cancel to cancel.
-"""
-    
-    try:
-        await callback.message.edit_text(text)
-    except TelegramBadRequest:
-        await callback.message.answer(text)
+    await _reply(callback.message, _BROADCAST_PROMPT_TEXT)
 
 @router.message(AdminStates.composing_broadcast)
 async def process_broadcast_message(message: Message, state: FSMContext):
     """Process broadcast message"""
-    if not is_admin(message.from_user.id):
-        return
-    
     if message.text == "/cancel":
         await state.clear()
         await message.answer("Broadcast cancelled.", reply_markup=get_admin_keyboard())
@@ -438,33 +620,18 @@ async def process_broadcast_message(message: Message, state: FSMContext):
     await state.set_state(AdminStates.confirming_broadcast)
     
     # Show preview
-    recipients = len(user_subscriptions) + len(whitelisted_users)
+    recipients = count_broadcast_recipients()
     
-    preview_text = f"""
-<b>📢 Broadcast Preview</b>
-
-<b>Recipients:</b> {recipients} users
-
-<b>Message:</b>
-{message.text or message.caption}
-
-Send this message to all users?
-"""
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(text="✅ Send", callback_data="admin_broadcast_send")
-    builder.button(text="❌ Cancel", callback_data="admin_broadcast_cancel")
-    builder.adjust(2)
+    preview_text = _BROADCAST_PREVIEW_TEMPLATE.format(
+        recipients=recipients,
+        message=message.text or message.caption
+    )
     
-    await message.answer(preview_text, reply_markup=builder.as_markup())
+    await message.answer(preview_text, reply_markup=_BROADCAST_CONFIRM_KB)
 
-@router.callback_query(lambda c: c.data == "admin_broadcast_send")
+@router.callback_query(F.data == "admin_broadcast_send")
 async def send_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Send broadcast to all users"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer("Sending broadcast...")
     
     data = await state.get_data()
@@ -475,60 +642,111 @@ async def send_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot):
         await state.clear()
         return
     
-    # Collect all user IDs
-    all_users = set(user_subscriptions.keys()) | whitelisted_users
+    await state.clear()
+    
+    if broadcast_queue is not None:
+        run_in_background(_send_broadcast_queued(callback.message, broadcast_text), "admin_broadcast")
+    else:
+        run_in_background(_send_broadcast(callback.message, bot, broadcast_text), "admin_broadcast")
+
+async def _send_broadcast(message: Message, bot: Bot, broadcast_text: str):
+    """Send the broadcast from this process, reporting progress in `message`"""
+    total = count_broadcast_recipients()
     
-    sent = 0
-    failed = 0
+    progress = {"sent": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
     
     # Update message
-    await callback.message.edit_text(f"📤 Sending to {len(all_users)} users...")
+    await message.edit_text(f"📤 Sending to {total} users...")
     
-    # Send to all users
-    for user_id in all_users:
-        try:
-            await bot.send_message(user_id, broadcast_text)
-            sent += 1
-        except TelegramForbiddenError:
-            # User blocked bot
-            failed += 1
-            logger.info(f"User {user_id} has blocked the bot")
-        except Exception as e:
-            failed += 1
-            logger.error(f"Failed to send to {user_id}: {e}")
-        
-        # Update progress every 10 users
-        if (sent + failed) % 10 == 0:
+    async def send_one(user_id: int) -> bool:
+        async with semaphore:
+            try:
+                await send_rate_limited(bot, user_id, broadcast_text)
+                progress["sent"] += 1
+                return True
+            except TelegramForbiddenError:
+                # User blocked bot
+                progress["failed"] += 1
+                logger.info(f"User {user_id} has blocked the bot")
+                return False
+            except Exception as e:
+                progress["failed"] += 1
+                logger.error(f"Failed to send to {user_id}: {e}")
+                return False
+    
+    async def report_progress():
+        # Periodic edits instead of one per N sends, to spare the rate limit
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
             try:
-                await callback.message.edit_text(
-                    f"📤 Progress: {sent + failed}/{len(all_users)}\n"
-                    f"✅ Sent: {sent}\n❌ Failed: {failed}"
+                await message.edit_text(
+                    f"📤 Progress: {progress['sent'] + progress['failed']}/{total}\n"
+                    f"✅ Sent: {progress['sent']}\n❌ Failed: {progress['failed']}"
                 )
-            except:
+            except Exception:
                 pass
     
-    await state.clear()
-    
-    # Final report
-    report = f"""
-<b>📢 Broadcast Complete</b>
-
-✅ Successfully sent: {sent}
-❌ Failed: {failed}
-📊 Total: {len(all_users)}
-🎯 Success rate: {(sent/len(all_users)*100):.1f}%
-"""
-    
-    await callback.message.edit_text(report, reply_markup=get_admin_keyboard())
+    # Send to all users with bounded concurrency
+    progress_task = asyncio.create_task(report_progress())
+    try:
+        # gather() consumes the generator before the first await, so the
+        # recipient dict and set can't change size under it
+        results = await asyncio.gather(*(send_one(user_id) for user_id in iter_broadcast_recipients()))
+    finally:
+        progress_task.cancel()
+    sent = sum(results)
+    failed = len(results) - sent
+    
+    await message.edit_text(
+        _broadcast_report(sent, failed, total),
+        reply_markup=get_admin_keyboard()
+    )
     logger.info(f"Broadcast completed: {sent} sent, {failed} failed")
 
-@router.callback_query(lambda c: c.data == "admin_broadcast_cancel")
+async def _send_broadcast_queued(message: Message, broadcast_text: str):
+    """Hand the broadcast to the persistent queue and report its progress"""
+    # Snapshot the IDs: enqueueing awaits between batches while the dict may change
+    broadcast_id, total = await broadcast_queue.enqueue(broadcast_text, tuple(iter_broadcast_recipients()))
+    
+    await message.edit_text(f"📤 Queued for {total} users...")
+    
+    # Workers keep draining the queue if this process restarts; only the
+    # live progress message is lost
+    sent = failed = 0
+    stalled_since = time.monotonic()
+    while sent + failed < total:
+        await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+        done = sent + failed
+        sent, failed, _ = await broadcast_queue.progress(broadcast_id)
+        if sent + failed > done:
+            stalled_since = time.monotonic()
+        elif time.monotonic() - stalled_since > BROADCAST_STALL_TIMEOUT:
+            # Sends lost in a crashed worker never get counted
+            break
+        try:
+            await message.edit_text(
+                f"📤 Progress: {sent + failed}/{total}\n"
+                f"✅ Sent: {sent}\n❌ Failed: {failed}"
+            )
+        except Exception:
+            pass
+    
+    await message.edit_text(
+        _broadcast_report(sent, failed, total),
+        reply_markup=get_admin_keyboard()
+    )
+    logger.info(f"Broadcast {broadcast_id} completed: {sent} sent, {failed} failed")
+
+def _broadcast_report(sent: int, failed: int, total: int) -> str:
+    """Final broadcast summary"""
+    return _BROADCAST_REPORT_TEMPLATE.format(
+        sent=sent, failed=failed, total=total, rate=sent / max(total, 1) * 100
+    )
+
+@router.callback_query(F.data == "admin_broadcast_cancel")
 async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
     """Cancel broadcast"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer("Broadcast cancelled")
     await state.clear()
     
@@ -538,16 +756,13 @@ async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
     )
 
 # Callback handlers for user management actions
-@router.callback_query(lambda c: c.data and c.data.startswith("admin_wl_add_"))
-async def callback_whitelist_add_user(callback: CallbackQuery, bot: Bot):
+@router.callback_query(AdminUserCallback.filter(F.action == "wl_add"))
+async def callback_whitelist_add_user(callback: CallbackQuery, callback_data: AdminUserCallback, bot: Bot):
     """Add specific user to whitelist"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
-    target_user_id = int(callback.data.split("_")[3])
+    target_user_id = callback_data.user_id
     
-    whitelisted_users.add(target_user_id)
+    if not await add_to_whitelist(target_user_id):
+        logger.warning(f"Whitelist add for {target_user_id} was not saved to the database")
     added = await add_user_to_group(bot, target_user_id)
     
     status = "and added to group" if added else "but could not add to group"
@@ -557,14 +772,10 @@ async def callback_whitelist_add_user(callback: CallbackQuery, bot: Bot):
     # Refresh the user info
     await callback.message.edit_reply_markup(reply_markup=None)
 
-@router.callback_query(lambda c: c.data and c.data.startswith("admin_remove_"))
-async def callback_remove_from_group(callback: CallbackQuery, bot: Bot):
+@router.callback_query(AdminUserCallback.filter(F.action == "remove"))
+async def callback_remove_from_group(callback: CallbackQuery, callback_data: AdminUserCallback, bot: Bot):
     """Remove user from group"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
-    target_user_id = int(callback.data.split("_")[2])
+    target_user_id = callback_data.user_id
     
     removed = await remove_user_from_group(bot, target_user_id)
     
@@ -573,14 +784,10 @@ async def callback_remove_from_group(callback: CallbackQuery, bot: Bot):
     else:
         await callback.answer("❌ Failed to remove user", show_alert=True)
 
-@router.callback_query(lambda c: c.data and c.data.startswith("admin_invite_"))
-async def callback_send_invite(callback: CallbackQuery, bot: Bot):
+@router.callback_query(AdminUserCallback.filter(F.action == "invite"))
+async def callback_send_invite(callback: CallbackQuery, callback_data: AdminUserCallback, bot: Bot):
     """Send invite link to user"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
-    target_user_id = int(callback.data.split("_")[2])
+    target_user_id = callback_data.user_id
     
     added = await add_user_to_group(bot, target_user_id)
     
@@ -589,44 +796,22 @@ async def callback_send_invite(callback: CallbackQuery, bot: Bot):
     else:
         await callback.answer("❌ Failed to send invite", show_alert=True)
 
-@router.callback_query(lambda c: c.data == "admin_back")
+@router.callback_query(F.data == "admin_back")
 async def admin_back_handler(callback: CallbackQuery):
     """Go back to admin menu"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     
-    text = """
-<b>Admin Panel</b>
+    await _reply(callback.message, _ADMIN_PANEL_TEXT, reply_markup=get_admin_keyboard())
 
-Welcome to the admin control panel.
-Choose an action from the menu below:
-"""
-    
-    try:
-        await callback.message.edit_text(text, reply_markup=get_admin_keyboard())
-    except TelegramBadRequest:
-        await callback.message.answer(text, reply_markup=get_admin_keyboard())
-
-@router.callback_query(lambda c: c.data == "admin_close")
+@router.callback_query(F.data == "admin_close")
 async def admin_close_handler(callback: CallbackQuery):
     """Close admin panel"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     await callback.message.delete()
 
-@router.callback_query(lambda c: c.data == "admin_cancel")
+@router.callback_query(F.data == "admin_cancel")
 async def admin_cancel_action(callback: CallbackQuery, state: FSMContext):
     """Cancel current admin action"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer("Action cancelled")
     await state.clear()
     
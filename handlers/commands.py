@@ -3,40 +3,249 @@ Command Handlers Module
 Handles basic bot commands like /start, /help, /status, /subscribe
 """
 
+import asyncio
 import logging
-from datetime import datetime
-from typing import Optional
-
-from aiogram import Router, html, Bot
-from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime, time as dtime
+from functools import lru_cache
+from typing import Awaitable, Callable, NamedTuple, Optional, Dict, List, Set, Tuple, Union
+
+from cachetools import TTLCache
+from aiogram import Router, F, html, Bot
+from aiogram.filters import BaseFilter, CommandStart, Command
+from aiogram.types import (
+    Message, CallbackQuery, ChatMemberUpdated, InlineKeyboardMarkup, InlineKeyboardButton
+)
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 
 logger = logging.getLogger(__name__)
 
 # Create router for command handlers
 router = Router(name="commands")
 
-# Import config from main
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import os
-
-# Configuration
+# Configuration (read once at import)
 GROUP_ID = int(os.getenv("GROUP_ID", "-1002384609773"))
 ADMIN_USER_ID = int(os.getenv("ADMIN_USER_ID", "306145881"))
-
-# In-memory storage for user subscriptions (replace with database in production)
-# Format: {user_id: {"expires_at": datetime, "plan": str, "transaction_id": str}}
-user_subscriptions = {}
-
-# Whitelist for grandfathered users (replace with database in production)
+ADMIN_USER_IDS = frozenset((ADMIN_USER_ID,))
+
+def is_admin(user_id: int) -> bool:
+    """Check if user is admin"""
+    return user_id in ADMIN_USER_IDS
+
+class IsAdmin(BaseFilter):
+    """Filter passing only updates sent by an admin"""
+    
+    async def __call__(self, event: Union[Message, CallbackQuery]) -> bool:
+        return event.from_user is not None and is_admin(event.from_user.id)
+
+# Subscription plans offered by the bot (main.config["subscription_plans"] points here)
+SUBSCRIPTION_PLANS = {
+    "basic": {"stars": 50, "days": 7, "name": "Basic (7 days)"},
+    "standard": {"stars": 100, "days": 30, "name": "Standard (30 days)"},
+    "premium": {"stars": 500, "days": 180, "name": "Premium (6 months)"}
+}
+
+from database.supabase_client import SupabaseClient, SubscriptionStatus
+
+class Subscription(NamedTuple):
+    """
+    A user's subscription as kept in memory
+    
+    Immutable: changing a subscription means saving a new one.
+    expires_ts (epoch seconds) and expires_str are derived from expires_at
+    by save_subscription: comparisons use the former, messages show the latter.
+    """
+    plan: str
+    expires_at: Optional[datetime]
+    expires_ts: float
+    expires_str: str
+    transaction_id: Optional[str] = None
+    amount: int = 0
+    currency: str = ""
+    payment_method: Optional[str] = ""
+    purchased_at: Optional[datetime] = None
+    status: str = "active"
+
+# Stand-in subscription reported for whitelisted users
+WHITELISTED_SUBSCRIPTION = Subscription(
+    plan="Lifetime", expires_at=None, expires_ts=float("inf"), expires_str="never", status="whitelisted"
+)
+
+# In-memory index of user subscriptions, restored from the database at startup
+user_subscriptions: Dict[int, Subscription] = {}
+SECONDS_PER_DAY = 86400
+EXPIRY_DISPLAY_FORMAT = "%Y-%m-%d %H:%M"
+
+# Seconds between sweeps that drop expired subscriptions from memory
+EXPIRY_SWEEP_INTERVAL = 60
+
+# Group membership rarely changes between a user's clicks, so lookups are
+# cached briefly and concurrent lookups for one user share a single request
+MEMBERSHIP_CACHE_SIZE = 10_000
+MEMBERSHIP_CACHE_TTL = 30
+MEMBER_STATUSES = frozenset(("member", "administrator", "creator"))
+ADMIN_STATUSES = frozenset(("administrator", "creator"))
+_membership_cache: TTLCache = TTLCache(maxsize=MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL)
+_membership_lookups: Dict[int, asyncio.Task] = {}
+# Users known to be in the group, kept current by chat_member updates so
+# lookups for them never reach the API
+_group_members: Set[int] = set()
+
+# Whitelist for grandfathered users, persisted via add_to_whitelist/remove_from_whitelist
 whitelisted_users = set()
 
-def get_main_keyboard() -> InlineKeyboardMarkup:
-    """Create main menu keyboard"""
+# Live statistics and indexes, kept current by save_subscription/drop_subscription
+PLAN_TIERS = ("Basic", "Standard", "Premium")
+bot_stats = {
+    "total_revenue": 0,
+    "messages_sent": 0
+}
+# plan tier -> user IDs subscribed to it
+plans_index: Dict[str, Set[int]] = defaultdict(set)
+# (expires_ts, user_id) pairs, kept sorted for range queries by expiry
+expiry_index: List[Tuple[int, int]] = []
+
+def _plan_tier(plan: str) -> Optional[str]:
+    """Get the plan tier named in a plan title"""
+    for tier in PLAN_TIERS:
+        if tier in plan:
+            return tier
+    return None
+
+def _index_subscription(user_id: int, sub: Subscription):
+    """Add a subscription to the live counters and indexes"""
+    bot_stats["total_revenue"] += sub.amount
+    tier = _plan_tier(sub.plan)
+    if tier:
+        plans_index[tier].add(user_id)
+    insort(expiry_index, (sub.expires_ts, user_id))
+
+def _uncount_subscription(user_id: int, sub: Subscription):
+    """Remove a subscription from the live counters and the plan index"""
+    bot_stats["total_revenue"] -= sub.amount
+    tier = _plan_tier(sub.plan)
+    if tier:
+        plans_index[tier].discard(user_id)
+
+def _unindex_subscription(user_id: int, sub: Subscription):
+    """Remove a subscription from the live counters and indexes"""
+    _uncount_subscription(user_id, sub)
+    entry = (sub.expires_ts, user_id)
+    pos = bisect_left(expiry_index, entry)
+    if pos < len(expiry_index) and expiry_index[pos] == entry:
+        del expiry_index[pos]
+
+def save_subscription(user_id: int, fields: dict) -> Subscription:
+    """
+    Store a user's subscription, replacing any previous one
+    
+    Args:
+        user_id: Telegram user ID
+        fields: Subscription fields; "plan" and "expires_at" are required
+    """
+    expires_at = fields["expires_at"]
+    sub = Subscription(
+        expires_ts=int(expires_at.timestamp()),
+        expires_str=expires_at.strftime(EXPIRY_DISPLAY_FORMAT),
+        **fields
+    )
+    old = user_subscriptions.get(user_id)
+    if old is not None:
+        _unindex_subscription(user_id, old)
+    user_subscriptions[user_id] = sub
+    _index_subscription(user_id, sub)
+    return sub
+
+def drop_subscription(user_id: int):
+    """Remove a user's subscription if present"""
+    sub = user_subscriptions.pop(user_id, None)
+    if sub is not None:
+        _unindex_subscription(user_id, sub)
+
+# Database the whitelist is persisted to (will be set from main.py)
+db_client: Optional[SupabaseClient] = None
+
+def set_db_client(client: SupabaseClient):
+    """Set the database client used to persist whitelist changes"""
+    global db_client
+    db_client = client
+    logger.info("Database client configured in command handlers")
+
+async def load_persisted_state(client: SupabaseClient) -> Tuple[int, int]:
+    """
+    Rebuild the in-memory whitelist and subscriptions from the database
+    
+    The database stores expiry as a date, so subscriptions are restored as
+    ending at the close of that day. Plan names aren't stored there, so
+    restored subscriptions don't count towards a plan tier.
+    
+    Returns:
+        Tuple of (whitelisted_count, subscription_count)
+    """
+    whitelisted = subscribed = 0
+    for user in await client.get_active_users():
+        if user.subscription_status == SubscriptionStatus.WHITELISTED.value:
+            whitelisted_users.add(user.telegram_id)
+            whitelisted += 1
+        elif user.next_payment_date and user.telegram_id not in user_subscriptions:
+            save_subscription(user.telegram_id, {
+                "plan": "Restored",
+                "expires_at": datetime.combine(user.next_payment_date, dtime.max),
+                "payment_method": user.payment_method,
+                "transaction_id": user.stars_transaction_id or None
+            })
+            subscribed += 1
+    return whitelisted, subscribed
+
+async def add_to_whitelist(user_id: int, username: Optional[str] = None) -> bool:
+    """Whitelist a user and persist the change; returns False if the database write failed"""
+    whitelisted_users.add(user_id)
+    if db_client is None:
+        return True
+    return await db_client.whitelist_user(user_id, username)
+
+async def remove_from_whitelist(user_id: int) -> bool:
+    """Remove a user from the whitelist and persist the change; returns False if the database write failed"""
+    whitelisted_users.discard(user_id)
+    if db_client is None:
+        return True
+    return await db_client.remove_from_whitelist(user_id)
+
+def sweep_expired_subscriptions() -> int:
+    """Drop every expired subscription; returns how many were removed"""
+    # expiry_index is sorted, so the expired entries are one prefix of it
+    end = bisect_right(expiry_index, (int(time.time()), float("inf")))
+    if not end:
+        return 0
+    expired = expiry_index[:end]
+    del expiry_index[:end]
+    for _, user_id in expired:
+        sub = user_subscriptions.pop(user_id, None)
+        if sub is not None:
+            _uncount_subscription(user_id, sub)
+    return end
+
+async def run_expiry_sweeper(interval: float = EXPIRY_SWEEP_INTERVAL):
+    """Periodically drop expired subscriptions so memory stays bounded to active ones"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = sweep_expired_subscriptions()
+            if removed:
+                logger.info("Dropped %s expired subscriptions", removed)
+        except Exception as e:
+            logger.error("Error sweeping expired subscriptions: %s", e)
+
+def count_active_subscriptions() -> int:
+    """Count subscriptions that have not expired yet"""
+    return len(expiry_index) - bisect_right(expiry_index, (int(time.time()), float("inf")))
+
+def _build_main_keyboard() -> InlineKeyboardMarkup:
+    """Build main menu keyboard"""
     builder = InlineKeyboardBuilder()
     
     builder.button(text="Subscribe", callback_data="menu_subscribe")
@@ -47,12 +256,12 @@ def get_main_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(2, 2)  # 2 buttons per row
     return builder.as_markup()
 
-def get_subscription_keyboard() -> InlineKeyboardMarkup:
-    """Create subscription options keyboard"""
+def _build_subscription_keyboard() -> InlineKeyboardMarkup:
+    """Build subscription options keyboard"""
     builder = InlineKeyboardBuilder()
     
     # Add subscription plans
-    for plan_id, plan_info in config["subscription_plans"].items():
+    for plan_id, plan_info in SUBSCRIPTION_PLANS.items():
         builder.button(
             text=f"{plan_info['stars']} Stars - {plan_info['name']}",
             callback_data=f"plan_{plan_id}"
@@ -65,77 +274,19 @@ def get_subscription_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(1)  # 1 button per row
     return builder.as_markup()
 
-async def check_user_in_group(bot: Bot, user_id: int) -> bool:
-    """Check if user is member of the group"""
-    try:
-        member = await bot.get_chat_member(GROUP_ID, user_id)
-        return member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        logger.error(f"Failed to check user {user_id} in group: {e}")
-        return False
-
-async def check_user_subscription(user_id: int) -> Optional[dict]:
-    """Check if user has active subscription"""
-    if user_id in whitelisted_users:
-        return {"status": "whitelisted", "expires_at": None}
-    
-    if user_id in user_subscriptions:
-        sub = user_subscriptions[user_id]
-        if sub["expires_at"] > datetime.now():
-            return sub
-        else:
-            # Subscription expired, remove from dict
-            del user_subscriptions[user_id]
-    
-    return None
-
-@router.message(CommandStart())
-async def command_start_handler(message: Message, bot: Bot):
-    """Handle /start command"""
-    user = message.from_user
-    logger.info(f"User {user.id} (@{user.username}) started bot")
-    
-    # Check if user is in group
-    is_member = await check_user_in_group(bot, user.id)
-    
-    # Create personalized welcome message
-    welcome_text = f"""
-Welcome, {html.bold(user.full_name)}!
+# Static menus are immutable, so build them once at import
+_MAIN_KB = _build_main_keyboard()
+_SUBSCRIPTION_KB = _build_subscription_keyboard()
 
-This bot manages access to our exclusive Telegram group.
+def get_main_keyboard() -> InlineKeyboardMarkup:
+    """Get main menu keyboard"""
+    return _MAIN_KB
 
-"""
-    
-    if is_member:
-        # Check subscription status
-        subscription = await check_user_subscription(user.id)
-        if subscription:
-            if subscription.get("status") == "whitelisted":
-                welcome_text += "You have lifetime access to the group!"
-            else:
-                expires = subscription["expires_at"].strftime("%Y-%m-%d %H:%M")
-                welcome_text += f"Your subscription is active until: {html.code(expires)}"
-        else:
-            welcome_text += "You're in the group but don't have an active subscription.\nPlease subscribe to maintain access."
-    else:
-        welcome_text += """You're not currently in our group.
-Subscribe now to get instant access to:
-• Exclusive content
-• Priority support
-• Community discussions
-• Premium features"""
-    
-    await message.answer(
-        welcome_text,
-        reply_markup=get_main_keyboard()
-    )
+def get_subscription_keyboard() -> InlineKeyboardMarkup:
+    """Get subscription options keyboard"""
+    return _SUBSCRIPTION_KB
 
-@router.message(Command("subscribe"))
-async def command_subscribe_handler(message: Message):
-    """Handle /subscribe command"""
-    logger.info(f"User {message.from_user.id} requested subscription options")
-    
-    subscription_text = """
+SUBSCRIPTION_TEXT = """
 <b>Available Subscription Plans:</b>
 
 <b>Basic</b> - 50 Stars
@@ -152,55 +303,8 @@ async def command_subscribe_handler(message: Message):
 
 Choose your preferred plan below:
 """
-    
-    await message.answer(
-        subscription_text,
-        reply_markup=get_subscription_keyboard()
-    )
 
-@router.message(Command("status"))
-async def command_status_handler(message: Message, bot: Bot):
-    """Handle /status command"""
-    user_id = message.from_user.id
-    logger.info(f"User {user_id} checking status")
-    
-    # Check group membership
-    is_member = await check_user_in_group(bot, user_id)
-    
-    # Check subscription
-    subscription = await check_user_subscription(user_id)
-    
-    status_text = f"<b>Your Status</b>\n\n"
-    status_text += f"User ID: {html.code(str(user_id))}\n"
-    status_text += f"Group Access: {'✅ Active' if is_member else '❌ Not a member'}\n"
-    
-    if subscription:
-        if subscription.get("status") == "whitelisted":
-            status_text += "Subscription: ✅ Lifetime access\n"
-        else:
-            expires = subscription["expires_at"].strftime("%Y-%m-%d %H:%M")
-            days_left = (subscription["expires_at"] - datetime.now()).days
-            status_text += f"Subscription: ✅ Active\n"
-            status_text += f"Plan: {subscription.get('plan', 'Unknown')}\n"
-            status_text += f"Expires: {html.code(expires)}\n"
-            status_text += f"Days remaining: {days_left}\n"
-    else:
-        status_text += "Subscription: ❌ Not active\n"
-    
-    keyboard = InlineKeyboardBuilder()
-    if not subscription:
-        keyboard.button(text="Subscribe Now", callback_data="menu_subscribe")
-    keyboard.button(text="Refresh Status", callback_data="refresh_status")
-    keyboard.adjust(1)
-    
-    await message.answer(status_text, reply_markup=keyboard.as_markup())
-
-@router.message(Command("help"))
-async def command_help_handler(message: Message):
-    """Handle /help command"""
-    logger.info(f"User {message.from_user.id} requested help")
-    
-    help_text = """
+HELP_TEXT = """
 <b>Available Commands:</b>
 
 /start - Start the bot and see main menu
@@ -235,20 +339,325 @@ A: Subscriptions are one-time purchases, not recurring.
 Q: I paid but didn't get access?
 A: Contact support with your payment details.
 """
+
+QUICK_HELP_TEXT = """
+<b>Quick Help</b>
+
+• To subscribe: Click "Subscribe" and choose a plan
+• Payment methods: Stars or Card
+• Check status: Click "Check Status"
+• Contact support: @username
+
+For detailed help, use /help command.
+"""
+
+_WELCOME_HEADER = """
+Welcome, {name}!
+
+This bot manages access to our exclusive Telegram group.
+
+"""
+_WELCOME_WHITELISTED_TEMPLATE = _WELCOME_HEADER + "You have lifetime access to the group!"
+_WELCOME_MEMBER_SUB_TEMPLATE = _WELCOME_HEADER + "Your subscription is active until: {expires}"
+_WELCOME_MEMBER_NOSUB_TEMPLATE = _WELCOME_HEADER + (
+    "You're in the group but don't have an active subscription.\n"
+    "Please subscribe to maintain access."
+)
+_WELCOME_NONMEMBER_TEMPLATE = _WELCOME_HEADER + """You're not currently in our group.
+Subscribe now to get instant access to:
+• Exclusive content
+• Priority support
+• Community discussions
+• Premium features"""
+
+_WELCOME_BACK_TEMPLATE = """
+Welcome back, {name}!
+
+What would you like to do?
+"""
+
+def _build_quick_help_keyboard() -> InlineKeyboardMarkup:
+    """Build quick help keyboard"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Back to Menu", callback_data="back_main")
+    return builder.as_markup()
+
+_QUICK_HELP_KB = _build_quick_help_keyboard()
+
+# Telegram's error description when an edit wouldn't change anything
+MESSAGE_NOT_MODIFIED = "Bad Request: message is not modified"
+
+def is_not_modified(error: TelegramBadRequest) -> bool:
+    """Check whether an edit failed only because the content was unchanged"""
+    return error.message.startswith(MESSAGE_NOT_MODIFIED)
+
+# Menu edits go through one rate-limited sender; repeated clicks on the same
+# message before its edit goes out collapse into a single API call
+EDIT_RATE_LIMIT = 30
+_edit_queue: "asyncio.Queue[Tuple[int, int]]" = asyncio.Queue()
+_pending_edits: Dict[Tuple[int, int], Tuple[Message, str, Optional[InlineKeyboardMarkup]]] = {}
+_edit_sender_running = False
+
+async def _apply_edit(message: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup]):
+    """Edit a message, ignoring "message is not modified" errors"""
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if not is_not_modified(e):
+            logger.error("Failed to edit message: %s", e)
+
+async def edit_if_changed(message: Message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+    """Edit a message, skipping the API call when it already shows this text and keyboard"""
+    # Telegram strips surrounding whitespace, so compare against the stripped text
+    if message.reply_markup == reply_markup and message.html_text == text.strip():
+        return
+    if not _edit_sender_running:
+        await _apply_edit(message, text, reply_markup)
+        return
+    key = (message.chat.id, message.message_id)
+    if key not in _pending_edits:
+        _edit_queue.put_nowait(key)
+    # The latest requested content wins
+    _pending_edits[key] = (message, text, reply_markup)
+
+async def run_edit_sender(rate: int = EDIT_RATE_LIMIT):
+    """Deliver queued message edits, at most `rate` per second"""
+    global _edit_sender_running
+    _edit_sender_running = True
+    interval = 1 / rate
+    next_slot = time.monotonic()
+    try:
+        while True:
+            key = await _edit_queue.get()
+            message, text, reply_markup = _pending_edits.pop(key)
+            await asyncio.sleep(max(0, next_slot - time.monotonic()))
+            next_slot = time.monotonic() + interval
+            try:
+                await _apply_edit(message, text, reply_markup)
+            except TelegramRetryAfter as e:
+                logger.warning("Flood control hit, delaying edits for %ss", e.retry_after)
+                next_slot = time.monotonic() + e.retry_after
+                if key not in _pending_edits:
+                    _edit_queue.put_nowait(key)
+                    _pending_edits[key] = (message, text, reply_markup)
+            except Exception as e:
+                logger.error("Error sending queued edit: %s", e)
+    finally:
+        _edit_sender_running = False
+
+_STATUS_HEADER = "<b>Your Status</b>\n\nUser ID: "
+_GROUP_ACCESS_LINE = ("\nGroup Access: ❌ Not a member\n", "\nGroup Access: ✅ Active\n")
+
+# Rendered status texts kept for repeated /status and refresh clicks
+STATUS_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=STATUS_CACHE_SIZE)
+def _render_status_cached(
+    user_id: int,
+    is_member: bool,
+    whitelisted: bool,
+    plan: Optional[str],
+    expires_str: Optional[str],
+    days_left: Optional[int]
+) -> str:
+    """Build the status text from hashable inputs (no subscription: plan and expiry are None)"""
+    parts = [_STATUS_HEADER, html.code(str(user_id)), _GROUP_ACCESS_LINE[is_member]]
+    
+    if whitelisted:
+        parts.append("Subscription: ✅ Lifetime access\n")
+    elif expires_str is not None:
+        parts += (
+            "Subscription: ✅ Active\n",
+            "Plan: ", str(plan), "\n",
+            "Expires: ", html.code(expires_str), "\n",
+            "Days remaining: ", str(days_left), "\n"
+        )
+    else:
+        parts.append("Subscription: ❌ Not active\n")
     
-    await message.answer(help_text, reply_markup=get_main_keyboard())
+    return "".join(parts)
 
-@router.message(Command("admin"))
-async def command_admin_handler(message: Message):
-    """Handle /admin command - only for administrators"""
+def _render_status(user_id: int, is_member: bool, subscription: Optional[Subscription]) -> str:
+    """Build the /status and status-menu text"""
+    if not subscription:
+        return _render_status_cached(user_id, is_member, False, None, None, None)
+    if subscription.status == "whitelisted":
+        return _render_status_cached(user_id, is_member, True, None, None, None)
+    # days_left is part of the key, so cached texts never show a stale count
+    days_left = (subscription.expires_ts - int(time.time())) // SECONDS_PER_DAY
+    return _render_status_cached(
+        user_id, is_member, False,
+        subscription.plan, subscription.expires_str, days_left
+    )
+
+def _build_status_keyboard(subscribed: bool, from_menu: bool) -> InlineKeyboardMarkup:
+    """Build status keyboard"""
+    builder = InlineKeyboardBuilder()
+    if not subscribed:
+        builder.button(text="Subscribe Now", callback_data="menu_subscribe")
+    if from_menu:
+        builder.button(text="Back to Menu", callback_data="back_main")
+    else:
+        builder.button(text="Refresh Status", callback_data="refresh_status")
+    builder.adjust(1)
+    return builder.as_markup()
+
+# Keyed by (subscribed, from_menu)
+_STATUS_KB = {
+    (subscribed, from_menu): _build_status_keyboard(subscribed, from_menu)
+    for subscribed in (False, True)
+    for from_menu in (False, True)
+}
+
+async def _fetch_membership(bot: Bot, user_id: int) -> bool:
+    """Ask Telegram whether a user is in the group, caching successful answers"""
+    try:
+        member = await bot.get_chat_member(GROUP_ID, user_id)
+    except Exception as e:
+        logger.error("Failed to check user %s in group: %s", user_id, e)
+        return False
+    finally:
+        _membership_lookups.pop(user_id, None)
+    
+    # Only chat_member updates add to _group_members: without them (bot not
+    # a group admin) a polled "member" answer would never be revisited
+    is_member = member.status in MEMBER_STATUSES
+    _membership_cache[user_id] = is_member
+    return is_member
+
+async def check_user_in_group(bot: Bot, user_id: int) -> bool:
+    """Check if user is member of the group"""
+    if user_id in _group_members:
+        return True
+    is_member = _membership_cache.get(user_id)
+    if is_member is not None:
+        return is_member
+    
+    task = _membership_lookups.get(user_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_membership(bot, user_id))
+        _membership_lookups[user_id] = task
+    # Shielded so one cancelled caller doesn't cancel the shared lookup
+    return await asyncio.shield(task)
+
+def forget_membership(user_id: int):
+    """Drop a cached membership answer after the bot changes it"""
+    _group_members.discard(user_id)
+    _membership_cache.pop(user_id, None)
+
+async def warm_group_members(bot: Bot) -> int:
+    """Seed the member set with the group's administrators; returns how many were added"""
+    admins = await bot.get_chat_administrators(GROUP_ID)
+    for admin in admins:
+        _group_members.add(admin.user.id)
+    return len(admins)
+
+@router.chat_member(F.chat.id == GROUP_ID)
+async def group_member_updated(event: ChatMemberUpdated):
+    """Track joins and leaves pushed by Telegram (the bot must be a group admin)"""
+    user_id = event.new_chat_member.user.id
+    _membership_cache.pop(user_id, None)
+    if event.new_chat_member.status in MEMBER_STATUSES:
+        _group_members.add(user_id)
+    else:
+        _group_members.discard(user_id)
+        _membership_cache[user_id] = False
+
+@router.my_chat_member(F.chat.id == GROUP_ID)
+async def bot_member_updated(event: ChatMemberUpdated):
+    """Stop trusting the member set once the bot no longer gets chat_member updates"""
+    # Only administrators receive chat_member updates; after that the set
+    # would go stale, so lookups fall back to get_chat_member instead
+    if event.new_chat_member.status not in ADMIN_STATUSES:
+        _group_members.clear()
+        logger.warning("Bot lost admin rights in group %s: %s", GROUP_ID, event.new_chat_member.status)
+
+async def check_user_subscription(user_id: int) -> Optional[Subscription]:
+    """Check if user has active subscription"""
+    if user_id in whitelisted_users:
+        return WHITELISTED_SUBSCRIPTION
+    
+    sub = user_subscriptions.get(user_id)
+    if sub is not None:
+        if sub.expires_ts > time.time():
+            return sub
+        else:
+            # Expired since the last sweep, remove from dict
+            drop_subscription(user_id)
+    
+    return None
+
+@router.message(CommandStart())
+async def command_start_handler(message: Message, bot: Bot):
+    """Handle /start command"""
+    user = message.from_user
+    logger.info("User %s (@%s) started bot", user.id, user.username)
+    
+    if user.id in whitelisted_users:
+        # Whitelisted users get the lifetime-access greeting whatever their
+        # membership, so skip the lookup
+        is_member, subscription = True, await check_user_subscription(user.id)
+    else:
+        # Check group membership and subscription concurrently
+        is_member, subscription = await asyncio.gather(
+            check_user_in_group(bot, user.id),
+            check_user_subscription(user.id)
+        )
+    
+    # Create personalized welcome message
+    name = html.bold(user.full_name)
+    if not is_member:
+        welcome_text = _WELCOME_NONMEMBER_TEMPLATE.format(name=name)
+    elif not subscription:
+        welcome_text = _WELCOME_MEMBER_NOSUB_TEMPLATE.format(name=name)
+    elif subscription.status == "whitelisted":
+        welcome_text = _WELCOME_WHITELISTED_TEMPLATE.format(name=name)
+    else:
+        welcome_text = _WELCOME_MEMBER_SUB_TEMPLATE.format(
+            name=name, expires=html.code(subscription.expires_str)
+        )
+    
+    await message.answer(
+        welcome_text,
+        reply_markup=_MAIN_KB
+    )
+
+@router.message(Command("subscribe"))
+async def command_subscribe_handler(message: Message):
+    """Handle /subscribe command"""
+    logger.info("User %s requested subscription options", message.from_user.id)
+    
+    await message.answer(SUBSCRIPTION_TEXT, reply_markup=_SUBSCRIPTION_KB)
+
+@router.message(Command("status"))
+async def command_status_handler(message: Message, bot: Bot):
+    """Handle /status command"""
     user_id = message.from_user.id
+    logger.info("User %s checking status", user_id)
     
-    if user_id != ADMIN_USER_ID:
-        await message.answer("❌ You don't have permission to use this command.")
-        logger.warning(f"Unauthorized admin access attempt by user {user_id}")
-        return
+    # Check group membership and subscription concurrently
+    is_member, subscription = await asyncio.gather(
+        check_user_in_group(bot, user_id),
+        check_user_subscription(user_id)
+    )
     
-    logger.info(f"Admin {user_id} accessed admin panel")
+    await message.answer(
+        _render_status(user_id, is_member, subscription),
+        reply_markup=_STATUS_KB[bool(subscription), False]
+    )
+
+@router.message(Command("help"))
+async def command_help_handler(message: Message):
+    """Handle /help command"""
+    logger.info("User %s requested help", message.from_user.id)
+    
+    await message.answer(HELP_TEXT, reply_markup=_MAIN_KB)
+
+@router.message(Command("admin"), IsAdmin())
+async def command_admin_handler(message: Message):
+    """Handle /admin command - only for administrators"""
+    user_id = message.from_user.id
+    logger.info("Admin %s accessed admin panel", user_id)
     
     admin_text = """
 <b>Admin Panel</b>
@@ -268,130 +677,67 @@ Choose an action from the menu below:
     
     await message.answer(admin_text, reply_markup=builder.as_markup())
 
-# Callback query handlers for menu navigation
-@router.callback_query(lambda c: c.data == "menu_subscribe")
-async def callback_menu_subscribe(callback: Message):
+@router.message(Command("admin"))
+async def command_admin_denied(message: Message):
+    """Reject /admin from everyone the admin filter turned away"""
+    await message.answer("❌ You don't have permission to use this command.")
+    logger.warning("Unauthorized admin access attempt by user %s", message.from_user.id)
+
+# Callback query handlers for menu navigation, dispatched by callback data
+async def _do_menu_subscribe(callback: CallbackQuery, bot: Bot):
     """Handle subscribe menu callback"""
     await callback.answer()
     
-    subscription_text = """
-<b>Available Subscription Plans:</b>
-
-<b>Basic</b> - 50 Stars
-• 7 days access
-• Perfect for trying out
-
-<b>Standard</b> - 100 Stars
-• 30 days access
-• Most popular choice
-
-<b>Premium</b> - 500 Stars
-• 180 days access
-• Best value!
+    await edit_if_changed(callback.message, SUBSCRIPTION_TEXT, reply_markup=_SUBSCRIPTION_KB)
 
-Choose your preferred plan below:
-"""
+async def _show_status(callback: CallbackQuery, bot: Bot):
+    """Edit the menu message to show the user's status"""
+    user_id = callback.from_user.id
     
-    try:
-        await callback.message.edit_text(
-            subscription_text,
-            reply_markup=get_subscription_keyboard()
-        )
-    except TelegramBadRequest as e:
-        if "message is not modified" not in str(e):
-            logger.error(f"Failed to edit message: {e}")
+    # Check group membership and subscription concurrently
+    is_member, subscription = await asyncio.gather(
+        check_user_in_group(bot, user_id),
+        check_user_subscription(user_id)
+    )
+    
+    await edit_if_changed(
+        callback.message,
+        _render_status(user_id, is_member, subscription),
+        reply_markup=_STATUS_KB[bool(subscription), True]
+    )
 
-@router.callback_query(lambda c: c.data == "menu_status")
-async def callback_menu_status(callback: Message, bot: Bot):
+async def _do_menu_status(callback: CallbackQuery, bot: Bot):
     """Handle status menu callback"""
     await callback.answer()
-    user_id = callback.from_user.id
-    
-    # Check group membership
-    is_member = await check_user_in_group(bot, user_id)
-    
-    # Check subscription
-    subscription = await check_user_subscription(user_id)
-    
-    status_text = f"<b>Your Status</b>\n\n"
-    status_text += f"User ID: {html.code(str(user_id))}\n"
-    status_text += f"Group Access: {'✅ Active' if is_member else '❌ Not a member'}\n"
-    
-    if subscription:
-        if subscription.get("status") == "whitelisted":
-            status_text += "Subscription: ✅ Lifetime access\n"
-        else:
-            expires = subscription["expires_at"].strftime("%Y-%m-%d %H:%M")
-            days_left = (subscription["expires_at"] - datetime.now()).days
-            status_text += f"Subscription: ✅ Active\n"
-            status_text += f"Plan: {subscription.get('plan', 'Unknown')}\n"
-            status_text += f"Expires: {html.code(expires)}\n"
-            status_text += f"Days remaining: {days_left}\n"
-    else:
-        status_text += "Subscription: ❌ Not active\n"
-    
-    keyboard = InlineKeyboardBuilder()
-    if not subscription:
-        keyboard.button(text="Subscribe Now", callback_data="menu_subscribe")
-    keyboard.button(text="Back to Menu", callback_data="back_main")
-    keyboard.adjust(1)
-    
-    try:
-        await callback.message.edit_text(status_text, reply_markup=keyboard.as_markup())
-    except TelegramBadRequest as e:
-        if "message is not modified" not in str(e):
-            logger.error(f"Failed to edit message: {e}")
+    await _show_status(callback, bot)
 
-@router.callback_query(lambda c: c.data == "menu_help")
-async def callback_menu_help(callback: Message):
+async def _do_menu_help(callback: CallbackQuery, bot: Bot):
     """Handle help menu callback"""
     await callback.answer()
     
-    help_text = """
-<b>Quick Help</b>
+    await edit_if_changed(callback.message, QUICK_HELP_TEXT, reply_markup=_QUICK_HELP_KB)
 
-• To subscribe: Click "Subscribe" and choose a plan
-• Payment methods: Stars or Card
-• Check status: Click "Check Status"
-• Contact support: @username
-
-For detailed help, use /help command.
-"""
-    
-    keyboard = InlineKeyboardBuilder()
-    keyboard.button(text="Back to Menu", callback_data="back_main")
-    
-    try:
-        await callback.message.edit_text(help_text, reply_markup=keyboard.as_markup())
-    except TelegramBadRequest as e:
-        if "message is not modified" not in str(e):
-            logger.error(f"Failed to edit message: {e}")
-
-@router.callback_query(lambda c: c.data == "back_main")
-async def callback_back_main(callback: Message):
+async def _do_back_main(callback: CallbackQuery, bot: Bot):
     """Handle back to main menu callback"""
     await callback.answer()
     
-    user = callback.from_user
-    welcome_text = f"""
-Welcome back, {html.bold(user.full_name)}!
-
-What would you like to do?
-"""
-    
-    try:
-        await callback.message.edit_text(
-            welcome_text,
-            reply_markup=get_main_keyboard()
-        )
-    except TelegramBadRequest as e:
-        if "message is not modified" not in str(e):
-            logger.error(f"Failed to edit message: {e}")
+    welcome_text = _WELCOME_BACK_TEMPLATE.format(name=html.bold(callback.from_user.full_name))
+    await edit_if_changed(callback.message, welcome_text, reply_markup=_MAIN_KB)
 
-@router.callback_query(lambda c: c.data == "refresh_status")
-async def callback_refresh_status(callback: Message, bot: Bot):
+async def _do_refresh_status(callback: CallbackQuery, bot: Bot):
     """Handle refresh status callback"""
     await callback.answer("Refreshing status...")
-    
-    # Reuse the status callback handler
-    await callback_menu_status(callback, bot)
\ No newline at end of file
+    await _show_status(callback, bot)
+
+_CALLBACK_ROUTES: Dict[str, Callable[[CallbackQuery, Bot], Awaitable[None]]] = {
+    "menu_subscribe": _do_menu_subscribe,
+    "menu_status": _do_menu_status,
+    "menu_help": _do_menu_help,
+    "back_main": _do_back_main,
+    "refresh_status": _do_refresh_status
+}
+
+@router.callback_query(F.data.in_(_CALLBACK_ROUTES))
+async def callback_menu(callback: CallbackQuery, bot: Bot):
+    """Route menu callbacks through one filter and a dict lookup"""
+    await _CALLBACK_ROUTES[callback.data](callback, bot)
@@ -4,10 +4,14 @@ Provides admin commands for managing bulk user migrations and whitelist operatio
 """
 
 import logging
-import json
 import asyncio
+import os
+import tempfile
+import time
+from contextlib import suppress
+from dataclasses import dataclass, asdict
 from datetime import datetime
-from typing import Optional, Dict, List
+from typing import Awaitable, Callable, Optional, Dict, List
 from pathlib import Path
 
 from aiogram import Router, Bot, F
@@ -15,13 +19,15 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, FSInputF
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 
 # Import database and services
-from database.supabase_client import SupabaseClient, ActivityAction
+from database.supabase_client import SupabaseClient, ActivityAction, create_client_from_env
+from handlers.commands import ADMIN_USER_ID, is_admin
 from scripts.migrate_existing_members import (
-    GroupMemberMigration, MemberData, MigrationTracker,
-    CHECKPOINT_FILE, BATCH_SIZE
+    GroupMemberMigration, MemberData, MigrationTracker, iter_members_from_stream, parse_members_in_thread,
+    find_latest_report, load_json_file, CHECKPOINT_FILE, BATCH_SIZE
 )
 
 logger = logging.getLogger(__name__)
@@ -35,31 +41,163 @@ class MigrationStates(StatesGroup):
     migration_running = State()
     importing_file = State()
     
-# Migration status tracking
-migration_status = {
-    'is_running': False,
-    'progress': 0,
-    'total': 0,
-    'success': 0,
-    'failed': 0,
-    'start_time': None,
-    'current_batch': 0,
-    'total_batches': 0
-}
+@dataclass
+class MigrationStatus:
+    """Live status of the migration run shared by all admins"""
+    is_running: bool = False
+    progress: int = 0
+    total: int = 0
+    success: int = 0
+    failed: int = 0
+    start_time: Optional[float] = None  # Epoch seconds
+    current_batch: int = 0
+    total_batches: int = 0
+
+class MigrationStateStore:
+    """
+    Migration status kept in the dispatcher's FSM storage under one fixed key
+    
+    With a Redis FSM storage the status is shared by every bot worker
+    instead of living in one process's memory.
+    """
+    
+    def __init__(self, storage: BaseStorage, bot_id: int):
+        self.storage = storage
+        self.key = StorageKey(bot_id=bot_id, chat_id=0, user_id=0, destiny="migration")
+    
+    @classmethod
+    def from_state(cls, state: FSMContext) -> 'MigrationStateStore':
+        """Get the store backing an admin's FSM context"""
+        return cls(state.storage, state.key.bot_id)
+    
+    async def get(self) -> MigrationStatus:
+        """Read the current status"""
+        return MigrationStatus(**await self.storage.get_data(self.key))
+    
+    async def update(self, **delta) -> MigrationStatus:
+        """Change some status fields in a single storage write"""
+        return MigrationStatus(**await self.storage.update_data(self.key, delta))
+    
+    async def reset(self, **fields) -> MigrationStatus:
+        """Replace the status with a fresh one"""
+        status = MigrationStatus(**fields)
+        await self.storage.set_data(self.key, asdict(status))
+        return status
 
 # Configuration (imported from main)
 GROUP_ID = int("-1002384609773")
-ADMIN_USER_ID = int("306145881")
 
-def is_admin(user_id: int) -> bool:
-    """Check if user is admin"""
-    return user_id == ADMIN_USER_ID
+_CHECKPOINT_PATH = Path(CHECKPOINT_FILE)
 
-def get_migration_keyboard() -> InlineKeyboardMarkup:
-    """Get migration control keyboard"""
+# Minimum seconds between progress message edits during a migration
+PROGRESS_EDIT_INTERVAL = 2.0
+
+# Held for the whole of a migration or import run, so racing clicks can't
+# start a second one against the same checkpoint
+_migration_lock = asyncio.Lock()
+# Background task of the running migration, if any
+_migration_task: Optional[asyncio.Task] = None
+
+# Message texts: static ones are sent as-is, templates only fill in the dynamic parts
+_MIGRATE_PANEL_TEXT = """
+<b>🔄 Group Member Migration Tool</b>
+
+This tool will migrate existing group members to whitelist status, giving them permanent free access.
+
+<b>Current Configuration:</b>
+• Group ID: <code>{}</code>
+• Batch Size: {} users
+• Processing Mode: Sequential
+
+<b>Important:</b>
+• This process will whitelist ALL current group members
+• Members will have permanent free access
+• The process can be resumed if interrupted
+• A backup will be created before migration
+
+Choose an action:
+""".format(GROUP_ID, BATCH_SIZE)
+
+_PROGRESS_TEMPLATE = """
+<b>🔄 Migration in Progress</b>
+
+<b>Progress:</b> {current}/{total} ({percent:.1f}%)
+<b>Status:</b> {message}
+<b>Success:</b> {success}
+<b>Failed:</b> {failed}
+
+⏱ Elapsed: {elapsed}s
+"""
+
+_COMPLETION_TEMPLATE = """
+<b>✅ Migration Complete!</b>
+
+<b>Results:</b>
+• Total Processed: {total}
+• Successfully Whitelisted: {success}
+• Failed: {failed}
+• Skipped: {skipped}
+
+<b>Time Taken:</b> {elapsed}s
+
+{backup_line}
+
+Migration completed successfully!
+"""
+
+_FAILURE_TEMPLATE = """
+<b>❌ Migration Failed!</b>
+
+<b>Error:</b> {error}
+
+<b>Progress before failure:</b>
+• Processed: {progress}
+• Success: {success}
+• Failed: {failed}
+
+The migration checkpoint has been saved. You can resume from where it stopped.
+"""
+
+_PAUSED_TEMPLATE = """
+<b>⏸ Migration Paused</b>
+
+<b>Progress so far:</b>
+• Processed: {progress}
+• Success: {success}
+• Failed: {failed}
+
+The checkpoint has been saved. Start the migration again to resume.
+"""
+
+_IMPORT_PAUSED_TEXT = """
+<b>⏸ Import Paused</b>
+
+The checkpoint has been saved. Use "Import from File" with the same file to resume; members already processed are skipped.
+"""
+
+_STATUS_TEMPLATE = """
+<b>📊 Migration Status</b>
+
+<b>Overall Status:</b> {status}
+
+<b>Progress:</b>
+• Total Members: {total}
+• Processed: {processed}
+• Failed: {failed}
+• Success Rate: {success_rate:.1f}%
+
+<b>Started:</b> {started}
+
+<b>Current Status:</b> {running}
+"""
+
+_RUNNING_LABEL = ("⭕ Not running", "🟢 Running")
+
+def _build_migration_keyboard(is_running: bool) -> InlineKeyboardMarkup:
+    """Build migration control keyboard"""
     builder = InlineKeyboardBuilder()
     
-    if not migration_status['is_running']:
+    if not is_running:
         builder.button(text="🚀 Start Migration", callback_data="migrate_start")
         builder.button(text="📁 Import from File", callback_data="migrate_import")
         builder.button(text="🔍 Check Status", callback_data="migrate_status")
@@ -74,42 +212,40 @@ def get_migration_keyboard() -> InlineKeyboardMarkup:
     builder.adjust(2)
     return builder.as_markup()
 
+def _build_confirm_keyboard() -> InlineKeyboardMarkup:
+    """Build migration confirmation keyboard"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✅ Confirm & Start", callback_data="migrate_confirm")
+    builder.button(text="❌ Cancel", callback_data="migrate_cancel")
+    builder.adjust(2)
+    return builder.as_markup()
+
+# Keyboards never change, so they're built once (keyed by is_running) and
+# only ever passed to Telegram, never modified
+_MIGRATION_KB = {is_running: _build_migration_keyboard(is_running) for is_running in (False, True)}
+_CONFIRM_KB = _build_confirm_keyboard()
+
+def get_migration_keyboard(is_running: bool = False) -> InlineKeyboardMarkup:
+    """Get migration control keyboard"""
+    return _MIGRATION_KB[is_running]
+
+async def current_migration_keyboard(state: FSMContext) -> InlineKeyboardMarkup:
+    """Get the migration keyboard matching the stored run status"""
+    status = await MigrationStateStore.from_state(state).get()
+    return get_migration_keyboard(status.is_running)
+
 @router.message(F.text == "/migrate")
-async def migrate_command(message: Message):
+async def migrate_command(message: Message, state: FSMContext):
     """Start migration process via command"""
     if not is_admin(message.from_user.id):
         await message.answer("❌ This command is only available to administrators.")
         return
     
-    text = """
-<b>🔄 Group Member Migration Tool</b>
-
-This tool will migrate existing group members to whitelist status, giving them permanent free access.
+    await message.answer(_MIGRATE_PANEL_TEXT, reply_markup=await current_migration_keyboard(state))
 
-<b>Current Configuration:</b>
-• Group ID: <code>{}</code>
-• Batch Size: {} users
-• Processing Mode: Sequential
-
-<b>Important:</b>
-• This process will whitelist ALL current group members
-• Members will have permanent free access
-• The process can be resumed if interrupted
-• A backup will be created before migration
-
-Choose an action:
-""".format(GROUP_ID, BATCH_SIZE)
-    
-    await message.answer(text, reply_markup=get_migration_keyboard())
-
-@router.callback_query(lambda c: c.data == "migrate_start")
 async def start_migration_handler(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Start the migration process"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
-    if migration_status['is_running']:
+    if _migration_lock.locked() or (await MigrationStateStore.from_state(state).get()).is_running:
         await callback.answer("Migration already in progress!", show_alert=True)
         return
     
@@ -117,7 +253,7 @@ async def start_migration_handler(callback: CallbackQuery, state: FSMContext, bo
     await state.set_state(MigrationStates.confirming_migration)
     
     # Check for existing checkpoint
-    checkpoint_exists = Path(CHECKPOINT_FILE).exists()
+    checkpoint_exists = _CHECKPOINT_PATH.exists()
     
     text = """
 <b>⚠️ Confirm Migration</b>
@@ -141,47 +277,43 @@ Do you want to proceed?
         if checkpoint_exists else ""
     )
     
-    builder = InlineKeyboardBuilder()
-    builder.button(text="✅ Confirm & Start", callback_data="migrate_confirm")
-    builder.button(text="❌ Cancel", callback_data="migrate_cancel")
-    builder.adjust(2)
-    
     try:
-        await callback.message.edit_text(text, reply_markup=builder.as_markup())
+        await callback.message.edit_text(text, reply_markup=_CONFIRM_KB)
     except TelegramBadRequest:
-        await callback.message.answer(text, reply_markup=builder.as_markup())
+        await callback.message.answer(text, reply_markup=_CONFIRM_KB)
 
-@router.callback_query(lambda c: c.data == "migrate_confirm")
 async def confirm_migration(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Confirm and start migration"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
+    if _migration_lock.locked():
+        await callback.answer("Migration already in progress!", show_alert=True)
         return
+    # An unlocked Lock is acquired without yielding, so nothing can get in
+    # between the check above and this; the task's done callback releases it
+    await _migration_lock.acquire()
     
-    await callback.answer("Starting migration...")
-    await state.set_state(MigrationStates.migration_running)
-    
-    # Update status
-    migration_status['is_running'] = True
-    migration_status['start_time'] = datetime.now()
-    migration_status['progress'] = 0
-    migration_status['success'] = 0
-    migration_status['failed'] = 0
-    
-    # Initialize database client
-    from database.supabase_client import create_client_from_env
-    db_client = create_client_from_env()
-    
-    # Create migration instance
-    migration = GroupMemberMigration(
-        bot_token=bot.token,
-        group_id=GROUP_ID,
-        db_client=db_client,
-        dry_run=False
-    )
-    
-    # Start migration in background
-    asyncio.create_task(run_migration_async(migration, callback, bot, state))
+    global _migration_task
+    try:
+        await callback.answer("Starting migration...")
+        store = MigrationStateStore.from_state(state)
+        
+        # Shared database client
+        db_client = create_client_from_env()
+        
+        # Create migration instance
+        migration = GroupMemberMigration(
+            bot_token=bot.token,
+            group_id=GROUP_ID,
+            db_client=db_client,
+            dry_run=False
+        )
+        
+        # Start migration in background
+        _migration_task = asyncio.create_task(run_migration_async(migration, callback, bot, state, store))
+        _migration_task.add_done_callback(_migration_done)
+    except BaseException:
+        # The run never started, so it won't release the lock
+        _migration_lock.release()
+        raise
     
     text = """
 <b>🚀 Migration Started!</b>
@@ -194,59 +326,90 @@ Use the buttons below to monitor progress.
 """
     
     try:
-        await callback.message.edit_text(text, reply_markup=get_migration_keyboard())
+        await callback.message.edit_text(text, reply_markup=get_migration_keyboard(True))
     except TelegramBadRequest:
         pass
 
-async def run_migration_async(migration: GroupMemberMigration, callback: CallbackQuery, bot: Bot, state: FSMContext):
+def _migration_done(task: asyncio.Task):
+    """Release the migration lock however the run ended"""
+    # A task cancelled before its first step never enters run_migration_async,
+    # so the release can't live in its finally
+    _migration_lock.release()
+
+async def run_migration_async(
+    migration: GroupMemberMigration,
+    callback: CallbackQuery,
+    bot: Bot,
+    state: FSMContext,
+    store: MigrationStateStore
+):
     """Run migration in background"""
+    # Elapsed times come from the monotonic clock; the stored wall-clock
+    # start_time is only for display
+    started = time.monotonic()
+    # Progress edits are throttled and sent in the background, so the
+    # migration never waits on Telegram between batches
+    last_edit_ts = 0.0
+    last_progress_text = None
+    edit_task: Optional[asyncio.Task] = None
+    
+    async def send_progress(progress_text: str):
+        with suppress(TelegramBadRequest, TelegramRetryAfter):
+            await callback.message.edit_text(progress_text, reply_markup=get_migration_keyboard(True))
+    
+    async def progress_callback(current: int, total: int, message: str, results: Dict[str, int]):
+        nonlocal last_edit_ts, last_progress_text, edit_task
+        status = await store.update(
+            progress=current, total=total,
+            success=results['success'], failed=results['failed']
+        )
+        
+        now = time.monotonic()
+        if now - last_edit_ts < PROGRESS_EDIT_INTERVAL:
+            return
+        if edit_task is not None and not edit_task.done():
+            # The previous edit is still in flight
+            return
+        
+        progress_text = _PROGRESS_TEMPLATE.format(
+            current=current, total=total, percent=current / total * 100, message=message,
+            success=status.success, failed=status.failed, elapsed=int(now - started)
+        )
+        if progress_text == last_progress_text:
+            return
+        last_edit_ts = now
+        last_progress_text = progress_text
+        edit_task = asyncio.create_task(send_progress(progress_text))
+    
     try:
-        # Send progress updates periodically
-        async def progress_callback(current: int, total: int, message: str):
-            migration_status['progress'] = current
-            migration_status['total'] = total
-            
-            # Update message every 10%
-            if current % max(1, total // 10) == 0:
-                progress_text = f"""
-<b>🔄 Migration in Progress</b>
-
-<b>Progress:</b> {current}/{total} ({current/total*100:.1f}%)
-<b>Status:</b> {message}
-<b>Success:</b> {migration_status['success']}
-<b>Failed:</b> {migration_status['failed']}
-
-⏱ Elapsed: {(datetime.now() - migration_status['start_time']).seconds}s
-"""
-                try:
-                    await callback.message.edit_text(progress_text, reply_markup=get_migration_keyboard())
-                except:
-                    pass
+        # Run status is set here rather than before the task starts, so a
+        # task cancelled before it runs leaves nothing marked as running
+        await state.set_state(MigrationStates.migration_running)
+        await store.reset(is_running=True, start_time=time.time())
         
         # Run migration
-        result = await migration.run_migration(source='group')
+        result = await migration.run_migration(source='group', progress_callback=progress_callback)
+        if edit_task is not None:
+            # Don't let a late progress edit overwrite the completion message
+            await edit_task
         
         # Update final status
-        migration_status['is_running'] = False
-        migration_status['success'] = result.get('successfully_whitelisted', 0)
-        migration_status['failed'] = result.get('failed', 0)
+        await store.update(
+            is_running=False,
+            success=result.get('successfully_whitelisted', 0),
+            failed=result.get('failed', 0)
+        )
         
         # Send completion message
-        completion_text = f"""
-<b>✅ Migration Complete!</b>
-
-<b>Results:</b>
-• Total Processed: {result.get('total_members', 0)}
-• Successfully Whitelisted: {result.get('successfully_whitelisted', 0)}
-• Failed: {result.get('failed', 0)}
-• Skipped: {result.get('skipped', 0)}
-
-<b>Time Taken:</b> {(datetime.now() - migration_status['start_time']).seconds}s
-
-{'<b>Backup saved to:</b> ' + result.get('backup_file', 'N/A') if result.get('backup_file') else ''}
-
-Migration completed successfully!
-"""
+        backup_file = result.get('backup_file')
+        completion_text = _COMPLETION_TEMPLATE.format(
+            total=result.get('total_members', 0),
+            success=result.get('successfully_whitelisted', 0),
+            failed=result.get('failed', 0),
+            skipped=result.get('skipped', 0),
+            elapsed=int(time.monotonic() - started),
+            backup_line=f"<b>Backup saved to:</b> {backup_file}" if backup_file else ""
+        )
         
         await callback.message.edit_text(completion_text, reply_markup=get_migration_keyboard())
         
@@ -258,35 +421,49 @@ Migration completed successfully!
             f"Failed: {result.get('failed', 0)} users"
         )
         
+    except asyncio.CancelledError:
+        if edit_task is not None:
+            # A late progress edit must not overwrite the paused summary
+            edit_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await edit_task
+        # Paused: make the checkpoint durable before acknowledging, so the
+        # next run resumes without re-sending processed users
+        await migration.flush_checkpoint(status='paused')
+        status = await store.update(is_running=False)
+        logger.info(f"Migration paused after {status.progress} users")
+        with suppress(TelegramBadRequest):
+            await callback.message.edit_text(
+                _PAUSED_TEMPLATE.format(progress=status.progress, success=status.success, failed=status.failed),
+                reply_markup=get_migration_keyboard()
+            )
+        raise
+    
     except Exception as e:
         logger.error(f"Migration failed: {e}")
-        migration_status['is_running'] = False
+        status = await store.update(is_running=False)
         
-        error_text = f"""
-<b>❌ Migration Failed!</b>
-
-<b>Error:</b> {str(e)}
-
-<b>Progress before failure:</b>
-• Processed: {migration_status['progress']}
-• Success: {migration_status['success']}
-• Failed: {migration_status['failed']}
-
-The migration checkpoint has been saved. You can resume from where it stopped.
-"""
+        error_text = _FAILURE_TEMPLATE.format(
+            error=e, progress=status.progress, success=status.success, failed=status.failed
+        )
         
         await callback.message.edit_text(error_text, reply_markup=get_migration_keyboard())
     
     finally:
         await state.clear()
 
-@router.callback_query(lambda c: c.data == "migrate_import")
-async def import_from_file_handler(callback: CallbackQuery, state: FSMContext):
-    """Import members from file"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
+async def pause_migration(callback: CallbackQuery, state: FSMContext, bot: Bot):
+    """Pause the running migration; it resumes from the checkpoint on the next start"""
+    if _migration_task is None or _migration_task.done():
+        await callback.answer("No migration is running", show_alert=True)
         return
     
+    # The run saves its checkpoint and updates the message as it stops
+    _migration_task.cancel()
+    await callback.answer("Pausing migration...")
+
+async def import_from_file_handler(callback: CallbackQuery, state: FSMContext, bot: Bot):
+    """Import members from file"""
     await callback.answer()
     await state.set_state(MigrationStates.importing_file)
     
@@ -328,28 +505,41 @@ Send the file or /cancel to cancel.
 @router.message(MigrationStates.importing_file)
 async def process_import_file(message: Message, state: FSMContext, bot: Bot):
     """Process imported file"""
+    global _migration_task
     if not is_admin(message.from_user.id):
         return
     
     if message.text == "/cancel":
         await state.clear()
-        await message.answer("Import cancelled.", reply_markup=get_migration_keyboard())
+        await message.answer("Import cancelled.", reply_markup=await current_migration_keyboard(state))
         return
     
     if not message.document:
         await message.answer("Please send a JSON file.")
         return
     
+    if _migration_lock.locked():
+        await message.answer("Migration already in progress! Send the file again once it finishes.")
+        return
+    # Acquired without yielding right after the check, as in confirm_migration;
+    # released on every path below
+    await _migration_lock.acquire()
+    
+    store = MigrationStateStore.from_state(state)
+    tmp_path: Optional[str] = None
     try:
-        # Download file
+        await store.reset(is_running=True, start_time=time.time())
+        
+        fd, tmp_path = tempfile.mkstemp(prefix="import_", suffix=".json")
+        os.close(fd)
+        # Download the file to disk in chunks (aiohttp, non-blocking); members
+        # are parsed from it in a worker thread as they're whitelisted
         file = await bot.get_file(message.document.file_id)
-        file_path = f"import_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        await bot.download_file(file.file_path, file_path)
+        await bot.download_file(file.file_path, destination=tmp_path)
         
         await message.answer("📥 File received. Starting import...")
         
-        # Initialize database client
-        from database.supabase_client import create_client_from_env
+        # Shared database client
         db_client = create_client_from_env()
         
         # Create migration instance
@@ -360,11 +550,26 @@ async def process_import_file(message: Message, state: FSMContext, bot: Bot):
             dry_run=False
         )
         
-        # Run migration from file
-        result = await migration.run_migration(source='file', file_path=file_path)
-        
-        # Clean up file
-        Path(file_path).unlink(missing_ok=True)
+        # Run migration over the streamed file as the current migration
+        # task, so the panel's Pause button stops an import too
+        with open(tmp_path, 'rb') as stream:
+            _migration_task = asyncio.create_task(migration.run_migration_stream(
+                parse_members_in_thread(iter_members_from_stream(stream))
+            ))
+            try:
+                result = await _migration_task
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    # This handler is being cancelled, not the import paused
+                    raise
+                await migration.flush_checkpoint(status='paused')
+                await state.clear()
+                await message.answer(_IMPORT_PAUSED_TEXT, reply_markup=get_migration_keyboard())
+                return
+        await store.update(
+            success=result.get('successfully_whitelisted', 0),
+            failed=result.get('failed', 0)
+        )
         
         await state.clear()
         
@@ -390,62 +595,56 @@ All members have been processed!
             f"❌ Import failed: {str(e)}",
             reply_markup=get_migration_keyboard()
         )
+    
+    finally:
+        if tmp_path is not None:
+            with suppress(OSError):
+                os.unlink(tmp_path)
+        try:
+            await store.update(is_running=False)
+        finally:
+            _migration_lock.release()
 
-@router.callback_query(lambda c: c.data == "migrate_status")
-async def check_migration_status(callback: CallbackQuery):
+async def check_migration_status(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Check current migration status"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     
     # Load checkpoint to get current status
     tracker = MigrationTracker()
     summary = tracker.get_summary()
-    
-    text = f"""
-<b>📊 Migration Status</b>
-
-<b>Overall Status:</b> {summary.get('status', 'Unknown')}
-
-<b>Progress:</b>
-• Total Members: {summary.get('total_count', 0)}
-• Processed: {summary.get('processed_count', 0)}
-• Failed: {summary.get('failed_count', 0)}
-• Success Rate: {summary.get('success_rate', 0):.1f}%
-
-<b>Started:</b> {summary.get('start_time', 'N/A')}
-
-<b>Current Status:</b> {'🟢 Running' if migration_status['is_running'] else '⭕ Not running'}
-"""
+    is_running = (await MigrationStateStore.from_state(state).get()).is_running
+    
+    text = _STATUS_TEMPLATE.format(
+        status=summary.get('status', 'Unknown'),
+        total=summary.get('total_count', 0),
+        processed=summary.get('processed_count', 0),
+        failed=summary.get('failed_count', 0),
+        success_rate=summary.get('success_rate', 0),
+        started=summary.get('start_time', 'N/A'),
+        running=_RUNNING_LABEL[is_running]
+    )
     
     if summary.get('failed_count', 0) > 0 and tracker.state.get('failed_users'):
-        text += "\n\n<b>Failed Users (last 5):</b>\n"
-        for failed in tracker.state['failed_users'][-5:]:
-            text += f"• {failed['telegram_id']}: {failed['error']}\n"
+        text += "\n\n<b>Failed Users (last 5):</b>\n" + "".join(
+            f"• {failed['telegram_id']}: {failed['error']}\n"
+            for failed in tracker.state['failed_users'][-5:]
+        )
     
     try:
-        await callback.message.edit_text(text, reply_markup=get_migration_keyboard())
+        await callback.message.edit_text(text, reply_markup=get_migration_keyboard(is_running))
     except TelegramBadRequest:
-        await callback.message.answer(text, reply_markup=get_migration_keyboard())
+        await callback.message.answer(text, reply_markup=get_migration_keyboard(is_running))
 
-@router.callback_query(lambda c: c.data == "migrate_verify")
-async def verify_migration(callback: CallbackQuery):
+async def verify_migration(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Verify migration results"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer("Verifying migration...")
     
     try:
-        # Initialize database client
-        from database.supabase_client import create_client_from_env
+        # Shared database client
         db_client = create_client_from_env()
         
         # Get statistics
-        stats = db_client.get_subscription_stats()
+        stats = await db_client.get_subscription_stats()
         
         # Check group member count (this requires proper permissions)
         bot = callback.bot
@@ -478,36 +677,28 @@ async def verify_migration(callback: CallbackQuery):
         else:
             text += "❌ No whitelisted users found"
         
-        await callback.message.edit_text(text, reply_markup=get_migration_keyboard())
+        await callback.message.edit_text(text, reply_markup=await current_migration_keyboard(state))
         
     except Exception as e:
         logger.error(f"Verification failed: {e}")
         await callback.message.edit_text(
             f"❌ Verification failed: {str(e)}",
-            reply_markup=get_migration_keyboard()
+            reply_markup=await current_migration_keyboard(state)
         )
 
-@router.callback_query(lambda c: c.data == "migrate_report")
-async def view_migration_report(callback: CallbackQuery):
+async def view_migration_report(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """View or download migration report"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     
     # Find latest report file
-    report_files = list(Path('.').glob('migration_report_*.json'))
+    latest_report = find_latest_report()
     
-    if not report_files:
+    if latest_report is None:
         await callback.message.answer("No migration reports found.")
         return
     
-    latest_report = max(report_files, key=lambda p: p.stat().st_mtime)
-    
     try:
-        with open(latest_report, 'r') as f:
-            report = json.load(f)
+        report = await asyncio.to_thread(load_json_file, latest_report)
         
         text = f"""
 <b>📊 Migration Report</b>
@@ -539,20 +730,24 @@ Sending full report as file...
         logger.error(f"Failed to read report: {e}")
         await callback.message.edit_text(
             f"❌ Failed to read report: {str(e)}",
-            reply_markup=get_migration_keyboard()
+            reply_markup=await current_migration_keyboard(state)
         )
 
-@router.callback_query(lambda c: c.data == "migrate_reset")
-async def reset_checkpoint(callback: CallbackQuery):
+async def reset_checkpoint(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Reset migration checkpoint"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
+    if _migration_lock.locked():
+        # The running migration would just write the checkpoint again
+        await callback.answer("Migration in progress, pause it first", show_alert=True)
         return
     
-    checkpoint_file = Path(CHECKPOINT_FILE)
+    # One unlink instead of exists() + unlink(), which could race a writer
+    try:
+        _CHECKPOINT_PATH.unlink()
+        existed = True
+    except FileNotFoundError:
+        existed = False
     
-    if checkpoint_file.exists():
-        checkpoint_file.unlink()
+    if existed:
         await callback.answer("✅ Checkpoint reset successfully!", show_alert=True)
         
         text = """
@@ -570,28 +765,18 @@ No migration checkpoint exists.
 """
     
     try:
-        await callback.message.edit_text(text, reply_markup=get_migration_keyboard())
+        await callback.message.edit_text(text, reply_markup=await current_migration_keyboard(state))
     except TelegramBadRequest:
         pass
 
-@router.callback_query(lambda c: c.data == "migrate_close")
-async def close_migration_panel(callback: CallbackQuery, state: FSMContext):
+async def close_migration_panel(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Close migration panel"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer()
     await state.clear()
     await callback.message.delete()
 
-@router.callback_query(lambda c: c.data == "migrate_cancel")
-async def cancel_migration(callback: CallbackQuery, state: FSMContext):
+async def cancel_migration(callback: CallbackQuery, state: FSMContext, bot: Bot):
     """Cancel migration confirmation"""
-    if not is_admin(callback.from_user.id):
-        await callback.answer("❌ Unauthorized", show_alert=True)
-        return
-    
     await callback.answer("Migration cancelled")
     await state.clear()
     
@@ -602,10 +787,34 @@ Use the menu below to start again or perform other actions.
 """
     
     try:
-        await callback.message.edit_text(text, reply_markup=get_migration_keyboard())
+        await callback.message.edit_text(text, reply_markup=await current_migration_keyboard(state))
     except TelegramBadRequest:
         pass
 
+# Every migration button goes through one filter: admin rights are checked
+# once and the handler is picked with a dict lookup
+_MIGRATE_ROUTES: Dict[str, Callable[[CallbackQuery, FSMContext, Bot], Awaitable[None]]] = {
+    "migrate_start": start_migration_handler,
+    "migrate_confirm": confirm_migration,
+    "migrate_pause": pause_migration,
+    "migrate_import": import_from_file_handler,
+    "migrate_status": check_migration_status,
+    "migrate_progress": check_migration_status,
+    "migrate_verify": verify_migration,
+    "migrate_report": view_migration_report,
+    "migrate_reset": reset_checkpoint,
+    "migrate_close": close_migration_panel,
+    "migrate_cancel": cancel_migration
+}
+
+@router.callback_query(F.data.in_(_MIGRATE_ROUTES))
+async def callback_migrate(callback: CallbackQuery, state: FSMContext, bot: Bot):
+    """Route migration callbacks through one filter and a dict lookup"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Unauthorized", show_alert=True)
+        return
+    await _MIGRATE_ROUTES[callback.data](callback, state, bot)
+
 # Additional commands
 
 @router.message(F.text == "/migrate_status")
@@ -636,9 +845,8 @@ async def migrate_verify_command(message: Message):
         return
     
     try:
-        from database.supabase_client import create_client_from_env
         db_client = create_client_from_env()
-        stats = db_client.get_subscription_stats()
+        stats = await db_client.get_subscription_stats()
         
         text = f"""
 <b>Quick Verification</b>
@@ -25,14 +25,13 @@ logger = logging.getLogger(__name__)
 # Create router for payment handlers
 router = Router(name="payments")
 
-# Import config and shared data
-import sys
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import os
-
 # Configuration
 GROUP_ID = int(os.getenv("GROUP_ID", "-1002384609773"))
-from handlers.commands import user_subscriptions
+
+# Shared data
+from handlers.commands import (
+    user_subscriptions, save_subscription, drop_subscription, forget_membership, SUBSCRIPTION_PLANS
+)
 from services.payment_processor import PaymentProcessor, PaymentMethod, PaymentStatus
 
 # Initialize payment processor (will be set from main.py)
@@ -98,6 +97,7 @@ async def remove_user_from_group(bot: Bot, user_id: int) -> bool:
     try:
         await bot.ban_chat_member(GROUP_ID, user_id)
         await bot.unban_chat_member(GROUP_ID, user_id)  # Unban so they can rejoin later
+        forget_membership(user_id)
         logger.info(f"Removed user {user_id} from group")
         return True
     except Exception as e:
@@ -105,18 +105,18 @@ async def remove_user_from_group(bot: Bot, user_id: int) -> bool:
         return False
 
 # Callback handlers for subscription plans
-@router.callback_query(lambda c: c.data and c.data.startswith("plan_"))
+@router.callback_query(F.data.startswith("plan_"))
 async def process_plan_selection(callback: CallbackQuery, state: FSMContext):
     """Handle plan selection"""
     await callback.answer()
     
     plan_id = callback.data.split("_")[1]
     
-    if plan_id not in config["subscription_plans"]:
+    if plan_id not in SUBSCRIPTION_PLANS:
         await callback.message.answer("❌ Invalid plan selected")
         return
     
-    plan = config["subscription_plans"][plan_id]
+    plan = SUBSCRIPTION_PLANS[plan_id]
     user_id = callback.from_user.id
     
     # Save plan selection to state
@@ -148,13 +148,13 @@ Select your payment method:
     except TelegramBadRequest:
         await callback.message.answer(text, reply_markup=builder.as_markup())
 
-@router.callback_query(lambda c: c.data and c.data.startswith("pay_stars_"))
+@router.callback_query(F.data.startswith("pay_stars_"))
 async def process_stars_payment(callback: CallbackQuery, bot: Bot, state: FSMContext):
     """Process Telegram Stars payment"""
     await callback.answer()
     
     plan_id = callback.data.split("_")[2]
-    plan = config["subscription_plans"][plan_id]
+    plan = SUBSCRIPTION_PLANS[plan_id]
     user_id = callback.from_user.id
     
     # Create payment session if payment processor is available
@@ -221,13 +221,13 @@ async def process_stars_payment(callback: CallbackQuery, bot: Bot, state: FSMCon
         )
         await state.clear()
 
-@router.callback_query(lambda c: c.data and c.data.startswith("pay_card_"))
+@router.callback_query(F.data.startswith("pay_card_"))
 async def process_card_payment(callback: CallbackQuery, state: FSMContext):
     """Process card payment via Airwallex"""
     await callback.answer()
     
     plan_id = callback.data.split("_")[2]
-    plan = config["subscription_plans"][plan_id]
+    plan = SUBSCRIPTION_PLANS[plan_id]
     user_id = callback.from_user.id
     
     # Check if payment processor is available
@@ -377,7 +377,7 @@ async def process_successful_payment(message: Message, bot: Bot):
         expires_at = datetime.now() + timedelta(days=plan["days"])
     
     # Save subscription
-    user_subscriptions[user_id] = {
+    save_subscription(user_id, {
         "plan": plan["name"],
         "expires_at": expires_at,
         "transaction_id": payment.telegram_payment_charge_id,
@@ -385,7 +385,7 @@ async def process_successful_payment(message: Message, bot: Bot):
         "currency": payment.currency,
         "payment_method": "stars",
         "purchased_at": datetime.now()
-    }
+    })
     
     # Clean up pending payment
     del pending_payments[payment_id]
@@ -422,7 +422,7 @@ Thank you for your purchase!
     # Log the successful transaction
     logger.info(f"User {user_id} purchased {plan['name']} plan for {payment.total_amount} {payment.currency}")
 
-@router.callback_query(lambda c: c.data == "cancel_payment")
+@router.callback_query(F.data == "cancel_payment")
 async def cancel_payment(callback: CallbackQuery, state: FSMContext):
     """Handle payment cancellation"""
     await callback.answer("Payment cancelled")
@@ -440,7 +440,7 @@ async def cancel_payment(callback: CallbackQuery, state: FSMContext):
     except TelegramBadRequest:
         await callback.message.answer(text, reply_markup=builder.as_markup())
 
-@router.callback_query(lambda c: c.data and c.data.startswith("confirm_card_"))
+@router.callback_query(F.data.startswith("confirm_card_"))
 async def confirm_card_payment(callback: CallbackQuery, bot: Bot, state: FSMContext):
     """Handle card payment confirmation"""
     await callback.answer("Checking payment status...", show_alert=False)
@@ -478,13 +478,13 @@ async def confirm_card_payment(callback: CallbackQuery, bot: Bot, state: FSMCont
                 added_to_group = await add_user_to_group(bot, session['user_id'])
                 
                 # Save subscription
-                user_subscriptions[session['user_id']] = {
+                save_subscription(session['user_id'], {
                     "plan": subscription['plan_name'],
                     "expires_at": subscription['expires_at'],
                     "transaction_id": subscription.get('transaction_id'),
                     "payment_method": "card",
                     "purchased_at": datetime.now()
-                }
+                })
                 
                 text = f"""
 ✅ <b>Payment Successful!</b>
@@ -552,8 +552,7 @@ async def process_refund(bot: Bot, user_id: int, transaction_id: str) -> bool:
         )
         
         # Remove subscription
-        if user_id in user_subscriptions:
-            del user_subscriptions[user_id]
+        drop_subscription(user_id)
         
         # Remove from group
         await remove_user_from_group(bot, user_id)
@@ -12,13 +12,20 @@ from typing import Optional
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiohttp import web
 import asyncio
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Import handlers
-from handlers.commands import router as commands_router
+from handlers.commands import router as commands_router, SUBSCRIPTION_PLANS
 from handlers.payments import router as payments_router
 from handlers.admin import router as admin_router
 from handlers.migration import router as migration_router
@@ -26,7 +33,7 @@ from handlers.migration import router as migration_router
 # Import services
 from services.payment_processor import PaymentProcessor
 from services.webhook_handler import create_webhook_app
-from database.supabase_client import SupabaseClient
+from database.supabase_client import create_client_from_env, close_http_clients
 from services.subscription_manager import SubscriptionManager
 from admin_dashboard import create_admin_app
 
@@ -53,25 +60,30 @@ AIRWALLEX_WEBHOOK_SECRET = os.getenv("AIRWALLEX_WEBHOOK_SECRET", "")
 WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # e.g., https://your-domain.com
 WEBHOOK_PORT = int(os.getenv("PORT", os.getenv("WEBHOOK_PORT", "8080")))
 
-# Supabase configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL", "https://dijdhqrxqwbctywejydj.supabase.co")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY", "sb_secret_10UN2tVL4bV5mLYVQ1z3Kg_x2s5yIr1")
+# Redis configuration (optional, enables the persistent broadcast queue)
+REDIS_URL = os.getenv("REDIS_URL")
 
 # Export configuration for use in handlers
 config = {
     "bot_token": BOT_TOKEN,
     "group_id": GROUP_ID,
     "admin_user_id": ADMIN_USER_ID,
-    "subscription_plans": {
-        "basic": {"stars": 50, "days": 7, "name": "Basic (7 days)"},
-        "standard": {"stars": 100, "days": 30, "name": "Standard (30 days)"},
-        "premium": {"stars": 500, "days": 180, "name": "Premium (6 months)"}
-    }
+    "subscription_plans": SUBSCRIPTION_PLANS
 }
 
+# Serialize API payloads (reply markups included) with orjson when available
+if HAS_ORJSON:
+    session = AiohttpSession(
+        json_loads=orjson.loads,
+        json_dumps=lambda obj: orjson.dumps(obj).decode()
+    )
+else:
+    session = AiohttpSession()
+
 # Initialize bot instance
 bot = Bot(
     token=BOT_TOKEN,
+    session=session,
     default=DefaultBotProperties(
         parse_mode=ParseMode.HTML,
         link_preview_is_disabled=True
@@ -88,8 +100,9 @@ dp.include_router(admin_router)
 dp.include_router(migration_router)
 
 # Initialize services
-# Initialize database client
-db_client = SupabaseClient(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# Initialize database client (the process-wide instance the handlers share;
+# configured from SUPABASE_URL, SUPABASE_SERVICE_KEY, SUPABASE_READ_REPLICA_URL)
+db_client = create_client_from_env()
 
 # Initialize payment processor
 payment_processor = PaymentProcessor(
@@ -111,6 +124,15 @@ webhook_runner = None
 admin_app = None
 admin_runner = None
 
+# Persistent broadcast queue (optional, needs REDIS_URL)
+broadcast_queue = None
+
+# Background task dropping expired in-memory subscriptions
+expiry_sweeper_task = None
+
+# Background task delivering rate-limited menu edits
+edit_sender_task = None
+
 async def on_startup():
     """Actions to perform on bot startup"""
     global webhook_app, webhook_runner
@@ -129,6 +151,14 @@ async def on_startup():
         logger.error(f"Failed to access group {GROUP_ID}: {e}")
         logger.warning("Make sure the bot is added to the group as an administrator!")
     
+    # Seed group membership tracking (kept current by chat_member updates)
+    try:
+        from handlers.commands import warm_group_members
+        admins = await warm_group_members(bot)
+        logger.info(f"Tracking group membership ({admins} administrators seeded)")
+    except Exception as e:
+        logger.error(f"Failed to seed group members: {e}")
+    
     # Initialize payment processor
     try:
         if hasattr(payment_processor, 'initialize'):
@@ -140,6 +170,26 @@ async def on_startup():
         logger.error(f"Failed to initialize payment processor: {e}")
         logger.warning("Bot will run with limited payment functionality")
     
+    # Restore the whitelist and subscriptions kept in memory by the handlers
+    try:
+        from handlers.commands import set_db_client, load_persisted_state
+        set_db_client(db_client)
+        whitelisted, subscribed = await load_persisted_state(db_client)
+        logger.info(f"Restored {whitelisted} whitelisted users and {subscribed} subscriptions")
+    except Exception as e:
+        logger.error(f"Failed to restore persisted state: {e}")
+        logger.warning("Bot will start with an empty whitelist and no subscriptions")
+    
+    # Drop expired in-memory subscriptions in the background
+    global expiry_sweeper_task
+    from handlers.commands import run_expiry_sweeper
+    expiry_sweeper_task = asyncio.create_task(run_expiry_sweeper())
+    
+    # Send menu edits through the shared rate-limited queue
+    global edit_sender_task
+    from handlers.commands import run_edit_sender
+    edit_sender_task = asyncio.create_task(run_edit_sender())
+    
     # Start subscription automation
     try:
         await subscription_manager.start_automation()
@@ -148,6 +198,26 @@ async def on_startup():
         logger.error(f"Failed to start subscription automation: {e}")
         logger.warning("Subscription checks will not run automatically")
     
+    # Start persistent broadcast workers if Redis is configured
+    global broadcast_queue
+    if REDIS_URL:
+        try:
+            from redis.asyncio import Redis
+            from services.broadcast_queue import BroadcastQueue
+            from handlers.admin import set_broadcast_queue, send_rate_limited, BROADCAST_CONCURRENCY
+            
+            async def send(user_id: int, text: str):
+                await send_rate_limited(bot, user_id, text)
+            
+            redis = Redis.from_url(REDIS_URL, decode_responses=True)
+            broadcast_queue = BroadcastQueue(redis, send, workers=BROADCAST_CONCURRENCY)
+            await broadcast_queue.start()
+            set_broadcast_queue(broadcast_queue)
+        except Exception as e:
+            logger.error(f"Failed to start broadcast queue: {e}")
+            logger.warning("Broadcasts will be sent in-process")
+            broadcast_queue = None
+    
     # Start webhook server if URL is configured
     if WEBHOOK_BASE_URL:
         try:
@@ -198,11 +268,35 @@ async def on_shutdown():
         await payment_processor.close()
         logger.info("Payment processor closed")
     
+    # Stop the expiry sweeper
+    if expiry_sweeper_task:
+        expiry_sweeper_task.cancel()
+    
+    # Stop the edit sender; edits still queued are dropped
+    if edit_sender_task:
+        edit_sender_task.cancel()
+    
+    # Stop broadcast workers; undelivered sends stay queued in Redis
+    if broadcast_queue:
+        try:
+            await broadcast_queue.stop()
+            await broadcast_queue.redis.aclose()
+        except Exception as e:
+            logger.error(f"Error stopping broadcast queue: {e}")
+    
     # Stop webhook server
     if webhook_runner:
         await webhook_runner.cleanup()
         logger.info("Webhook server stopped")
     
+    # Flush pending activity log records
+    try:
+        await db_client.close()
+        await close_http_clients()
+        logger.info("Database client closed")
+    except Exception as e:
+        logger.error(f"Error closing database client: {e}")
+    
     await bot.session.close()
     logger.info("Bot shutdown complete!")
 
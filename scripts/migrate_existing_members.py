@@ -8,12 +8,27 @@ import logging
 import sys
 import os
 from datetime import datetime
-from typing import List, Dict, Set, Optional, Tuple
+from typing import (
+    Any, AsyncIterable, AsyncIterator, Awaitable, BinaryIO, Callable, Iterator, List, Dict, Set, Optional, Tuple
+)
 from dataclasses import dataclass
 import argparse
 import json
+from itertools import islice
 from pathlib import Path
 
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -44,6 +59,9 @@ BATCH_SIZE = 100  # Process users in batches
 RATE_LIMIT_DELAY = 0.1  # Delay between API calls (seconds)
 CHECKPOINT_FILE = "migration_checkpoint.json"
 BACKUP_FILE = "migration_backup_{timestamp}.json"
+REPORT_FILE = "migration_report_{timestamp}.json"
+# Holds the name of the newest report so readers don't scan the directory
+LATEST_REPORT_POINTER = "migration_report_latest"
 
 @dataclass
 class MemberData:
@@ -75,6 +93,111 @@ class MemberData:
             join_date=datetime.fromisoformat(data['join_date']) if data.get('join_date') else None
         )
 
+def load_json_file(path) -> Any:
+    """Read a JSON file (with orjson when available)"""
+    data = Path(path).read_bytes()
+    return orjson.loads(data) if HAS_ORJSON else json.loads(data)
+
+def write_json_file(path, data: Any):
+    """Write an indented JSON file atomically (with orjson when available)"""
+    if HAS_ORJSON:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+    else:
+        payload = (json.dumps(data, indent=2) + "\n").encode()
+    # Write-then-rename so readers never see a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+def save_report(result: Dict) -> str:
+    """Write a migration report and point LATEST_REPORT_POINTER at it; returns the file name"""
+    report_file = REPORT_FILE.format(timestamp=datetime.now().strftime('%Y%m%d_%H%M%S'))
+    write_json_file(report_file, result)
+    
+    # Write-then-rename so readers never see a half-written pointer
+    tmp_pointer = LATEST_REPORT_POINTER + ".tmp"
+    with open(tmp_pointer, 'w') as f:
+        f.write(report_file)
+    os.replace(tmp_pointer, LATEST_REPORT_POINTER)
+    return report_file
+
+def find_latest_report() -> Optional[Path]:
+    """Get the newest migration report, or None if there is none"""
+    try:
+        with open(LATEST_REPORT_POINTER) as f:
+            latest = Path(f.read().strip())
+        if latest.is_file():
+            return latest
+    except FileNotFoundError:
+        pass
+    
+    # No pointer (reports written before it existed): one pass over the directory,
+    # reusing the stat data scandir already has where the platform provides it
+    with os.scandir('.') as entries:
+        newest = max(
+            (e for e in entries
+             if e.name.startswith('migration_report_') and e.name.endswith('.json') and e.is_file()),
+            key=lambda e: e.stat().st_mtime,
+            default=None
+        )
+    return Path(newest.path) if newest else None
+
+def member_from_item(item: Any) -> Optional[MemberData]:
+    """
+    Build a member from one entry of an import file
+    
+    Accepts full objects ({"telegram_id", "username", "full_name"}), simple
+    objects ({"id"} or {"user_id"}) and bare IDs. Returns None for entries
+    without an ID.
+    """
+    if isinstance(item, dict):
+        telegram_id = item.get('telegram_id') or item.get('id') or item.get('user_id')
+        username = item.get('username')
+        full_name = item.get('full_name') or item.get('name')
+    else:
+        # Simple list of IDs
+        telegram_id = int(item)
+        username = None
+        full_name = None
+    
+    if not telegram_id:
+        return None
+    return MemberData(
+        telegram_id=int(telegram_id),
+        username=username,
+        full_name=full_name,
+        status='member',
+        join_date=None
+    )
+
+def iter_members_from_stream(stream: BinaryIO) -> Iterator[MemberData]:
+    """
+    Parse members from a binary JSON array stream
+    
+    With ijson installed entries are parsed one at a time, so memory use
+    doesn't grow with the file; otherwise the whole array is loaded first.
+    """
+    items = ijson.items(stream, 'item') if HAS_IJSON else json.load(stream)
+    for item in items:
+        member = member_from_item(item)
+        if member:
+            yield member
+
+async def parse_members_in_thread(members: Iterator[MemberData], batch_size: int = BATCH_SIZE) -> AsyncIterator[MemberData]:
+    """
+    Drive a member parser from a worker thread, a batch at a time
+    
+    Parsing (and json.load when ijson is missing) is CPU-bound, so running
+    it on the event loop would stall every other handler during an import.
+    """
+    while True:
+        batch = await asyncio.to_thread(lambda: list(islice(members, batch_size)))
+        if not batch:
+            return
+        for member in batch:
+            yield member
+
 class MigrationTracker:
     """Tracks migration progress and enables resume capability"""
     
@@ -86,10 +209,9 @@ class MigrationTracker:
         """Load checkpoint from file if exists"""
         if Path(self.checkpoint_file).exists():
             try:
-                with open(self.checkpoint_file, 'r') as f:
-                    data = json.load(f)
-                    logger.info(f"Loaded checkpoint: {data.get('processed_count', 0)} users processed")
-                    return data
+                data = load_json_file(self.checkpoint_file)
+                logger.info(f"Loaded checkpoint: {data.get('processed_count', 0)} users processed")
+                return data
             except Exception as e:
                 logger.error(f"Failed to load checkpoint: {e}")
         return {
@@ -104,8 +226,7 @@ class MigrationTracker:
     def save_checkpoint(self):
         """Save current state to checkpoint file"""
         try:
-            with open(self.checkpoint_file, 'w') as f:
-                json.dump(self.state, f, indent=2)
+            write_json_file(self.checkpoint_file, self.state)
             logger.debug("Checkpoint saved")
         except Exception as e:
             logger.error(f"Failed to save checkpoint: {e}")
@@ -154,6 +275,12 @@ class GroupMemberMigration:
         self.tracker = MigrationTracker()
         self.members_data: List[MemberData] = []
     
+    async def flush_checkpoint(self, status: Optional[str] = None):
+        """Write the checkpoint now (optionally setting its status) without blocking the event loop"""
+        if status:
+            self.tracker.state['status'] = status
+        await asyncio.to_thread(self.tracker.save_checkpoint)
+    
     async def fetch_group_members(self) -> List[MemberData]:
         """Fetch all members from the Telegram group"""
         logger.info(f"Fetching members from group {self.group_id}")
@@ -206,32 +333,10 @@ class GroupMemberMigration:
     async def fetch_members_from_file(self, file_path: str) -> List[MemberData]:
         """Load members from a JSON file (for bulk import)"""
         logger.info(f"Loading members from file: {file_path}")
-        members = []
         
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-                
-            for item in data:
-                # Handle different file formats
-                if isinstance(item, dict):
-                    telegram_id = item.get('telegram_id') or item.get('id') or item.get('user_id')
-                    username = item.get('username')
-                    full_name = item.get('full_name') or item.get('name')
-                else:
-                    # Simple list of IDs
-                    telegram_id = int(item)
-                    username = None
-                    full_name = None
-                
-                if telegram_id:
-                    members.append(MemberData(
-                        telegram_id=int(telegram_id),
-                        username=username,
-                        full_name=full_name,
-                        status='member',
-                        join_date=None
-                    ))
+            with open(file_path, 'rb') as f:
+                members = list(iter_members_from_stream(f))
             
             logger.info(f"Loaded {len(members)} members from file")
             return members
@@ -274,14 +379,14 @@ class GroupMemberMigration:
             try:
                 if not self.dry_run:
                     # Add to whitelist in database
-                    success = self.db_client.whitelist_user(
+                    success = await self.db_client.whitelist_user(
                         telegram_id=member.telegram_id,
                         username=member.username
                     )
                     
                     if success:
                         # Log activity
-                        self.db_client.log_activity(
+                        await self.db_client.log_activity(
                             telegram_id=member.telegram_id,
                             action=ActivityAction.USER_WHITELISTED.value,
                             details={
@@ -318,7 +423,7 @@ class GroupMemberMigration:
         
         try:
             # Get current whitelist from database
-            existing_users = self.db_client.get_active_users()
+            existing_users = await self.db_client.get_active_users()
             whitelisted = [u for u in existing_users if u.subscription_status == 'whitelisted']
             
             backup_data = {
@@ -327,8 +432,7 @@ class GroupMemberMigration:
                 'users': [{'telegram_id': u.telegram_id, 'username': u.username} for u in whitelisted]
             }
             
-            with open(backup_file, 'w') as f:
-                json.dump(backup_data, f, indent=2)
+            write_json_file(backup_file, backup_data)
             
             logger.info(f"Backup created: {backup_file} ({len(whitelisted)} existing whitelisted users)")
             return backup_file
@@ -337,8 +441,21 @@ class GroupMemberMigration:
             logger.error(f"Failed to create backup: {e}")
             raise
     
-    async def run_migration(self, source: str = 'group', file_path: Optional[str] = None) -> Dict:
-        """Run the complete migration process"""
+    async def run_migration(
+        self,
+        source: str = 'group',
+        file_path: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, int, str, Dict[str, int]], Awaitable[None]]] = None
+    ) -> Dict:
+        """
+        Run the complete migration process
+        
+        Args:
+            source: 'group' to fetch members from the group, 'file' to load them from file_path
+            file_path: JSON file with members when source is 'file'
+            progress_callback: Awaited after each batch with
+                (processed, total, status message, running totals)
+        """
         logger.info("=" * 60)
         logger.info("Starting Migration Process")
         logger.info(f"Mode: {'DRY RUN' if self.dry_run else 'PRODUCTION'}")
@@ -391,6 +508,12 @@ class GroupMemberMigration:
                 # Save checkpoint
                 self.tracker.save_checkpoint()
                 
+                if progress_callback:
+                    await progress_callback(
+                        i + len(batch), len(valid_members),
+                        f"Batch {batch_num}/{total_batches}", total_results
+                    )
+                
                 # Rate limiting between batches
                 await asyncio.sleep(1)
             
@@ -428,16 +551,102 @@ class GroupMemberMigration:
         finally:
             await self.bot.session.close()
     
+    async def run_migration_stream(self, members: AsyncIterable[MemberData]) -> Dict:
+        """
+        Run the migration over members as they arrive
+        
+        Unlike run_migration the member list is never held in memory: each
+        batch is whitelisted as soon as BATCH_SIZE unique members have been
+        read, so a streamed import starts writing before parsing finishes.
+        """
+        logger.info("=" * 60)
+        logger.info("Starting Streaming Migration Process")
+        logger.info(f"Mode: {'DRY RUN' if self.dry_run else 'PRODUCTION'}")
+        logger.info("=" * 60)
+        
+        try:
+            # Phase 1: Create backup
+            backup_file = None
+            if not self.dry_run:
+                backup_file = await self.create_backup()
+            else:
+                logger.info("[DRY RUN] Skipping backup creation")
+            
+            # Phase 2: Deduplicate and process in batches while reading
+            seen_ids: Set[int] = set()
+            duplicates = 0
+            batch: List[MemberData] = []
+            total_results = {'success': 0, 'failed': 0, 'skipped': 0}
+            
+            async def flush():
+                batch_results = await self.whitelist_batch(batch)
+                for key, value in batch_results.items():
+                    total_results[key] += value
+                self.tracker.state['total_count'] = len(seen_ids)
+                self.tracker.save_checkpoint()
+                logger.info(
+                    f"Processed {len(seen_ids)} members | "
+                    f"Success: {total_results['success']} | "
+                    f"Failed: {total_results['failed']} | "
+                    f"Skipped: {total_results['skipped']}"
+                )
+                batch.clear()
+            
+            async for member in members:
+                if member.telegram_id in seen_ids:
+                    duplicates += 1
+                    continue
+                seen_ids.add(member.telegram_id)
+                batch.append(member)
+                if len(batch) == BATCH_SIZE:
+                    await flush()
+                    # Rate limiting between batches
+                    await asyncio.sleep(1)
+            if batch:
+                await flush()
+            
+            if duplicates:
+                logger.warning(f"Found {duplicates} duplicate members")
+            
+            # Phase 3: Final report
+            self.tracker.state['total_count'] = len(seen_ids)
+            self.tracker.state['status'] = 'completed'
+            self.tracker.save_checkpoint()
+            
+            summary = {
+                'status': 'success' if total_results['failed'] == 0 else 'completed_with_errors',
+                'total_members': len(seen_ids),
+                'successfully_whitelisted': total_results['success'],
+                'failed': total_results['failed'],
+                'skipped': total_results['skipped'],
+                'duplicates_found': duplicates,
+                'backup_file': backup_file,
+                'dry_run': self.dry_run
+            }
+            
+            logger.info("Streaming migration complete: " + ", ".join(f"{k}={v}" for k, v in summary.items()))
+            return summary
+            
+        except Exception as e:
+            logger.error(f"Migration failed: {e}")
+            self.tracker.state['status'] = 'failed'
+            self.tracker.state['error'] = str(e)
+            self.tracker.save_checkpoint()
+            raise
+        
+        finally:
+            await self.bot.session.close()
+    
     async def verify_migration(self) -> Dict:
         """Verify migration results"""
         logger.info("Verifying migration...")
         
         try:
             # Get statistics from database
-            stats = self.db_client.get_subscription_stats()
+            stats = await self.db_client.get_subscription_stats()
             
             # Get all whitelisted users
-            all_users = self.db_client.get_active_users()
+            all_users = await self.db_client.get_active_users()
             whitelisted = [u for u in all_users if u.subscription_status == 'whitelisted']
             
             verification = {
@@ -487,10 +696,11 @@ async def main():
     
     # Reset checkpoint if requested
     if args.reset:
-        checkpoint_file = Path(CHECKPOINT_FILE)
-        if checkpoint_file.exists():
-            checkpoint_file.unlink()
+        try:
+            os.unlink(CHECKPOINT_FILE)
             logger.info("Migration checkpoint reset")
+        except FileNotFoundError:
+            pass
     
     # Initialize database client
     db_client = SupabaseClient(url=SUPABASE_URL, key=SUPABASE_SERVICE_KEY)
@@ -521,14 +731,15 @@ async def main():
                 result['verification'] = verification
             
             # Save final report
-            report_file = f"migration_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(report_file, 'w') as f:
-                json.dump(result, f, indent=2)
+            report_file = save_report(result)
             logger.info(f"Migration report saved: {report_file}")
             
     except Exception as e:
         logger.error(f"Migration failed: {e}")
         sys.exit(1)
+    finally:
+        # Flush queued activity records
+        await db_client.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -73,19 +73,19 @@ class MigrationMonitor:
             print(f"Error loading checkpoint: {e}")
             return False
     
-    def get_database_stats(self) -> Dict:
+    async def get_database_stats(self) -> Dict:
         """Get current database statistics"""
         if not self.db_client:
             return {}
         
         try:
-            stats = self.db_client.get_subscription_stats()
+            stats = await self.db_client.get_subscription_stats()
             
             # Get recent activity
             recent_activity = []
-            users = self.db_client.get_whitelisted_users(limit=10)
+            users = await self.db_client.get_whitelisted_users(limit=10)
             for user in users:
-                activity = self.db_client.get_user_activity(
+                activity = await self.db_client.get_user_activity(
                     user.telegram_id, 
                     limit=1, 
                     action_filter='user_whitelisted'
@@ -148,7 +148,7 @@ class MigrationMonitor:
         
         return self.checkpoint_data.get('failed_users', [])[:10]  # Last 10
     
-    def print_dashboard(self):
+    def print_dashboard(self, db_stats: Optional[Dict] = None):
         """Print text-based dashboard"""
         os.system('clear' if os.name == 'posix' else 'cls')
         
@@ -200,7 +200,6 @@ class MigrationMonitor:
         
         # Database stats
         if self.db_client:
-            db_stats = self.get_database_stats()
             if db_stats and 'error' not in db_stats:
                 print(f"\nDatabase Statistics:")
                 print(f"  Total Users: {db_stats.get('total_users', 0)}")
@@ -319,7 +318,8 @@ class MigrationMonitor:
         while True:
             try:
                 self.load_checkpoint()
-                self.print_dashboard()
+                db_stats = await self.get_database_stats()
+                self.print_dashboard(db_stats)
                 await asyncio.sleep(self.refresh_interval)
             except KeyboardInterrupt:
                 print("\nMonitoring stopped.")
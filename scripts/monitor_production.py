@@ -265,26 +265,26 @@ class ProductionMonitor:
             result = {'success': True, 'tables_checked': [], 'stats': {}}
             
             # Test users table
-            users = self.db_client.client.table('users').select('id').limit(1).execute()
+            users = await self.db_client.client.table('users').select('id').limit(1).execute()
             result['tables_checked'].append('users')
             
             # Get user count
-            user_count = self.db_client.client.table('users').select('id', count='exact').execute()
+            user_count = await self.db_client.client.table('users').select('id', count='exact').execute()
             result['stats']['users'] = user_count.count if hasattr(user_count, 'count') else 0
             
             # Test subscriptions table
-            subs = self.db_client.client.table('subscriptions').select('id').limit(1).execute()
+            subs = await self.db_client.client.table('subscriptions').select('id').limit(1).execute()
             result['tables_checked'].append('subscriptions')
             
             # Get active subscription count
-            active_subs = self.db_client.client.table('subscriptions')\
+            active_subs = await self.db_client.client.table('subscriptions')\
                 .select('id', count='exact')\
                 .eq('status', 'active')\
                 .execute()
             result['stats']['active_subs'] = active_subs.count if hasattr(active_subs, 'count') else 0
             
             # Test payments table
-            payments = self.db_client.client.table('payments').select('id').limit(1).execute()
+            payments = await self.db_client.client.table('payments').select('id').limit(1).execute()
             result['tables_checked'].append('payments')
             
             return result
@@ -185,13 +185,13 @@ class MigrationBackup:
         MigrationConfig.ensure_directories()
         self.backup_file = MigrationConfig.BACKUP_DIR / f"{migration_id}_backup.json"
     
-    def create_backup(self) -> Dict:
+    async def create_backup(self) -> Dict:
         """Create comprehensive backup before migration"""
         logger.info("Creating pre-migration backup...")
         
         try:
             # Fetch all current whitelisted users
-            all_users = self.db_client.get_active_users()
+            all_users = await self.db_client.get_active_users()
             whitelisted_users = [
                 {
                     'telegram_id': u.telegram_id,
@@ -203,7 +203,7 @@ class MigrationBackup:
             ]
             
             # Get database statistics
-            stats = self.db_client.get_subscription_stats()
+            stats = await self.db_client.get_subscription_stats()
             
             backup_data = {
                 'migration_id': self.migration_id,
@@ -351,14 +351,14 @@ class ProductionMigration:
                 try:
                     if not self.dry_run:
                         # Whitelist the user
-                        success = self.db_client.whitelist_user(
+                        success = await self.db_client.whitelist_user(
                             telegram_id=user.telegram_id,
                             username=user.username
                         )
                         
                         if success:
                             # Log activity
-                            self.db_client.log_activity(
+                            await self.db_client.log_activity(
                                 telegram_id=user.telegram_id,
                                 action=ActivityAction.USER_WHITELISTED.value,
                                 details={
@@ -421,7 +421,7 @@ class ProductionMigration:
         backup_info = None
         if not self.dry_run:
             try:
-                backup_info = self.backup.create_backup()
+                backup_info = await self.backup.create_backup()
             except Exception as e:
                 logger.error(f"Failed to create backup: {e}")
                 if input("Continue without backup? (yes/no): ").lower() != 'yes':
@@ -527,14 +527,14 @@ class ProductionMigration:
         
         try:
             # Check 1: Database statistics
-            stats = self.db_client.get_subscription_stats()
+            stats = await self.db_client.get_subscription_stats()
             verification_results['checks']['database_stats'] = {
                 'whitelisted_users': stats.get('whitelisted_users', 0),
                 'total_users': stats.get('total_users', 0)
             }
             
             # Check 2: Sample verification
-            whitelisted = self.db_client.get_whitelisted_users(limit=MigrationConfig.VERIFICATION_SAMPLE_SIZE)
+            whitelisted = await self.db_client.get_whitelisted_users(limit=MigrationConfig.VERIFICATION_SAMPLE_SIZE)
             verification_results['checks']['sample_verification'] = {
                 'sample_size': len(whitelisted),
                 'all_whitelisted': all(u.subscription_status == 'whitelisted' for u in whitelisted)
@@ -691,6 +691,9 @@ async def main():
     except Exception as e:
         logger.error(f"Migration failed: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        # Flush queued activity records
+        await db_client.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -130,10 +130,10 @@ class ProductionTestSuite:
         """Clean up test user data from database"""
         try:
             # Delete from all tables
-            self.db_client.client.table('payments').delete().eq('user_id', user_id).execute()
-            self.db_client.client.table('transactions').delete().eq('user_id', user_id).execute()
-            self.db_client.client.table('subscriptions').delete().eq('user_id', user_id).execute()
-            self.db_client.client.table('users').delete().eq('telegram_id', user_id).execute()
+            await self.db_client.client.table('payments').delete().eq('user_id', user_id).execute()
+            await self.db_client.client.table('transactions').delete().eq('user_id', user_id).execute()
+            await self.db_client.client.table('subscriptions').delete().eq('user_id', user_id).execute()
+            await self.db_client.client.table('users').delete().eq('telegram_id', user_id).execute()
             logger.info(f"Cleaned up test user {user_id}")
         except Exception as e:
             logger.error(f"Error cleaning up test user: {e}")
@@ -200,7 +200,7 @@ class ProductionTestSuite:
             test_username = f"test_user_{test_user_id}"
             
             # Test CREATE
-            create_result = self.db_client.client.table('users').insert({
+            create_result = await self.db_client.client.table('users').insert({
                 'telegram_id': test_user_id,
                 'username': test_username,
                 'full_name': 'Test User',
@@ -208,20 +208,20 @@ class ProductionTestSuite:
             }).execute()
             
             # Test READ
-            read_result = self.db_client.client.table('users')\
+            read_result = await self.db_client.client.table('users')\
                 .select('*')\
                 .eq('telegram_id', test_user_id)\
                 .single()\
                 .execute()
             
             # Test UPDATE
-            update_result = self.db_client.client.table('users')\
+            update_result = await self.db_client.client.table('users')\
                 .update({'full_name': 'Updated Test User'})\
                 .eq('telegram_id', test_user_id)\
                 .execute()
             
             # Test DELETE
-            delete_result = self.db_client.client.table('users')\
+            delete_result = await self.db_client.client.table('users')\
                 .delete()\
                 .eq('telegram_id', test_user_id)\
                 .execute()
@@ -271,7 +271,7 @@ class ProductionTestSuite:
                 'full_name': 'Subscription Test User',
                 'created_at': datetime.utcnow().isoformat()
             }
-            self.db_client.client.table('users').insert(user_data).execute()
+            await self.db_client.client.table('users').insert(user_data).execute()
             
             # 2. Create subscription
             subscription_data = {
@@ -283,11 +283,11 @@ class ProductionTestSuite:
                 'auto_renew': False,
                 'created_at': datetime.utcnow().isoformat()
             }
-            sub_result = self.db_client.client.table('subscriptions').insert(subscription_data).execute()
+            sub_result = await self.db_client.client.table('subscriptions').insert(subscription_data).execute()
             subscription_id = sub_result.data[0]['id']
             
             # 3. Check active subscription
-            active_check = self.db_client.client.table('subscriptions')\
+            active_check = await self.db_client.client.table('subscriptions')\
                 .select('*')\
                 .eq('user_id', self.test_user_id)\
                 .eq('status', 'active')\
@@ -295,13 +295,13 @@ class ProductionTestSuite:
             
             # 4. Update subscription (extend)
             new_end_date = (datetime.utcnow() + timedelta(days=30)).isoformat()
-            self.db_client.client.table('subscriptions')\
+            await self.db_client.client.table('subscriptions')\
                 .update({'end_date': new_end_date})\
                 .eq('id', subscription_id)\
                 .execute()
             
             # 5. Cancel subscription
-            self.db_client.client.table('subscriptions')\
+            await self.db_client.client.table('subscriptions')\
                 .update({'status': 'cancelled', 'auto_renew': False})\
                 .eq('id', subscription_id)\
                 .execute()
@@ -355,7 +355,7 @@ class ProductionTestSuite:
             test_user_id = self._generate_test_user_id()
             
             # 1. Create user
-            self.db_client.client.table('users').insert({
+            await self.db_client.client.table('users').insert({
                 'telegram_id': test_user_id,
                 'username': f'payment_test_{test_user_id}',
                 'full_name': 'Payment Test User',
@@ -372,11 +372,11 @@ class ProductionTestSuite:
                 'plan_name': 'basic',
                 'created_at': datetime.utcnow().isoformat()
             }
-            payment_result = self.db_client.client.table('payments').insert(payment_data).execute()
+            payment_result = await self.db_client.client.table('payments').insert(payment_data).execute()
             payment_id = payment_result.data[0]['id']
             
             # 3. Simulate payment processing
-            self.db_client.client.table('payments')\
+            await self.db_client.client.table('payments')\
                 .update({
                     'status': 'completed',
                     'completed_at': datetime.utcnow().isoformat(),
@@ -386,7 +386,7 @@ class ProductionTestSuite:
                 .execute()
             
             # 4. Create transaction record
-            self.db_client.client.table('transactions').insert({
+            await self.db_client.client.table('transactions').insert({
                 'user_id': test_user_id,
                 'payment_id': payment_id,
                 'amount': 50,
@@ -398,7 +398,7 @@ class ProductionTestSuite:
             }).execute()
             
             # 5. Verify payment completion
-            verify_result = self.db_client.client.table('payments')\
+            verify_result = await self.db_client.client.table('payments')\
                 .select('*')\
                 .eq('id', payment_id)\
                 .single()\
@@ -452,14 +452,14 @@ class ProductionTestSuite:
             operations_tested = []
             
             # 1. Test statistics query
-            stats = self.db_client.client.table('users')\
+            stats = await self.db_client.client.table('users')\
                 .select('*', count='exact')\
                 .execute()
             user_count = stats.count if hasattr(stats, 'count') else 0
             operations_tested.append('statistics_query')
             
             # 2. Test active subscriptions query
-            active_subs = self.db_client.client.table('subscriptions')\
+            active_subs = await self.db_client.client.table('subscriptions')\
                 .select('*', count='exact')\
                 .eq('status', 'active')\
                 .execute()
@@ -468,7 +468,7 @@ class ProductionTestSuite:
             
             # 3. Test revenue calculation (last 30 days)
             thirty_days_ago = (datetime.utcnow() - timedelta(days=30)).isoformat()
-            revenue_result = self.db_client.client.table('payments')\
+            revenue_result = await self.db_client.client.table('payments')\
                 .select('amount')\
                 .eq('status', 'completed')\
                 .gte('created_at', thirty_days_ago)\
@@ -478,7 +478,7 @@ class ProductionTestSuite:
             operations_tested.append('revenue_calculation')
             
             # 4. Test user search
-            search_result = self.db_client.client.table('users')\
+            search_result = await self.db_client.client.table('users')\
                 .select('*')\
                 .limit(5)\
                 .execute()
@@ -517,14 +517,14 @@ class ProductionTestSuite:
             # 1. Test invalid database query recovery
             try:
                 if self.db_client:
-                    result = self.db_client.client.table('non_existent_table').select('*').execute()
+                    result = await self.db_client.client.table('non_existent_table').select('*').execute()
             except Exception as e:
                 errors_handled.append('invalid_table_query')
             
             # 2. Test invalid user ID handling
             try:
                 if self.db_client:
-                    result = self.db_client.client.table('users')\
+                    result = await self.db_client.client.table('users')\
                         .select('*')\
                         .eq('telegram_id', -999999)\
                         .single()\
@@ -537,14 +537,14 @@ class ProductionTestSuite:
                 test_user_id = self._generate_test_user_id()
                 try:
                     # Start transaction-like operations
-                    self.db_client.client.table('users').insert({
+                    await self.db_client.client.table('users').insert({
                         'telegram_id': test_user_id,
                         'username': f'error_test_{test_user_id}',
                         'created_at': datetime.utcnow().isoformat()
                     }).execute()
                     
                     # Simulate error by trying to insert duplicate
-                    self.db_client.client.table('users').insert({
+                    await self.db_client.client.table('users').insert({
                         'telegram_id': test_user_id,  # Duplicate
                         'username': f'error_test_{test_user_id}',
                         'created_at': datetime.utcnow().isoformat()
@@ -599,7 +599,7 @@ class ProductionTestSuite:
                 start = time.time()
                 try:
                     # Simple read operation
-                    result = self.db_client.client.table('users')\
+                    result = await self.db_client.client.table('users')\
                         .select('telegram_id')\
                         .limit(1)\
                         .execute()
@@ -6,6 +6,7 @@ Reads schema.sql and provides instructions for deployment
 
 import os
 import sys
+import asyncio
 import time
 from pathlib import Path
 
@@ -61,21 +62,21 @@ def check_tables_exist(client: Client):
     
     return tables_exist
 
-def setup_admin_user(db_client: SupabaseClient):
+async def setup_admin_user(db_client: SupabaseClient):
     """Set up the admin user as whitelisted"""
     try:
         # Check if admin exists
-        admin = db_client.get_user(ADMIN_TELEGRAM_ID)
+        admin = await db_client.get_user(ADMIN_TELEGRAM_ID)
         
         if admin:
             print(f"  ✅ Admin user exists: {admin.telegram_id} (@{admin.username})")
             if admin.subscription_status != SubscriptionStatus.WHITELISTED.value:
                 # Update to whitelisted
-                db_client.whitelist_user(ADMIN_TELEGRAM_ID)
+                await db_client.whitelist_user(ADMIN_TELEGRAM_ID)
                 print(f"  ✅ Admin user whitelisted")
         else:
             # Create admin user
-            db_client.create_user(
+            await db_client.create_user(
                 telegram_id=ADMIN_TELEGRAM_ID,
                 username="admin",
                 subscription_status=SubscriptionStatus.WHITELISTED.value,
@@ -88,7 +89,7 @@ def setup_admin_user(db_client: SupabaseClient):
         print(f"  ❌ Error setting up admin: {e}")
         return False
 
-def main():
+async def main():
     """Main deployment process"""
     print_header("SUPABASE DATABASE SETUP")
     
@@ -145,7 +146,7 @@ def main():
     # Setup admin user
     print("\n👤 Setting up admin user...")
     db_client = SupabaseClient(SUPABASE_URL, SUPABASE_KEY)
-    if setup_admin_user(db_client):
+    if await setup_admin_user(db_client):
         print("  ✅ Admin setup complete")
     
     # Run verification tests
@@ -155,7 +156,7 @@ def main():
     test_user_id = 123456789
     try:
         # Create test user
-        test_user = db_client.create_user(
+        test_user = await db_client.create_user(
             telegram_id=test_user_id,
             username="test_user",
             subscription_status="active"
@@ -163,19 +164,19 @@ def main():
         print("  ✅ Create user: SUCCESS")
         
         # Read test user
-        user = db_client.get_user(test_user_id)
+        user = await db_client.get_user(test_user_id)
         if user:
             print("  ✅ Read user: SUCCESS")
         
         # Update test user
-        db_client.update_user(
+        await db_client.update_user(
             telegram_id=test_user_id,
             subscription_status="expired"
         )
         print("  ✅ Update user: SUCCESS")
         
         # Log activity
-        db_client.log_activity(
+        await db_client.log_activity(
             telegram_id=test_user_id,
             action="subscription_expired",
             details={"test": True}
@@ -192,7 +193,7 @@ def main():
     # Get statistics
     print("\n📊 Database Statistics:")
     try:
-        stats = db_client.get_subscription_stats()
+        stats = await db_client.get_subscription_stats()
         print(f"  • Total users: {stats.get('total_users', 0)}")
         print(f"  • Active subscriptions: {stats.get('active_count', 0)}")
         print(f"  • Whitelisted users: {stats.get('whitelisted_count', 0)}")
@@ -200,6 +201,9 @@ def main():
     except Exception as e:
         print(f"  ❌ Could not get statistics: {e}")
     
+    # Flush queued activity records
+    await db_client.close()
+    
     # Success summary
     print_header("✅ DATABASE SETUP COMPLETE")
     print("\n🎉 Your database is ready!")
@@ -219,4 +223,4 @@ def main():
     print("=" * 70 + "\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
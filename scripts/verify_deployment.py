@@ -141,7 +141,7 @@ class DeploymentVerifier:
             db_client = SupabaseClient(self.supabase_url, self.supabase_key)
             
             # Test basic query
-            result = db_client.client.table('users').select('telegram_id').limit(1).execute()
+            result = await db_client.client.table('users').select('telegram_id').limit(1).execute()
             print(f"   ✅ Database connected: Supabase")
             self.checks_passed.append("Database connection successful")
             
@@ -149,7 +149,7 @@ class DeploymentVerifier:
             tables_to_check = ['users', 'subscriptions', 'payments', 'transactions']
             for table in tables_to_check:
                 try:
-                    db_client.client.table(table).select('id').limit(1).execute()
+                    await db_client.client.table(table).select('id').limit(1).execute()
                     print(f"   ✅ Table '{table}' accessible")
                     self.checks_passed.append(f"Table {table} exists")
                 except Exception as e:
@@ -70,13 +70,13 @@ class MigrationVerifier:
         logger.info(f"Loaded {len(expected_ids)} expected user IDs from {source}")
         return expected_ids
     
-    def get_database_users(self) -> Tuple[Set[int], Dict[int, Dict]]:
+    async def get_database_users(self) -> Tuple[Set[int], Dict[int, Dict]]:
         """Get all whitelisted users from database"""
         whitelisted_ids = set()
         user_details = {}
         
         try:
-            users = self.db_client.get_whitelisted_users()
+            users = await self.db_client.get_whitelisted_users()
             
             for user in users:
                 whitelisted_ids.add(user.telegram_id)
@@ -117,10 +117,10 @@ class MigrationVerifier:
             'accuracy_percentage': (len(correctly_migrated) / len(expected_ids) * 100) if expected_ids else 0
         }
     
-    def verify_data_integrity(self, sample_size: int = 100) -> Dict:
+    async def verify_data_integrity(self, sample_size: int = 100) -> Dict:
         """Verify data integrity for a sample of users"""
         try:
-            users = self.db_client.get_whitelisted_users(limit=sample_size)
+            users = await self.db_client.get_whitelisted_users(limit=sample_size)
             
             integrity_checks = {
                 'sample_size': len(users),
@@ -169,14 +169,14 @@ class MigrationVerifier:
             logger.error(f"Data integrity check failed: {e}")
             return {'error': str(e), 'passed': False}
     
-    def check_activity_logs(self, migration_id: Optional[str] = None, hours: int = 24) -> Dict:
+    async def check_activity_logs(self, migration_id: Optional[str] = None, hours: int = 24) -> Dict:
         """Check activity logs for migration events"""
         try:
             since = datetime.now() - timedelta(hours=hours)
             
             # This would need to be implemented in the SupabaseClient
             # For now, we'll do a basic check
-            stats = self.db_client.get_subscription_stats()
+            stats = await self.db_client.get_subscription_stats()
             
             return {
                 'checked': True,
@@ -189,7 +189,7 @@ class MigrationVerifier:
             logger.error(f"Activity log check failed: {e}")
             return {'error': str(e), 'checked': False}
     
-    def verify_database_consistency(self) -> Dict:
+    async def verify_database_consistency(self) -> Dict:
         """Check database consistency and constraints"""
         consistency_checks = {
             'no_duplicates': True,
@@ -199,10 +199,10 @@ class MigrationVerifier:
         
         try:
             # Get statistics
-            stats = self.db_client.get_subscription_stats()
+            stats = await self.db_client.get_subscription_stats()
             
             # Get actual count
-            all_users = self.db_client.get_whitelisted_users()
+            all_users = await self.db_client.get_whitelisted_users()
             actual_count = len(all_users)
             
             # Check if stats match reality
@@ -236,7 +236,7 @@ class MigrationVerifier:
             logger.error(f"Consistency check failed: {e}")
             return {'error': str(e), 'passed': False}
     
-    def fix_discrepancies(self, missing_users: List[int], dry_run: bool = True) -> Dict:
+    async def fix_discrepancies(self, missing_users: List[int], dry_run: bool = True) -> Dict:
         """Attempt to fix identified discrepancies"""
         fix_results = {
             'attempted': len(missing_users),
@@ -250,7 +250,7 @@ class MigrationVerifier:
         for telegram_id in missing_users:
             try:
                 if not dry_run:
-                    success = self.db_client.whitelist_user(telegram_id)
+                    success = await self.db_client.whitelist_user(telegram_id)
                     if success:
                         fix_results['successful'] += 1
                         fix_results['fixed_users'].append(telegram_id)
@@ -270,10 +270,10 @@ class MigrationVerifier:
         
         return fix_results
     
-    def generate_reconciliation_report(self, 
-                                      expected_ids: Set[int],
-                                      database_ids: Set[int],
-                                      user_details: Dict[int, Dict]) -> str:
+    async def generate_reconciliation_report(self, 
+                                            expected_ids: Set[int],
+                                            database_ids: Set[int],
+                                            user_details: Dict[int, Dict]) -> str:
         """Generate comprehensive reconciliation report"""
         report_lines = []
         report_lines.append("=" * 80)
@@ -325,7 +325,7 @@ class MigrationVerifier:
             report_lines.append("")
         
         # Data integrity
-        integrity = self.verify_data_integrity()
+        integrity = await self.verify_data_integrity()
         report_lines.append("DATA INTEGRITY CHECK")
         report_lines.append("-" * 40)
         report_lines.append(f"Sample size: {integrity.get('sample_size', 0)}")
@@ -340,7 +340,7 @@ class MigrationVerifier:
         report_lines.append("")
         
         # Database consistency
-        consistency = self.verify_database_consistency()
+        consistency = await self.verify_database_consistency()
         report_lines.append("DATABASE CONSISTENCY")
         report_lines.append("-" * 40)
         report_lines.append(f"No duplicates: {'✅' if consistency.get('no_duplicates') else '❌'}")
@@ -386,17 +386,17 @@ class MigrationVerifier:
         expected_ids = self.load_expected_users(source)
         
         # Get database users
-        database_ids, user_details = self.get_database_users()
+        database_ids, user_details = await self.get_database_users()
         
         # Run all checks
         self.verification_results['checks']['counts'] = self.verify_basic_counts(expected_ids, database_ids)
         self.verification_results['checks']['discrepancies'] = self.find_discrepancies(expected_ids, database_ids)
-        self.verification_results['checks']['integrity'] = self.verify_data_integrity()
-        self.verification_results['checks']['consistency'] = self.verify_database_consistency()
-        self.verification_results['checks']['activity'] = self.check_activity_logs()
+        self.verification_results['checks']['integrity'] = await self.verify_data_integrity()
+        self.verification_results['checks']['consistency'] = await self.verify_database_consistency()
+        self.verification_results['checks']['activity'] = await self.check_activity_logs()
         
         # Generate report
-        report = self.generate_reconciliation_report(expected_ids, database_ids, user_details)
+        report = await self.generate_reconciliation_report(expected_ids, database_ids, user_details)
         self.verification_results['report'] = report
         
         # Print report
@@ -410,7 +410,7 @@ class MigrationVerifier:
                 print("ATTEMPTING FIXES")
                 print("=" * 80)
                 
-                fix_results = self.fix_discrepancies(missing_users, dry_run=dry_run)
+                fix_results = await self.fix_discrepancies(missing_users, dry_run=dry_run)
                 self.verification_results['fixes'] = fix_results
                 
                 print(f"Fixed {fix_results['successful']} out of {fix_results['attempted']} missing users")
@@ -0,0 +1,157 @@
+"""
+Broadcast Queue - Redis-backed fan-out for admin broadcasts
+"""
+
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramForbiddenError
+
+logger = logging.getLogger(__name__)
+
+# Redis keys: one shared work list of "<broadcast_id>:<user_id>" entries, plus
+# per-broadcast text, counters and a dead-letter list of failed user IDs
+QUEUE_KEY = "bot:bcast:queue"
+TEXT_KEY = "bot:bcast:{}:text"
+TOTAL_KEY = "bot:bcast:{}:total"
+SENT_KEY = "bot:bcast:{}:sent"
+FAILED_KEY = "bot:bcast:{}:failed"
+DEAD_KEY = "bot:bcast:{}:dead"
+
+# Broadcast bookkeeping is dropped a week after the broadcast starts
+BROADCAST_KEY_TTL = 7 * 24 * 3600
+# User IDs pushed per RPUSH when enqueueing
+ENQUEUE_BATCH_SIZE = 1000
+# Seconds a worker blocks on BRPOP before checking whether it should stop
+POP_TIMEOUT = 1
+
+SendFunc = Callable[[int, str], Awaitable[None]]
+
+class BroadcastQueue:
+    """
+    Persistent broadcast queue drained by a pool of worker tasks
+
+    Recipients live in Redis, so a restart only loses the sends that were
+    in flight, and several bot processes can drain the same queue.
+    """
+
+    def __init__(self, redis, send: SendFunc, workers: int = 25):
+        """
+        Args:
+            redis: redis.asyncio client created with decode_responses=True
+            send: Coroutine that delivers one message (and applies rate limiting)
+            workers: Number of concurrent worker tasks
+        """
+        self.redis = redis
+        self.send = send
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._texts: Dict[str, Optional[str]] = {}
+        self.is_running = False
+
+    async def start(self):
+        """Start the worker tasks"""
+        if self.is_running:
+            logger.warning("Broadcast workers already running")
+            return
+
+        self.is_running = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Broadcast queue started with {self.workers} workers")
+
+    async def stop(self):
+        """Stop the worker tasks; undelivered entries stay queued in Redis"""
+        self.is_running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Broadcast queue stopped")
+
+    async def enqueue(self, text: str, user_ids: Iterable[int]) -> Tuple[str, int]:
+        """
+        Queue a broadcast for delivery
+
+        Returns:
+            Tuple of (broadcast_id, recipient_count)
+        """
+        broadcast_id = uuid.uuid4().hex[:12]
+        await self.redis.set(TEXT_KEY.format(broadcast_id), text, ex=BROADCAST_KEY_TTL)
+
+        total = 0
+        batch = []
+        for user_id in user_ids:
+            batch.append(f"{broadcast_id}:{user_id}")
+            if len(batch) == ENQUEUE_BATCH_SIZE:
+                await self.redis.lpush(QUEUE_KEY, *batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            await self.redis.lpush(QUEUE_KEY, *batch)
+            total += len(batch)
+
+        await self.redis.set(TOTAL_KEY.format(broadcast_id), total, ex=BROADCAST_KEY_TTL)
+        logger.info(f"Broadcast {broadcast_id} queued for {total} users")
+        return broadcast_id, total
+
+    async def progress(self, broadcast_id: str) -> Tuple[int, int, int]:
+        """
+        Read a broadcast's counters
+
+        Returns:
+            Tuple of (sent, failed, total)
+        """
+        sent, failed, total = await self.redis.mget(
+            SENT_KEY.format(broadcast_id),
+            FAILED_KEY.format(broadcast_id),
+            TOTAL_KEY.format(broadcast_id)
+        )
+        return int(sent or 0), int(failed or 0), int(total or 0)
+
+    async def _get_text(self, broadcast_id: str) -> Optional[str]:
+        """Get a broadcast's text, read from Redis once per process"""
+        if broadcast_id not in self._texts:
+            self._texts[broadcast_id] = await self.redis.get(TEXT_KEY.format(broadcast_id))
+        return self._texts[broadcast_id]
+
+    async def _record(self, broadcast_id: str, key: str):
+        """Bump a broadcast counter"""
+        name = key.format(broadcast_id)
+        await self.redis.incr(name)
+        await self.redis.expire(name, BROADCAST_KEY_TTL)
+
+    async def _worker(self):
+        """Pop queued sends and deliver them until stopped"""
+        while self.is_running:
+            try:
+                item = await self.redis.brpop(QUEUE_KEY, timeout=POP_TIMEOUT)
+                if item is None:
+                    continue
+
+                broadcast_id, user_id = item[1].split(":", 1)
+                user_id = int(user_id)
+                text = await self._get_text(broadcast_id)
+                if text is None:
+                    # Broadcast expired or was never stored
+                    continue
+
+                try:
+                    await self.send(user_id, text)
+                    await self._record(broadcast_id, SENT_KEY)
+                except TelegramForbiddenError:
+                    # User blocked bot; no point retrying
+                    logger.info(f"User {user_id} has blocked the bot")
+                    await self._record(broadcast_id, FAILED_KEY)
+                except Exception as e:
+                    logger.error(f"Failed to send to {user_id}: {e}")
+                    await self._record(broadcast_id, FAILED_KEY)
+                    await self.redis.rpush(DEAD_KEY.format(broadcast_id), user_id)
+                    await self.redis.expire(DEAD_KEY.format(broadcast_id), BROADCAST_KEY_TTL)
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in broadcast worker: {e}")
+                await asyncio.sleep(POP_TIMEOUT)
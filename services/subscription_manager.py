@@ -79,12 +79,17 @@ class SubscriptionManager:
         """Run all daily automation tasks"""
         logger.info("Running daily subscription tasks...")
         
+        # Fetch both expiry sets in one round-trip
+        expired_users, expiring_users = await self.db.get_subscriptions_by_expiry(
+            max(self.reminder_days)
+        )
+        
         # 1. Process expired subscriptions
-        expired_count = await self.process_expired_subscriptions()
+        expired_count = await self.process_expired_subscriptions(expired_users)
         logger.info(f"Processed {expired_count} expired subscriptions")
         
         # 2. Send payment reminders
-        reminder_count = await self.send_payment_reminders()
+        reminder_count = await self.send_payment_reminders(expiring_users)
         logger.info(f"Sent {reminder_count} payment reminders")
         
         # 3. Clean up stale data
@@ -93,22 +98,23 @@ class SubscriptionManager:
         # 4. Log daily statistics
         await self.log_daily_stats()
         
-    async def process_expired_subscriptions(self) -> int:
-        """Remove users with expired subscriptions from the group"""
+    async def process_expired_subscriptions(self, expired_users: Optional[List] = None) -> int:
+        """Remove users with expired subscriptions from the group (fetched if not given)"""
         try:
             # Get expired subscriptions
-            expired_users = self.db.get_expired_subscriptions()
+            if expired_users is None:
+                expired_users = await self.db.get_expired_subscriptions()
             processed = 0
             
             for user_data in expired_users:
                 try:
-                    telegram_id = user_data['telegram_id']
+                    telegram_id = user_data.telegram_id
                     
                     # Try to remove from group
                     await self.remove_from_group(telegram_id)
                     
                     # Update subscription status
-                    self.db.update_user(
+                    await self.db.update_user(
                         telegram_id=telegram_id,
                         subscription_status=SubscriptionStatus.EXPIRED.value
                     )
@@ -117,7 +123,7 @@ class SubscriptionManager:
                     await self.send_expiry_notification(telegram_id)
                     
                     # Log activity
-                    self.db.log_activity(
+                    await self.db.log_activity(
                         telegram_id=telegram_id,
                         action=ActivityAction.SUBSCRIPTION_EXPIRED.value,
                         details={"reason": "automatic_expiry"}
@@ -126,7 +132,7 @@ class SubscriptionManager:
                     processed += 1
                     
                 except Exception as e:
-                    logger.error(f"Error processing expired subscription for {user_data.get('telegram_id')}: {e}")
+                    logger.error(f"Error processing expired subscription for {user_data.telegram_id}: {e}")
                     
             return processed
             
@@ -134,38 +140,58 @@ class SubscriptionManager:
             logger.error(f"Error getting expired subscriptions: {e}")
             return 0
             
-    async def send_payment_reminders(self) -> int:
-        """Send payment reminders to users whose subscriptions are expiring soon"""
+    async def send_payment_reminders(self, expiring_users: Optional[List] = None) -> int:
+        """
+        Send payment reminders to users whose subscriptions are expiring soon
+        
+        expiring_users, if given, must cover the largest reminder window;
+        each window is then filtered locally instead of queried.
+        
+        Windows overlap (a user 1 day out is also within 3 days), so they are
+        walked from the most urgent up and each user is reminded at most once
+        per run. The activity log can't be relied on for that: log_activity
+        only queues the row, and reads may go to a lagging replica.
+        """
         sent = 0
+        reminded = set()
         
-        for days in self.reminder_days:
+        for days in sorted(self.reminder_days):
             try:
                 # Get users expiring in N days
-                expiring_users = self.db.get_expiring_subscriptions(days)
+                if expiring_users is None:
+                    window_users = await self.db.get_expiring_subscriptions(days)
+                else:
+                    window_users = [
+                        user for user in expiring_users
+                        if user.days_left is not None and user.days_left <= days
+                    ]
                 
-                for user_data in expiring_users:
+                for user_data in window_users:
                     try:
-                        telegram_id = user_data['telegram_id']
+                        telegram_id = user_data.telegram_id
+                        if telegram_id in reminded:
+                            continue
+                        reminded.add(telegram_id)
                         
                         # Check if we already sent a reminder today
-                        recent_activities = self.db.get_user_activities(
+                        recent_reminders = await self.db.get_user_activity(
                             telegram_id=telegram_id,
-                            limit=10
+                            limit=1,
+                            action_filter=ActivityAction.REMINDER_SENT.value
                         )
                         
-                        # Skip if reminder already sent today
+                        # Skip if reminder already sent today (timestamps come back as ISO strings)
                         today = datetime.utcnow().date()
                         reminder_sent_today = any(
-                            activity['action'] == ActivityAction.REMINDER_SENT.value and
-                            activity['timestamp'].date() == today
-                            for activity in recent_activities
+                            datetime.fromisoformat(activity['timestamp']).date() == today
+                            for activity in recent_reminders
                         )
                         
                         if not reminder_sent_today:
                             await self.send_payment_reminder(telegram_id, days)
                             
                             # Log activity
-                            self.db.log_activity(
+                            await self.db.log_activity(
                                 telegram_id=telegram_id,
                                 action=ActivityAction.REMINDER_SENT.value,
                                 details={"days_until_expiry": days}
@@ -174,7 +200,7 @@ class SubscriptionManager:
                             sent += 1
                             
                     except Exception as e:
-                        logger.error(f"Error sending reminder to {user_data.get('telegram_id')}: {e}")
+                        logger.error(f"Error sending reminder to {user_data.telegram_id}: {e}")
                         
             except Exception as e:
                 logger.error(f"Error getting expiring subscriptions for {days} days: {e}")
@@ -280,7 +306,7 @@ class SubscriptionManager:
     async def log_daily_stats(self):
         """Log daily subscription statistics"""
         try:
-            stats = self.db.get_subscription_stats()
+            stats = await self.db.get_subscription_stats()
             
             logger.info(
                 f"Daily Stats - "
@@ -310,7 +336,7 @@ class SubscriptionManager:
     async def extend_subscription(self, telegram_id: int, days: int = 30) -> bool:
         """Manually extend a user's subscription"""
         try:
-            user = self.db.get_user(telegram_id)
+            user = await self.db.get_user(telegram_id)
             if not user:
                 return False
                 
@@ -321,14 +347,14 @@ class SubscriptionManager:
                 new_date = datetime.utcnow().date() + timedelta(days=days)
                 
             # Update subscription
-            self.db.update_user(
+            await self.db.update_user(
                 telegram_id=telegram_id,
                 subscription_status=SubscriptionStatus.ACTIVE.value,
                 next_payment_date=new_date
             )
             
             # Log activity
-            self.db.log_activity(
+            await self.db.log_activity(
                 telegram_id=telegram_id,
                 action=ActivityAction.SUBSCRIPTION_EXTENDED.value,
                 details={"days": days, "new_expiry": new_date.isoformat()}
@@ -179,13 +179,14 @@ class AirwallexWebhookHandler:
                 # Notify user via bot
                 try:
                     # Import here to avoid circular dependency
-                    from handlers.payments import add_user_to_group, user_subscriptions
+                    from handlers.payments import add_user_to_group
+                    from handlers.commands import save_subscription
                     
                     # Add user to group
                     await add_user_to_group(self.bot, telegram_id)
                     
                     # Save subscription
-                    user_subscriptions[telegram_id] = {
+                    save_subscription(telegram_id, {
                         "plan": subscription['plan_name'],
                         "expires_at": subscription['expires_at'],
                         "transaction_id": payment_intent.get("id"),
@@ -193,7 +194,7 @@ class AirwallexWebhookHandler:
                         "amount": amount,
                         "currency": currency,
                         "purchased_at": datetime.now()
-                    }
+                    })
                     
                     # Send confirmation message
                     confirmation_text = f"""
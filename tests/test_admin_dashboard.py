@@ -0,0 +1,143 @@
+"""
+Tests for admin dashboard authentication and the streamed CSV export
+
+Usage:
+    python -m pytest tests/test_admin_dashboard.py
+"""
+
+import asyncio
+import csv
+import io
+import os
+import sys
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import admin_dashboard
+from admin_dashboard import AUTH_COOKIE_NAME, AdminDashboard
+
+
+class FakeDb:
+    """Stands in for SupabaseClient, serving users as raw export tuples"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.chunk_sizes = []
+
+    async def iter_all_users_raw(self, chunk_size=1000):
+        self.chunk_sizes.append(chunk_size)
+        for row in self.rows:
+            yield row
+
+
+def auth_cookie(expires_at):
+    expires_at = str(int(expires_at))
+    return f"{expires_at}.{AdminDashboard._sign(expires_at)}"
+
+
+def with_client(dashboard, scenario):
+    """Run scenario(client) against the dashboard app on a test server"""
+    async def run():
+        async with TestClient(TestServer(dashboard.app)) as client:
+            return await scenario(client)
+    return asyncio.run(run())
+
+
+async def fetch(client, method, path, cookie=None, **kwargs):
+    """Send one request without following redirects; returns (status, headers, cookies, body)"""
+    headers = {'Cookie': f"{AUTH_COOKIE_NAME}={cookie}"} if cookie else {}
+    resp = await client.request(method, path, headers=headers, allow_redirects=False, **kwargs)
+    return resp.status, resp.headers, resp.cookies, await resp.read()
+
+
+def test_check_auth_accepts_only_unexpired_signed_cookies():
+    class FakeRequest:
+        def __init__(self, cookie):
+            self.cookies = {AUTH_COOKIE_NAME: cookie} if cookie is not None else {}
+
+    dashboard = AdminDashboard(FakeDb())
+    valid = auth_cookie(time.time() + 60)
+    expires_at, _, signature = valid.partition('.')
+
+    assert dashboard.check_auth(FakeRequest(valid))
+    assert not dashboard.check_auth(FakeRequest(None))
+    assert not dashboard.check_auth(FakeRequest(auth_cookie(time.time() - 1)))
+    assert not dashboard.check_auth(FakeRequest(f"{expires_at}.{'0' * len(signature)}"))
+    # Pushing the expiry out invalidates the signature
+    assert not dashboard.check_auth(FakeRequest(f"{int(expires_at) + 3600}.{signature}"))
+    assert not dashboard.check_auth(FakeRequest("not-a-cookie"))
+
+
+def test_auth_middleware_redirects_unauthenticated_requests():
+    async def scenario(client):
+        status, headers, _, _ = await fetch(client, 'GET', '/export')
+        assert status == 303
+        assert headers['Location'] == '/login'
+
+        status, _, _, _ = await fetch(client, 'GET', '/export', cookie=auth_cookie(time.time() - 1))
+        assert status == 303
+
+        status, _, _, _ = await fetch(client, 'GET', '/export', cookie=auth_cookie(time.time() + 60))
+        assert status == 200
+
+        # Public paths never require a cookie
+        status, _, _, _ = await fetch(client, 'GET', '/login')
+        assert status == 200
+
+    with_client(AdminDashboard(FakeDb()), scenario)
+
+
+def test_login_sets_secure_signed_cookie():
+    async def scenario(client):
+        status, _, cookies, _ = await fetch(client, 'POST', '/login', data={'password': 'wrong'})
+        assert status == 200
+        assert AUTH_COOKIE_NAME not in cookies
+
+        status, headers, cookies, _ = await fetch(
+            client, 'POST', '/login', data={'password': admin_dashboard.ADMIN_PASSWORD}
+        )
+        assert status == 303
+        assert headers['Location'] == '/dashboard'
+        morsel = cookies[AUTH_COOKIE_NAME]
+        assert morsel['secure']
+        assert morsel['httponly']
+
+        status, _, _, _ = await fetch(client, 'GET', '/export', cookie=morsel.value)
+        assert status == 200
+
+    with_client(AdminDashboard(FakeDb()), scenario)
+
+
+def test_export_streams_every_row_as_csv(monkeypatch):
+    monkeypatch.setattr(admin_dashboard, 'CSV_CHUNK_SIZE', 2)
+    rows = [
+        (1, 'alice', 'active', 'stars', '2099-01-31', '2024-01-01T00:00:00+00:00'),
+        (2, 'bob, jr', 'whitelisted', 'whitelisted', None, '2024-01-02T00:00:00+00:00'),
+        (3, None, 'expired', 'card', '2024-02-01', '2024-01-03T00:00:00+00:00'),
+    ]
+    db = FakeDb(rows)
+
+    async def scenario(client):
+        return await fetch(client, 'GET', '/export', cookie=auth_cookie(time.time() + 60))
+
+    status, headers, _, body = with_client(AdminDashboard(db), scenario)
+
+    assert status == 200
+    assert headers['Content-Type'].startswith('text/csv')
+    assert db.chunk_sizes == [2]
+    parsed = list(csv.reader(io.StringIO(body.decode('utf-8'))))
+    assert parsed[0] == admin_dashboard.CSV_HEADER.decode().strip().split(',')
+    assert parsed[1:] == [['' if v is None else str(v) for v in row] for row in rows]
+
+
+def test_export_of_empty_table_is_header_only():
+    async def scenario(client):
+        return await fetch(client, 'GET', '/export', cookie=auth_cookie(time.time() + 60))
+
+    _, _, _, body = with_client(AdminDashboard(FakeDb()), scenario)
+
+    assert body == admin_dashboard.CSV_HEADER
@@ -0,0 +1,125 @@
+"""
+Tests for the in-memory subscription state in handlers.commands
+
+Usage:
+    python -m pytest tests/test_commands.py
+"""
+
+import asyncio
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.supabase_client import User
+from handlers import commands
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """Start every test with empty subscription state"""
+    def clear():
+        commands.user_subscriptions.clear()
+        commands.whitelisted_users.clear()
+        commands.plans_index.clear()
+        commands.expiry_index.clear()
+        commands.bot_stats["total_revenue"] = 0
+    clear()
+    yield
+    clear()
+
+
+class FakeClient:
+    """Stands in for SupabaseClient, serving rows shaped like PostgREST's"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def get_active_users(self):
+        return [User(**row) for row in self.rows]
+
+
+def test_load_persisted_state_parses_postgrest_rows():
+    rows = [
+        {
+            'telegram_id': 1,
+            'username': 'alice',
+            'subscription_status': 'active',
+            'payment_method': 'stars',
+            'next_payment_date': '2099-01-31',
+            'stars_transaction_id': 'tx_1',
+            'created_at': '2024-01-01T00:00:00+00:00'
+        },
+        {
+            'telegram_id': 2,
+            'username': 'bob',
+            'subscription_status': 'whitelisted',
+            'payment_method': 'whitelisted',
+            'next_payment_date': None
+        }
+    ]
+
+    whitelisted, subscribed = asyncio.run(commands.load_persisted_state(FakeClient(rows)))
+
+    assert (whitelisted, subscribed) == (1, 1)
+    assert 2 in commands.whitelisted_users
+    sub = commands.user_subscriptions[1]
+    assert sub.expires_at.date() == date(2099, 1, 31)
+    assert sub.transaction_id == 'tx_1'
+    assert commands.expiry_index == [(sub.expires_ts, 1)]
+
+
+def assert_indexes_consistent():
+    """Every index must describe exactly the subscriptions in user_subscriptions"""
+    subs = commands.user_subscriptions
+    assert commands.expiry_index == sorted((sub.expires_ts, uid) for uid, sub in subs.items())
+    assert commands.bot_stats["total_revenue"] == sum(sub.amount for sub in subs.values())
+    for tier, members in commands.plans_index.items():
+        assert members == {uid for uid, sub in subs.items() if tier in sub.plan}
+
+
+def subscribe(user_id, plan, days, amount):
+    return commands.save_subscription(user_id, {
+        "plan": plan,
+        "expires_at": datetime.now() + timedelta(days=days),
+        "amount": amount
+    })
+
+
+def test_save_subscription_replaces_and_reindexes():
+    subscribe(1, "Basic (7 days)", 7, 50)
+    subscribe(2, "Premium (6 months)", 180, 500)
+    subscribe(1, "Standard (30 days)", 30, 100)
+
+    assert commands.user_subscriptions[1].plan == "Standard (30 days)"
+    assert 1 not in commands.plans_index["Basic"]
+    assert 1 in commands.plans_index["Standard"]
+    assert len(commands.expiry_index) == 2
+    assert_indexes_consistent()
+
+
+def test_drop_subscription_unindexes():
+    subscribe(1, "Basic (7 days)", 7, 50)
+    subscribe(2, "Premium (6 months)", 180, 500)
+
+    commands.drop_subscription(1)
+    commands.drop_subscription(3)  # Unknown users are ignored
+
+    assert 1 not in commands.user_subscriptions
+    assert_indexes_consistent()
+
+
+def test_sweep_expired_subscriptions_drops_only_expired():
+    subscribe(1, "Basic (7 days)", -1, 50)
+    subscribe(2, "Standard (30 days)", -2, 100)
+    subscribe(3, "Premium (6 months)", 180, 500)
+
+    assert commands.sweep_expired_subscriptions() == 2
+    assert set(commands.user_subscriptions) == {3}
+    assert_indexes_consistent()
+
+    assert commands.sweep_expired_subscriptions() == 0
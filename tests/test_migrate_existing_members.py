@@ -0,0 +1,62 @@
+"""
+Tests for parsing member import files
+
+Usage:
+    python -m pytest tests/test_migrate_existing_members.py
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import migrate_existing_members as migrate
+
+
+@pytest.fixture(params=[True, False], ids=['ijson', 'json'])
+def parser(request, monkeypatch):
+    """Run each test with the streaming ijson parser and the json.load fallback"""
+    if request.param:
+        pytest.importorskip('ijson')
+    monkeypatch.setattr(migrate, 'HAS_IJSON', request.param)
+
+
+def parse(entries):
+    stream = io.BytesIO(json.dumps(entries).encode())
+    return [
+        (member.telegram_id, member.username, member.full_name)
+        for member in migrate.iter_members_from_stream(stream)
+    ]
+
+
+def test_full_objects(parser):
+    entries = [
+        {'telegram_id': 1, 'username': 'alice', 'full_name': 'Alice A'},
+        {'telegram_id': 2, 'username': None, 'name': 'Bob'},
+    ]
+    assert parse(entries) == [(1, 'alice', 'Alice A'), (2, None, 'Bob')]
+
+
+def test_simple_objects(parser):
+    entries = [{'id': 1}, {'user_id': '2', 'username': 'bob'}, {'username': 'no_id'}]
+    assert parse(entries) == [(1, None, None), (2, 'bob', None)]
+
+
+def test_bare_ids(parser):
+    assert parse([1, '2', 3]) == [(1, None, None), (2, None, None), (3, None, None)]
+
+
+def test_parse_members_in_thread_yields_every_member(parser):
+    stream = io.BytesIO(json.dumps(list(range(1, 8))).encode())
+
+    async def collect():
+        members = migrate.iter_members_from_stream(stream)
+        return [m.telegram_id async for m in migrate.parse_members_in_thread(members, batch_size=3)]
+
+    assert asyncio.run(collect()) == list(range(1, 8))
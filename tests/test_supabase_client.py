@@ -0,0 +1,245 @@
+"""
+Tests for SupabaseClient caching and fallback paths
+
+The supabase AsyncClient is replaced by an in-memory fake that answers
+each query through a handler, so no network or database is needed.
+
+Usage:
+    python -m pytest tests/test_supabase_client.py
+"""
+
+import asyncio
+import inspect
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import supabase_client
+
+
+class FakeResponse:
+    """Stands in for a postgrest APIResponse"""
+
+    def __init__(self, data=None, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Records builder calls and resolves execute() through the fake's handler"""
+
+    def __init__(self, fake, table=None, rpc=None, params=None):
+        self.fake = fake
+        self.table = table
+        self.rpc = rpc
+        self.params = params
+        self.calls = []
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append((name, args))
+            return self
+        return method
+
+    def called(self, name):
+        """Arguments of every call to a builder method"""
+        return [args for call, args in self.calls if call == name]
+
+    async def execute(self):
+        result = self.fake.handler(self)
+        if inspect.isawaitable(result):
+            result = await result
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeSupabase:
+    """Stands in for supabase.AsyncClient"""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def table(self, name):
+        return FakeQuery(self, table=name)
+
+    def rpc(self, name, params=None):
+        return FakeQuery(self, rpc=name, params=params)
+
+
+def make_client(monkeypatch, handler):
+    """Build a SupabaseClient whose queries are answered by handler"""
+    monkeypatch.setattr(supabase_client, '_get_http_client', lambda url, key: None)
+    monkeypatch.setattr(supabase_client, 'AsyncClientOptions', lambda **kwargs: None)
+    monkeypatch.setattr(
+        supabase_client, 'AsyncClient',
+        lambda url, key, options: FakeSupabase(handler)
+    )
+    return supabase_client.SupabaseClient('https://example.supabase.co', 'service-key')
+
+
+def user_row(telegram_id, **fields):
+    row = {
+        'telegram_id': telegram_id,
+        'username': None,
+        'subscription_status': 'expired',
+        'payment_method': None,
+        'next_payment_date': None
+    }
+    row.update(fields)
+    return row
+
+
+def test_fetch_overlapping_a_write_does_not_cache_stale_row(monkeypatch):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(query):
+            if query.called('update'):
+                return FakeResponse([user_row(1, subscription_status='whitelisted')])
+            # The read saw the row as it was before the update
+            await release.wait()
+            return FakeResponse([user_row(1)])
+
+        db = make_client(monkeypatch, handler)
+        fetch = asyncio.create_task(db.get_users_bulk([1]))
+        await asyncio.sleep(0)
+
+        await db.update_user(1, subscription_status='whitelisted')
+        release.set()
+        await fetch
+
+        assert 1 not in db._user_cache
+
+    asyncio.run(scenario())
+
+
+def rpc_missing(query):
+    """Handler result for an RPC whose function isn't deployed"""
+    return Exception(f"Could not find the function public.{query.rpc}")
+
+
+def test_get_or_create_user_falls_back_to_table_queries(monkeypatch):
+    def handler(query):
+        if query.rpc:
+            return rpc_missing(query)
+        if query.called('insert'):
+            (data,), = query.called('insert')
+            return FakeResponse([user_row(data['telegram_id'], username=data['username'])])
+        return FakeResponse([])  # No existing user
+
+    db = make_client(monkeypatch, handler)
+    user = asyncio.run(db.get_or_create_user(5, 'eve'))
+
+    assert (user.telegram_id, user.username) == (5, 'eve')
+
+
+def test_get_or_create_user_fallback_updates_changed_username(monkeypatch):
+    def handler(query):
+        if query.rpc:
+            return rpc_missing(query)
+        if query.called('update'):
+            (data,), = query.called('update')
+            return FakeResponse([user_row(5, **data)])
+        return FakeResponse([user_row(5, username='old')])
+
+    db = make_client(monkeypatch, handler)
+    user = asyncio.run(db.get_or_create_user(5, 'new'))
+
+    assert user.username == 'new'
+
+
+def test_bulk_whitelist_falls_back_to_table_upserts(monkeypatch):
+    upserts = []
+
+    def handler(query):
+        if query.rpc:
+            return rpc_missing(query)
+        (records,), = query.called('upsert')
+        upserts.append(records)
+        if any(record['telegram_id'] == 3 for record in records):
+            return Exception("upsert failed")
+        return FakeResponse(records)
+
+    db = make_client(monkeypatch, handler)
+    users = [{'telegram_id': i, 'username': f'user{i}'} for i in (1, 2, 3)]
+
+    # Batches of [1, 2] and [3]: the second one's upsert fails too
+    success, failed, failed_ids = asyncio.run(db.bulk_whitelist_users(users, batch_size=2))
+
+    assert (success, failed, failed_ids) == (2, 1, [3])
+    assert all(
+        record['subscription_status'] == 'whitelisted' and record['next_payment_date'] is None
+        for records in upserts for record in records
+    )
+
+
+def test_extend_subscription_days_falls_back_to_read_then_update(monkeypatch):
+    updates = []
+
+    def handler(query):
+        if query.rpc:
+            return rpc_missing(query)
+        if query.called('update'):
+            (data,), = query.called('update')
+            updates.append(data)
+            return FakeResponse([user_row(7, **data)])
+        return FakeResponse([user_row(7, subscription_status='expired', next_payment_date='2099-01-01')])
+
+    db = make_client(monkeypatch, handler)
+    user = asyncio.run(db.extend_subscription_days(7, 30))
+
+    assert updates == [{'subscription_status': 'active', 'next_payment_date': '2099-01-31'}]
+    assert user.next_payment_date.isoformat() == '2099-01-31'
+
+
+def test_get_subscription_stats_falls_back_to_count_queries(monkeypatch):
+    counts = {'active': 4, 'expired': 2, 'whitelisted': 3}
+
+    def handler(query):
+        if query.rpc:
+            return rpc_missing(query)
+        (column, status), = query.called('eq')
+        assert column == 'subscription_status'
+        return FakeResponse([], count=counts[status])
+
+    db = make_client(monkeypatch, handler)
+    stats = asyncio.run(db.get_subscription_stats())
+
+    assert stats == {
+        'total_users': 9,
+        'active_subscriptions': 7,
+        'expired_subscriptions': 2,
+        'whitelisted_users': 3
+    }
+
+
+def test_get_payment_stats_falls_back_to_count_queries(monkeypatch):
+    counts = {None: 5, 'card': 2, 'stars': 3}
+
+    def handler(query):
+        if query.rpc:
+            return rpc_missing(query)
+        methods = [value for column, value in query.called('eq') if column == 'details->>payment_method']
+        return FakeResponse([], count=counts[methods[0] if methods else None])
+
+    db = make_client(monkeypatch, handler)
+    stats = asyncio.run(db.get_payment_stats(days=7))
+
+    assert stats == {'total_payments': 5, 'card_payments': 2, 'stars_payments': 3, 'period_days': 7}
+
+
+def test_writes_clear_cached_subscription_stats(monkeypatch):
+    def handler(query):
+        if query.rpc == 'get_status_counts':
+            return FakeResponse([{'status': 'active', 'cnt': 1}])
+        return FakeResponse([user_row(1, subscription_status='whitelisted')])
+
+    db = make_client(monkeypatch, handler)
+    asyncio.run(db.get_subscription_stats())
+    assert 'subscription' in db._stats_cache
+
+    asyncio.run(db.update_user(1, subscription_status='whitelisted'))
+    assert 'subscription' not in db._stats_cache